@@ -0,0 +1,63 @@
+"""Compare the speed of the background removal engines.
+
+Makes a fake phone photo of a drawing (grey, unevenly lit paper with a
+few shapes on it) at a few sizes and reports megapixels per second for
+every engine. Run it from the project root:
+
+    PYTHONPATH=src python benchmarks/bench_background.py
+"""
+
+import argparse
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from spellbound_sketches.background import ENGINES, resolve_engine_name
+
+
+def make_photo(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """A fake photo of a drawing as an RGBA array."""
+    rng = np.random.default_rng(seed)
+    xx = np.linspace(0, 1, width)[None, :, None]
+    yy = np.linspace(0, 1, height)[:, None, None]
+    paper = 170 + 50 * xx + 20 * yy + rng.normal(0, 3, (height, width, 3))
+    img = Image.fromarray(np.clip(paper, 0, 255).astype(np.uint8)).convert("RGBA")
+    draw = ImageDraw.Draw(img)
+    s = min(width, height)
+    draw.ellipse((width // 4, height // 4, width // 4 + s // 2, height // 4 + s // 2),
+                 outline=(30, 30, 30), width=max(2, s // 100), fill=(250, 230, 120))
+    draw.rectangle((width // 2, height // 2, width // 2 + s // 5, height // 2 + s // 6), fill=(40, 90, 200))
+    return np.asarray(img)
+
+
+def bench(engine: str, pixels: np.ndarray, repeat: int) -> float:
+    """Best time in seconds of `repeat` runs of one engine."""
+    fn = ENGINES[engine]
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(pixels, None)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="640x480,1920x1080,4032x3024", help="Comma separated WxH sizes.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per engine and size (the best is kept).")
+    args = parser.parse_args()
+
+    engines = sorted({resolve_engine_name(name) for name in ENGINES})
+    print(f"{'engine':<8} {'size':>11} {'ms':>9} {'MP/s':>8}")
+    for size in args.sizes.split(","):
+        width, height = (int(v) for v in size.lower().split("x"))
+        pixels = make_photo(width, height)
+        megapixels = width * height / 1e6
+        for engine in engines:
+            seconds = bench(engine, pixels, args.repeat)
+            print(f"{engine:<8} {size:>11} {seconds * 1000:>9.1f} {megapixels / seconds:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
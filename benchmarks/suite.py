@@ -0,0 +1,234 @@
+"""Benchmark the pipeline's hot paths and compare runs.
+
+Times remove_background, export_parts, render_animation_from_plan and
+GIF decoding (playback.FrameDecoder) on synthetic drawings made by
+create_sample_image.make_drawing, for every combination of the given
+image sizes, frame rates, durations and action counts. The output
+encoders (GIF, APNG, WebP, MP4) are timed on the same frames, and their
+file sizes recorded. Results are written as JSON, so a run can be kept
+as a baseline and later runs compared against it. Run it from the
+project root:
+
+    PYTHONPATH=src python benchmarks/suite.py run --out baseline.json
+    PYTHONPATH=src python benchmarks/suite.py run --out current.json
+    PYTHONPATH=src python benchmarks/suite.py compare baseline.json current.json --threshold 0.15
+
+`compare` exits with code 1 when any case got slower (or an encoder's
+file bigger) by more than the threshold (0.15 = 15%), so it can gate
+upgrades in CI.
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # For create_sample_image
+
+import numpy as np
+import PIL
+from create_sample_image import make_drawing
+
+from spellbound_sketches.animator import iter_animation_frames, render_animation_from_plan
+from spellbound_sketches.encoders import ENCODERS, make_writer
+from spellbound_sketches.playback import FrameDecoder
+from spellbound_sketches.preprocess import export_parts, remove_background
+
+SUITE_VERSION = 2
+ENCODER_SUFFIXES = {"gif": ".gif", "apng": ".png", "webp": ".webp", "mp4": ".mp4"}
+ACTION_TYPES = ("translate", "scale", "swap_image")
+
+
+def make_plan(fps: int, duration_ms: int, actions: int, seed: int = 0) -> Dict[str, Any]:
+    """A plan with `actions` actions spread over the animation."""
+    rng = np.random.default_rng(seed)
+    total = max(1, fps * duration_ms // 1000)
+    plan: Dict[str, Any] = {"duration_ms": duration_ms, "fps": fps, "actions": [], "variants": {}}
+    for i in range(actions):
+        start = int(rng.integers(0, total))
+        end = min(total, start + int(rng.integers(1, max(2, total // 2))))
+        kind = ACTION_TYPES[i % len(ACTION_TYPES)]
+        action: Dict[str, Any] = {"name": f"{kind}{i}", "part": "root" if kind != "swap_image" else "head",
+                                  "type": kind, "start_frame": start, "end_frame": end}
+        if kind == "translate":
+            action.update(start_offset=[0, 0], end_offset=[int(rng.integers(-20, 20)), int(rng.integers(-20, 0))],
+                          easing="ease_out")
+        elif kind == "scale":
+            action.update(start_scale=[1.0, 1.0], end_scale=[1.05, 0.9])
+        else:
+            action["variant"] = "missing"  # Exercises the "variant not found" path, like the canned plan
+        plan["actions"].append(action)
+    return plan
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Run `fn` `repeat` times; report the best and median seconds."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return {"best": min(times), "median": statistics.median(times), "runs": len(times)}
+
+
+def decode_all(gif_path: Path) -> int:
+    """Decode every frame of a GIF the way the player does."""
+    count = 0
+    with FrameDecoder(gif_path, loop=False) as decoder:
+        while decoder.get() is not None:
+            count += 1
+    return count
+
+
+def available_encoders() -> List[str]:
+    """Encoders that work here (MP4 needs OpenCV)."""
+    try:
+        import cv2  # noqa: F401
+    except ImportError:
+        return [name for name in ENCODERS if name != "mp4"]
+    return list(ENCODERS)
+
+
+def encode_all(frames: List[Any], path: Path, encoder: str, frame_ms: int) -> int:
+    """Write frames with one encoder; returns the file size in bytes."""
+    with make_writer(path, encoder, loop=0) as writer:
+        writer.write_all(frames, frame_ms)
+    return path.stat().st_size
+
+
+def run_suite(
+    sizes: List[int],
+    fps_values: List[int],
+    durations: List[int],
+    action_counts: List[int],
+    repeat: int = 3,
+    log: Optional[Callable[[str], None]] = print,
+) -> Dict[str, Any]:
+    """Run every benchmark case and return the results (see the module docstring)."""
+    results: Dict[str, Dict[str, Any]] = {}
+
+    def record(name: str, params: Dict[str, Any], fn: Callable[[], Any], output: Optional[Path] = None) -> None:
+        results[name] = {"params": params, **measure(fn, repeat)}
+        size = ""
+        if output is not None:
+            results[name]["bytes"] = output.stat().st_size
+            size = f" {results[name]['bytes'] / 1024:>10.1f} KB"
+        if log:
+            log(f"{name:<56} {results[name]['best'] * 1000:>10.1f} ms{size}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        for size in sizes:
+            drawing = tmp_dir / f"drawing{size}.png"
+            make_drawing(size, extra_shapes=12, seed=size).save(drawing)
+            char = tmp_dir / f"character{size}.png"
+            parts = tmp_dir / f"parts{size}"
+            record(f"remove_background/{size}", {"size": size},
+                   lambda: remove_background(drawing, out_path=char))
+            record(f"export_parts/{size}", {"size": size},
+                   lambda: export_parts(char, parts_dir=parts, atlas=True))
+            for fps, duration, actions in itertools.product(fps_values, durations, action_counts):
+                params = {"size": size, "fps": fps, "duration_ms": duration, "actions": actions}
+                tag = f"{size}/fps{fps}/{duration}ms/{actions}act"
+                plan = make_plan(fps, duration, actions)
+                gif = tmp_dir / f"out-{size}-{fps}-{duration}-{actions}.gif"
+                record(f"render/{tag}", params,
+                       lambda: render_animation_from_plan(plan, char, parts_dir=parts, out_gif=gif))
+                record(f"decode/{tag}", params, lambda: decode_all(gif))
+
+            # Every encoder on the same frames (the first fps/duration/actions combination)
+            fps, duration, actions = fps_values[0], durations[0], action_counts[0]
+            frames = list(iter_animation_frames(make_plan(fps, duration, actions), char, parts_dir=parts))
+            for encoder in available_encoders():
+                out = tmp_dir / f"encode-{size}{ENCODER_SUFFIXES[encoder]}"
+                record(f"encode/{size}/fps{fps}/{duration}ms/{encoder}", {"size": size, "fps": fps,
+                       "duration_ms": duration, "encoder": encoder, "frames": len(frames)},
+                       lambda: encode_all(frames, out, encoder, 1000 // fps), output=out)
+            del frames
+    return {
+        "suite_version": SUITE_VERSION,
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pillow": PIL.__version__,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.15) -> List[Dict[str, Any]]:
+    """Compare two runs case by case (on the best time).
+
+    Returns:
+        One row per case found in both runs, with "name", "baseline",
+        "current", "ratio" (current / baseline), "size_ratio" (the same
+        for file size, encoder cases only) and "regression" (True when it
+        got slower, or its file bigger, by more than `threshold`).
+    """
+    rows = []
+    for name, base in baseline["results"].items():
+        now = current["results"].get(name)
+        if now is None:
+            continue
+        ratio = now["best"] / base["best"] if base["best"] > 0 else float("inf")
+        size_ratio = now["bytes"] / base["bytes"] if base.get("bytes") and now.get("bytes") else None
+        rows.append({"name": name, "baseline": base["best"], "current": now["best"], "ratio": ratio,
+                     "size_ratio": size_ratio,
+                     "regression": ratio > 1 + threshold or (size_ratio is not None and size_ratio > 1 + threshold)})
+    return rows
+
+
+def _int_list(text: str) -> List[int]:
+    return [int(v) for v in text.split(",") if v]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="Run the benchmarks.")
+    run.add_argument("--sizes", type=_int_list, default=[256, 1024, 4096], help="Comma separated image sizes.")
+    run.add_argument("--fps", type=_int_list, default=[12, 24], help="Comma separated frame rates.")
+    run.add_argument("--duration-ms", type=_int_list, default=[1200], help="Comma separated durations.")
+    run.add_argument("--actions", type=_int_list, default=[3, 12], help="Comma separated action counts.")
+    run.add_argument("--repeat", type=int, default=3, help="Runs per case (the best is compared).")
+    run.add_argument("--out", type=Path, help="Write the results to this JSON file.")
+    cmp = sub.add_parser("compare", help="Compare a run against a baseline.")
+    cmp.add_argument("baseline", type=Path)
+    cmp.add_argument("current", type=Path)
+    cmp.add_argument("--threshold", type=float, default=0.15, help="Allowed slow-down (0.15 = 15%%).")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run_suite(args.sizes, args.fps, args.duration_ms, args.actions, repeat=args.repeat)
+        if args.out:
+            args.out.write_text(json.dumps(report, indent=2))
+            print(f"Saved results to {args.out}")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    current = json.loads(args.current.read_text())
+    if baseline.get("suite_version") != current.get("suite_version"):
+        print("Warning: the runs were made with different suite versions")
+    rows = compare(baseline, current, args.threshold)
+    print(f"{'case':<56} {'baseline':>10} {'current':>10} {'change':>8} {'size':>8}")
+    for row in rows:
+        flag = "  SLOWER" if row["regression"] else ""
+        size = f"{(row['size_ratio'] - 1) * 100:>+7.1f}%" if row["size_ratio"] is not None else f"{'':>8}"
+        print(f"{row['name']:<56} {row['baseline'] * 1000:>8.1f}ms {row['current'] * 1000:>8.1f}ms "
+              f"{(row['ratio'] - 1) * 100:>+7.1f}% {size}{flag}")
+    regressions = [row for row in rows if row["regression"]]
+    print(f"{len(rows)} cases compared, {len(regressions)} slower than {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,46 @@
+import random
+
 from PIL import Image, ImageDraw
 
-# Create a white background image
-img = Image.new('RGBA', (256, 256), (255, 255, 255, 255))
-draw = ImageDraw.Draw(img)
-
-# Draw a simple smiling face
-# Head
-draw.ellipse((56, 56, 200, 200), outline=(0, 0, 0), width=4, fill=(255, 255, 200, 255))
-# Eyes
-draw.ellipse((96, 110, 116, 130), fill=(0, 0, 0))
-draw.ellipse((146, 110, 166, 130), fill=(0, 0, 0))
-# Smile
-draw.arc((100, 130, 160, 180), start=20, end=160, fill=(0, 0, 0), width=4)
-
-img.save('sample_data/sample_drawing.png')
-print('sample_drawing.png created!')
+
+def make_drawing(size: int = 256, extra_shapes: int = 0, seed: int = 0) -> Image.Image:
+    """Draw the sample smiling face on white paper.
+
+    Args:
+        size: Width and height in pixels (the face grows with it).
+        extra_shapes: How many random scribbles to add around the face,
+            so bigger test drawings are not just one simple shape.
+        seed: Seed for the random scribbles.
+    """
+    # Create a white background image
+    img = Image.new('RGBA', (size, size), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(img)
+
+    def s(v):
+        return round(v * size / 256)  # Coordinates below are for a 256x256 picture
+
+    # Draw a simple smiling face
+    # Head
+    draw.ellipse((s(56), s(56), s(200), s(200)), outline=(0, 0, 0), width=max(1, s(4)), fill=(255, 255, 200, 255))
+    # Eyes
+    draw.ellipse((s(96), s(110), s(116), s(130)), fill=(0, 0, 0))
+    draw.ellipse((s(146), s(110), s(166), s(130)), fill=(0, 0, 0))
+    # Smile
+    draw.arc((s(100), s(130), s(160), s(180)), start=20, end=160, fill=(0, 0, 0), width=max(1, s(4)))
+
+    # Random scribbles (stars, balloons...) for benchmark drawings
+    rng = random.Random(seed)
+    for _ in range(extra_shapes):
+        x, y = rng.randrange(size), rng.randrange(size)
+        r = rng.randint(max(1, size // 64), max(2, size // 12))
+        color = (rng.randrange(200), rng.randrange(200), rng.randrange(200))
+        if rng.random() < 0.5:
+            draw.ellipse((x - r, y - r, x + r, y + r), outline=(0, 0, 0), width=max(1, s(2)), fill=color)
+        else:
+            draw.line((x - r, y, x + r, y + r), fill=color, width=max(1, s(3)))
+    return img
+
+
+if __name__ == '__main__':
+    make_drawing().save('sample_data/sample_drawing.png')
+    print('sample_drawing.png created!')
@@ -1,9 +1,9 @@
 """Entry point for running the spellbound_sketch package as a module.
 
 This allows you to start the application with:
-    python -m spellbound_sketch
+    python -m spellbound_sketches
 """
 
 if __name__ == "__main__":
-    from cli import app  # Import the main app from cli.py
+    from spellbound_sketches.cli import app  # Import the main app from cli.py
     app()  # Start the app!
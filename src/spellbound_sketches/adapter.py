@@ -1,17 +1,28 @@
 """Adapter module for generating animation plans.
 
 This file acts as a translator between the code and a multimodal AI
-(e.g., ChatGPT-like system that can handle images and text). For now,
-it provides a placeholder API call and a canned (pretend) animation
-plan for testing purposes.
+(e.g., ChatGPT-like system that can handle images and text). When
+SPELLBOUND_API_URL is set, plans are requested from that HTTP endpoint
+(see the providers module); otherwise, or when the provider is
+unhealthy, a canned (pretend) animation plan is used.
 """
 
 import json
 import base64
-from typing import Dict, Any
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+from spellbound_sketches.plan_cache import PlanCache, normalize_onboarding
+from spellbound_sketches.providers import PlanProvider, get_provider
+from spellbound_sketches.tracing import record_error, set_attributes, span, traced
+
+logger = logging.getLogger("spellbound_sketches.adapter")
+
+# Bump this when the prompt text changes, so plans cached for the old prompt are not reused
+PROMPT_VERSION = 1
 
 def call_multimodal_api(image_path: str, prompt: str) -> Dict[str, Any]:
-    """Placeholder for a real multimodal API call.
+    """Ask the configured multimodal API for a plan.
 
     Args:
         image_path: Path to the input drawing.
@@ -21,9 +32,13 @@ def call_multimodal_api(image_path: str, prompt: str) -> Dict[str, Any]:
         A dictionary representing the animation plan.
 
     Raises:
-        RuntimeError: Always, since no real API is implemented yet.
+        RuntimeError: If no API is configured (SPELLBOUND_API_URL), or
+            the request fails (providers.ProviderError).
     """
-    raise RuntimeError("TODO: No real multimodal API configured. Use fallback or implement API call here.")
+    provider = get_provider()
+    if provider is None:
+        raise RuntimeError("No multimodal API configured (set SPELLBOUND_API_URL). Using the fallback plan.")
+    return provider.plan_sync(image_path, prompt)
 
 def canned_plan_for_animation() -> Dict[str, Any]:
     """Return a fake animation plan for testing."""
@@ -66,7 +81,34 @@ def canned_plan_for_animation() -> Dict[str, Any]:
         }
     }
 
-def multimodal_plan_for_animation(image_path: str, onboarding: Dict[str, Any]) -> Dict[str, Any]:
+def build_prompt(onboarding: Dict[str, Any]) -> str:
+    """Build the text prompt sent along with the drawing."""
+    onboarding = normalize_onboarding(onboarding)
+    return f"Given this drawing and onboarding {onboarding}, propose a short animation plan (JSON): actions with part, timing in frames, transforms, and a short sound_text."
+
+def _request_plan(image_path: str, onboarding: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+    """Ask the API for a plan, or fall back to the canned one.
+
+    Returns:
+        (plan, came_from_the_api).
+    """
+    with span("plan.request"):
+        try:
+            res = call_multimodal_api(image_path, build_prompt(onboarding))
+            set_attributes(source="api")
+            return res, True
+        except Exception as e:
+            record_error(e)
+            set_attributes(source="fallback")
+            plan = canned_plan_for_animation()
+            return plan, False
+
+@traced("plan")
+def multimodal_plan_for_animation(
+    image_path: str,
+    onboarding: Dict[str, Any],
+    cache: Optional[PlanCache] = None,
+) -> Dict[str, Any]:
     """Get an animation plan using a multimodal AI or fallback.
 
     Attempts to call the real multimodal API with the given drawing
@@ -76,15 +118,44 @@ def multimodal_plan_for_animation(image_path: str, onboarding: Dict[str, Any]) -
     Args:
         image_path: Path to the input drawing.
         onboarding: Extra onboarding details to include in the prompt.
+        cache: Optional plan cache. Plans from the API are stored by
+            drawing content, (normalized) onboarding and PROMPT_VERSION,
+            and identical requests running at the same time share one
+            API call. Fallback plans are never cached.
 
     Returns:
         A dictionary representing the animation plan.
     """
-    
-    prompt = f"Given this drawing and onboarding {onboarding}, propose a short animation plan (JSON): actions with part, timing in frames, transforms, and a short sound_text."
+    if cache is None:
+        return _request_plan(image_path, onboarding)[0]
+    try:
+        key = cache.key(image_path, onboarding, PROMPT_VERSION)
+    except OSError as e:
+        logger.warning(f"Not caching plan, could not read {image_path}: {e}")
+        return _request_plan(image_path, onboarding)[0]
+    return cache.get_or_create(key, lambda: _request_plan(image_path, onboarding))
+
+async def multimodal_plan_for_animation_async(
+    image_path: str,
+    onboarding: Dict[str, Any],
+    provider: Optional[PlanProvider] = None,
+) -> Dict[str, Any]:
+    """Async version of multimodal_plan_for_animation, for many requests at once.
+
+    Args:
+        image_path: Path to the input drawing.
+        onboarding: Extra onboarding details to include in the prompt.
+        provider: The provider to ask. Defaults to get_provider().
+
+    Returns:
+        The plan from the provider, or the canned plan if there is no
+        provider or it fails.
+    """
+    provider = provider if provider is not None else get_provider()
+    if provider is None:
+        return canned_plan_for_animation()
     try:
-        res = call_multimodal_api(image_path, prompt)
-        return res
-    except Exception:
-        plan = canned_plan_for_animation()
-        return plan
+        return await provider.plan(image_path, build_prompt(onboarding))
+    except Exception as e:
+        logger.warning(f"Plan request failed, using the fallback plan: {e}")
+        return canned_plan_for_animation()
@@ -1,8 +1,15 @@
 """Render animated GIFs from a simple action plan.
 
 This module reads a base character image and an action plan (translate,
-scale, swap_image) and produces a GIF. It also includes small helpers
-for interpolation and easing.
+scale, swap_image) and produces a GIF. Frames are made one at a time by
+iter_animation_frames and written as they arrive, so long animations do
+not have to fit in memory. render_preview makes a quick, small version
+(fewer pixels, colours and frames) for checking a plan before the real
+render. It also includes small helpers for interpolation and easing.
+
+With a framecache.FrameCache, frames that look the same as in an earlier
+render (or earlier in the same one) are reused instead of drawn again,
+so re-rendering an edited plan only costs the frames that changed.
 """
 
 from PIL import Image
@@ -10,10 +17,27 @@ import numpy as np
 from pathlib import Path
 import math
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator
+
+from spellbound_sketches.atlas import has_atlas, load_atlas
+from spellbound_sketches.compositor import NumpyCompositor
+from spellbound_sketches.encoders import GifWriter, encoder_for, make_writer
+from spellbound_sketches.framecache import FrameCache
+from spellbound_sketches.palette import build_palette, load_or_build_palette
+from spellbound_sketches.sprites import SpriteCache
+from spellbound_sketches.timeline import compile_plan, plan_timing
+from spellbound_sketches.tracing import record_error, set_attributes, span, traced
 
 logger = logging.getLogger("spellbound_sketches.animator")
 
+# Ways to put each frame together: "pil" pastes onto a new Pillow canvas
+# per frame, "numpy" blends into one reused NumPy buffer (same pixels)
+BACKENDS = ("pil", "numpy")
+
+# Part names as export_parts writes them, plus older spellings we still accept
+PART_NAMES = ("body", "head", "left_wing", "right_wing")
+PART_ALIASES = {"leftwing": "left_wing", "rightwing": "right_wing"}
+
 def lerp(a: float, b: float, t: float) -> float:
     """Linearly interpolate between two values."""
     return a + (b - a) * t
@@ -22,13 +46,181 @@ def ease_out(t: float) -> float:
     """Ease-out function: start fast, end slow."""
     return 1 - (1 - t) * (1 - t)
 
+def load_parts(parts_dir: str | Path) -> Dict[str, Image.Image]:
+    """Load the part images from a parts folder.
+
+    A part atlas (atlas.json + atlas.png) is read with a single decode.
+    Without one, separate "<part>.png" files are loaded; both the
+    exported names (left_wing) and the old ones (leftwing) are found.
+
+    Returns:
+        Part name (as in PART_NAMES) -> trimmed or cropped RGBA image.
+    """
+    parts_dir = Path(parts_dir)
+    parts: Dict[str, Image.Image] = {}
+    if not parts_dir.is_dir():
+        return parts
+    if has_atlas(parts_dir):
+        atlas = load_atlas(parts_dir)
+        for name in atlas.names():
+            image = atlas.get(name)
+            if image is None:
+                image = atlas.cell_image(name)  # Nothing visible, but the part still exists
+            parts[PART_ALIASES.get(name, name)] = image
+        return parts
+    spellings = {name: [name] for name in PART_NAMES}
+    for old, new in PART_ALIASES.items():
+        spellings[new].append(old)
+    for name, candidates in spellings.items():
+        for candidate in candidates:
+            p = parts_dir / f"{candidate}.png"
+            if p.exists():
+                parts[name] = Image.open(p).convert("RGBA")
+                break
+    return parts
+
+def iter_animation_frames(
+    plan: Dict[str, Any],
+    char_png: str | Path,
+    parts_dir: Optional[str | Path] = None,
+    sprite_cache: Optional[SpriteCache] = None,
+    backend: str = "pil",
+    resolution: float = 1.0,
+    frame_step: int = 1,
+    frame_cache: Optional[FrameCache] = None,
+) -> Iterator[Image.Image]:
+    """Yield the frames of an animation one by one.
+
+    Only the frame being built is kept in memory, so this works for long
+    or high-resolution animations. See render_animation_from_plan for
+    what the plan may contain.
+
+    Args:
+        plan: Dictionary describing timing, actions, and optional variants.
+        char_png: Path to the main character PNG (RGBA recommended).
+        parts_dir: Optional directory containing extra part images or a
+            part atlas (see load_parts).
+        sprite_cache: Optional cache of resized images (see
+            render_animation_from_plan).
+        backend: Compositing engine, one of BACKENDS.
+        resolution: Size of the frames compared to the character image
+            (0.25 = a quarter of the width and height). Images and
+            movements are shrunk once, before the first frame.
+        frame_step: Only every n-th frame of the plan is made (for
+            previews at a lower frame rate).
+        frame_cache: Optional cache of finished frames. Frames found in
+            it are not drawn again; new ones are added to it.
+
+    Yields:
+        One RGBA image per frame. Frames from `frame_cache` are shared,
+        so they must not be changed.
+
+    Raises:
+        ValueError: If the backend is unknown or the plan is malformed.
+        OSError: If the character image can not be read.
+    """
+    char_png = Path(char_png)
+    if parts_dir is not None:
+        parts_dir = Path(parts_dir)
+    if sprite_cache is None:
+        sprite_cache = SpriteCache()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    if not 0 < resolution <= 1:
+        raise ValueError(f"resolution must be between 0 and 1, got {resolution}")
+    frame_step = max(1, int(frame_step))
+
+    def shrink(image: Image.Image) -> Image.Image:
+        if resolution == 1:
+            return image
+        size = (max(1, round(image.width * resolution)), max(1, round(image.height * resolution)))
+        return image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+    # Renders sharing a sprite cache share the decoded character too, and so its resizes
+    base = sprite_cache.load(char_png, lambda p: shrink(Image.open(p).convert("RGBA")), resolution)
+    w, h = base.size
+
+    # Load extra parts if we have them (like head, wings)
+    parts = load_parts(parts_dir) if parts_dir else {}
+
+    compositor = NumpyCompositor(base.size) if backend == "numpy" else None
+
+    # This helper puts everything together for each frame
+    def compose_frame(offset=(0,0), scale=(1.0,1.0), head_img=None, extra_overlay=None):
+        """Build a single frame with optional transforms and overlays."""
+
+        if compositor is not None:
+            compositor.clear()
+            paste = compositor.paste
+        else:
+            canvas = Image.new("RGBA", base.size, (255,255,255,0))
+            paste = lambda im, pos: canvas.paste(im, pos, im)
+        # Resize the character for scaling (frames with the same size share one resize)
+        sw = int(base.width * scale[0])
+        sh = int(base.height * scale[1])
+        base_resized = sprite_cache.get(base, (sw, sh), resample=Image.Resampling.BICUBIC)
+        x = (w - sw)//2 + offset[0]
+        y = (h - sh)//2 + offset[1]
+        paste(base_resized, (int(x), int(y)))
+
+        # If we have a special head image, put it on top
+        if head_img is not None and "head" in parts:
+            paste(head_img, ((w - head_img.width)//2, (h - head_img.height)//2 - round(20 * resolution)))
+        # Add any extra overlays
+        if extra_overlay:
+            paste(extra_overlay, (0,0))
+        return compositor.to_image() if compositor is not None else canvas
+
+    # Load any special images (like eyes closed) from the plan
+    variants = {}
+    variant_paths = {}
+    for k, v in plan.get("variants", {}).items():
+        v_path = Path(v)
+        if v_path.exists():
+            variants[k] = shrink(Image.open(v_path).convert("RGBA"))
+            variant_paths[k] = v_path
+
+    # Work out every frame's movement up front, then just build the frames
+    timeline = compile_plan(plan, variants=variants)
+    source_key = None
+    if frame_cache is not None:
+        # Everything besides the frame's own state that changes its pixels
+        source_key = frame_cache.source_key(char_png, variant_paths, resolution=resolution, backend=backend,
+                                            head="head" in parts)
+    for i in range(0, len(timeline), frame_step):
+        state = timeline.frame(i)
+        head_variant = variants[state.variant] if state.variant is not None else None
+        offset = state.offset
+        if resolution != 1:
+            offset = (round(offset[0] * resolution), round(offset[1] * resolution))
+        with span("render.compose", frame=i) as sp:
+            if source_key is not None:
+                key = frame_cache.frame_key(source_key, offset, state.scale, state.variant)
+                frame = frame_cache.get(key)
+                sp.set(cached=frame is not None)
+                if frame is None:
+                    frame = compose_frame(offset=offset, scale=state.scale, head_img=head_variant)
+                    frame_cache.put(key, frame)
+            else:
+                frame = compose_frame(offset=offset, scale=state.scale, head_img=head_variant)
+        yield frame
+
+@traced("render")
 def render_animation_from_plan(
     plan: Dict[str, Any],
     char_png: str | Path,
     parts_dir: Optional[str | Path] = None,
-    out_gif: str | Path = "out.gif"
+    out_gif: str | Path = "out.gif",
+    sprite_cache: Optional[SpriteCache] = None,
+    collapse_duplicates: bool = False,
+    backend: str = "pil",
+    shared_palette: bool = False,
+    palette_colors: int = 255,
+    palette_cache_dir: Optional[str | Path] = None,
+    encoder: Optional[str] = None,
+    frame_cache: Optional[FrameCache] = None,
 ) -> Optional[str]:
-    """Render an animated GIF from a plan and a base character image.
+    """Render an animation (GIF, APNG, WebP or MP4) from a plan and a base character image.
 
     The plan may include:
       - "duration_ms": total animation duration in milliseconds
@@ -37,103 +229,132 @@ def render_animation_from_plan(
           * type: "translate" | "scale" | "swap_image"
           * part: "root" or a specific part for swapping
           * start_frame, end_frame: frame range for the action
-          * start_offset/end_offset, start_scale/end_scale, easing, variant
+          * start_offset/end_offset, start_scale/end_scale, variant
+          * easing: one of timeline.EASINGS (linear if missing)
       - "variants": mapping of variant names to image file paths
 
     Args:
         plan: Dictionary describing timing, actions, and optional variants.
         char_png: Path to the main character PNG (RGBA recommended).
-        parts_dir: Optional directory containing extra part images.
-        out_gif: Output path for the rendered GIF.
+        parts_dir: Optional directory containing extra part images or a
+            part atlas (see load_parts).
+        out_gif: Output path for the rendered animation. The extension
+            picks the format (.gif, .png/.apng, .webp, .mp4; anything
+            else is written as GIF) unless `encoder` is given.
+        sprite_cache: Optional cache of resized images. Pass the same one
+            to several renders to share resizes between them; by default
+            a fresh cache is used for each render.
+        collapse_duplicates: If True, frames only store the area that
+            changed since the previous frame when that is safe, and the
+            number of identical frames merged into longer ones is logged
+            (identical consecutive frames are always merged).
+        backend: Compositing engine, one of BACKENDS. Both produce the
+            same pixels; "numpy" avoids per-frame canvas allocations.
+        shared_palette: If True, one palette is built from the character
+            and variant images and used for every frame (faster, and
+            colours do not flicker). Palettes are cached on disk.
+        palette_colors: Maximum number of colours in the shared palette.
+        palette_cache_dir: Where shared palettes are cached (see
+            palette.default_cache_dir).
+        encoder: Output format, one of encoders.ENCODERS ("gif", "apng",
+            "webp", "mp4"). collapse_duplicates and shared_palette only
+            apply to GIF; the other formats keep full colour.
+        frame_cache: Optional cache of finished frames (see
+            framecache.FrameCache). Pass the same one to every render of
+            a drawing, and frames that did not change are reused.
 
     Returns:
-        The output GIF path on success, or None if rendering fails.
+        The output path on success, or None if rendering fails.
     """
 
     try:
-        char_png = Path(char_png)
-        if parts_dir is not None:
-            parts_dir = Path(parts_dir)
         out_gif = Path(out_gif)
-        # Get how long the animation should be and how smooth (frames per second)
-        duration_ms = plan.get("duration_ms", 1000)
-        fps = plan.get("fps", 12)
-        total_frames = max(1, int(duration_ms / 1000 * fps))
-        base = Image.open(char_png).convert("RGBA")
-        w, h = base.size
-        frames = []
-
-        # Load extra parts if we have them (like head, wings)
-        parts = {}
-        if parts_dir and parts_dir.is_dir():
-            for name in ("body", "head", "leftwing", "rightwing"):
-                p = parts_dir / f"{name}.png"
-                if p.exists():
-                    parts[name] = Image.open(p).convert("RGBA")
-
-        # This helper puts everything together for each frame
-        def compose_frame(offset=(0,0), scale=(1.0,1.0), head_img=None, extra_overlay=None):
-            """Build a single frame with optional transforms and overlays."""
-
-            canvas = Image.new("RGBA", base.size, (255,255,255,0))
-            # Resize the character for scaling
-            sw = int(base.width * scale[0])
-            sh = int(base.height * scale[1])
-            base_resized = base.resize((sw, sh), resample=Image.Resampling.BICUBIC)
-            x = (w - sw)//2 + offset[0]
-            y = (h - sh)//2 + offset[1]
-            canvas.paste(base_resized, (int(x), int(y)), base_resized)
-
-            # If we have a special head image, put it on top
-            if head_img is not None and "head" in parts:
-                canvas.paste(head_img, ((w - head_img.width)//2, (h - head_img.height)//2 - 20), head_img)
-            # Add any extra overlays
-            if extra_overlay:
-                canvas.paste(extra_overlay, (0,0), extra_overlay)
-            return canvas
-
-        # Load any special images (like eyes closed) from the plan
-        variants = {}
-        for k, v in plan.get("variants", {}).items():
-            v_path = Path(v)
-            if v_path.exists():
-                variants[k] = Image.open(v_path).convert("RGBA")
-
-        # For each frame, figure out what should move or change
-        for f in range(total_frames):
-            offset = [0,0]
-            scale = [1.0,1.0]
-            head_variant = None
-            for act in plan.get("actions", []):
-                sf, ef = act.get("start_frame", 0), act.get("end_frame", total_frames)
-                if f < sf or f > ef:
-                    continue
-                t_norm = (f - sf) / max(1, (ef - sf))
-                easing = act.get("easing")
-                if easing == "ease_out":
-                    t = ease_out(t_norm)
-                else:
-                    t = t_norm
-                if act["type"] == "translate" and act.get("part") == "root":
-                    so = act.get("start_offset", [0,0])
-                    eo = act.get("end_offset", [0,0])
-                    offset[0] += int(lerp(so[0], eo[0], t))
-                    offset[1] += int(lerp(so[1], eo[1], t))
-                if act["type"] == "scale" and act.get("part") == "root":
-                    ss = act.get("start_scale", [1.0,1.0])
-                    es = act.get("end_scale", [1.0,1.0])
-                    scale[0] *= lerp(ss[0], es[0], t)
-                    scale[1] *= lerp(ss[1], es[1], t)
-                if act["type"] == "swap_image" and act.get("variant"):
-                    vname = act["variant"]
-                    if vname in variants:
-                        head_variant = variants[vname]
-            frame = compose_frame(offset=tuple(offset), scale=tuple(scale), head_img=head_variant)
-            frames.append(frame.convert("RGBA"))
-
-        # Save all the frames as a GIF (animation)
-        frames[0].save(out_gif, saveall=True, append_images=frames[1:], duration=int(1000/fps), loop=0, disposal=2)
+        frame_count, fps = plan_timing(plan)
+        encoder = encoder_for(out_gif, encoder, default="gif")
+        set_attributes(frames=frame_count, fps=fps, backend=backend, encoder=encoder)
+        palette = None
+        if shared_palette and encoder == "gif":
+            sources = [Path(char_png)] + [Path(v) for v in plan.get("variants", {}).values() if Path(v).exists()]
+            palette = load_or_build_palette(sources, colors=palette_colors, cache_dir=palette_cache_dir)
+        frames = iter_animation_frames(plan, char_png, parts_dir=parts_dir, sprite_cache=sprite_cache, backend=backend,
+                                       frame_cache=frame_cache)
+        # Save the frames as an animation (GIF unless asked otherwise), one frame at a time
+        if encoder == "gif":
+            writer = GifWriter(out_gif, loop=0, deltas=collapse_duplicates, palette=palette)
+        elif encoder == "mp4":
+            writer = make_writer(out_gif, encoder, loop=0, fps=fps)  # Video runs at the plan's own rate
+        else:
+            writer = make_writer(out_gif, encoder, loop=0)
+        with writer:
+            writer.write_all(frames, int(1000/fps))
+        if collapse_duplicates:
+            logger.info(f"Collapsed {writer.collapsed} duplicate frames ({writer.frames_out} frames left)")
+        if frame_cache is not None:
+            logger.info(f"Frame cache: {frame_cache.hits} hits, {frame_cache.misses} misses so far")
         return str(out_gif)
     except Exception as e:
         logger.error(f"Error rendering animation: {e}")
+        record_error(e)
+        return None
+
+
+@traced("render.preview")
+def render_preview(
+    plan: Dict[str, Any],
+    char_png: str | Path,
+    parts_dir: Optional[str | Path] = None,
+    out_gif: str | Path = "preview.gif",
+    resolution: float = 0.25,
+    min_edge: int = 128,
+    colors: int = 32,
+    max_fps: Optional[int] = 8,
+    sprite_cache: Optional[SpriteCache] = None,
+    frame_cache: Optional[FrameCache] = None,
+) -> Optional[str]:
+    """Render a quick, low-quality GIF of a plan, for checking it while editing.
+
+    The frames are smaller (`resolution`), use a small shared palette
+    (`colors`) and, for smooth plans, only every n-th frame is made so
+    the preview runs at about `max_fps`. Each kept frame is shown longer
+    to make up for the skipped ones, so the preview lasts as long as the
+    real animation. The canned plan previews in well under a second.
+
+    Args:
+        plan: The plan, as for render_animation_from_plan.
+        char_png: Path to the main character PNG.
+        parts_dir: Optional directory with part images or a part atlas.
+        out_gif: Where to write the preview GIF.
+        resolution: Preview size compared to the character image.
+        min_edge: Small drawings are shrunk less, so the preview's
+            longest side stays at least this many pixels.
+        colors: Colours in the preview's palette.
+        max_fps: Highest frame rate to render; None keeps the plan's.
+        sprite_cache: Optional cache of resized images, shared between
+            previews of the same drawing.
+        frame_cache: Optional cache of finished frames, shared between
+            previews (and renders) of the same drawing.
+
+    Returns:
+        The output path on success, or None if rendering fails.
+    """
+    try:
+        out_gif = Path(out_gif)
+        frame_count, fps = plan_timing(plan)
+        step = max(1, math.ceil(fps / max_fps)) if max_fps else 1
+        with Image.open(char_png) as im:  # Only reads the header
+            resolution = min(1.0, max(resolution, min_edge / max(im.size)))
+        set_attributes(frames=len(range(0, frame_count, step)), fps=fps, resolution=resolution, step=step)
+        frames = iter_animation_frames(plan, char_png, parts_dir=parts_dir, sprite_cache=sprite_cache,
+                                       backend="numpy", resolution=resolution, frame_step=step,
+                                       frame_cache=frame_cache)
+        first = next(frames)
+        # A palette from the first (small) frame is plenty for a preview and needs no disk cache
+        palette = build_palette([first], colors=colors)
+        with GifWriter(out_gif, loop=0, deltas=True, palette=palette) as writer:
+            writer.write(first, int(1000 * step / fps))
+            writer.write_all(frames, int(1000 * step / fps))
+        return str(out_gif)
+    except Exception as e:
+        logger.error(f"Error rendering preview: {e}")
+        record_error(e)
         return None
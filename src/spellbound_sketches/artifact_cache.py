@@ -0,0 +1,177 @@
+"""A local, content-addressed cache for files made by the preprocess step.
+
+Entries are keyed by a hash of the input file plus the settings used to
+process it, so the same drawing processed the same way is only done
+once. Each entry is a folder with the produced files and a small
+manifest. Entries appear atomically (they are built in a temporary
+folder and renamed into place), and the least recently used entries are
+removed once the cache grows past its size limit.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("spellbound_sketches.artifact_cache")
+
+MANIFEST = "manifest.json"
+
+
+def default_cache_root() -> Path:
+    """Root folder for all caches (SPELLBOUND_CACHE_DIR or ~/.cache/spellbound_sketches)."""
+    return Path(os.environ.get("SPELLBOUND_CACHE_DIR") or Path.home() / ".cache" / "spellbound_sketches")
+
+
+def file_digest(path: str | Path) -> str:
+    """SHA-256 of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """Store and look up processed files by input content and settings.
+
+    Args:
+        root: Cache folder. Defaults to "<default_cache_root()>/artifacts".
+        max_bytes: Size limit; least recently used entries are removed
+            when the total goes above it.
+
+    Attributes:
+        hits, misses: How many lookups found (or did not find) an entry.
+    """
+
+    def __init__(self, root: Optional[str | Path] = None, max_bytes: int = 512 * 1024 * 1024) -> None:
+        self.root = Path(root) if root is not None else default_cache_root() / "artifacts"
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, input_path: str | Path, **params: Any) -> str:
+        """Make a cache key from an input file's content and processing settings."""
+        settings = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(f"{file_digest(input_path)}\n{settings}".encode()).hexdigest()
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> Optional[Dict[str, Path]]:
+        """Look up an entry.
+
+        Returns:
+            Mapping of file names to cached paths, or None on a miss.
+        """
+        entry = self._entry_dir(key)
+        files = self._complete_files(entry)
+        try:
+            if files is not None:
+                os.utime(entry / MANIFEST)  # Mark as recently used
+        except OSError:
+            files = None
+        if files is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return files
+
+    @staticmethod
+    def _complete_files(entry: Path) -> Optional[Dict[str, Path]]:
+        """The files of an entry, or None if its manifest or any file is missing."""
+        try:
+            names = json.loads((entry / MANIFEST).read_text())["files"]
+            files = {name: entry / name for name in names}
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return files if all(p.is_file() for p in files.values()) else None
+
+    def put(self, key: str, files: Dict[str, str | Path]) -> Dict[str, Path]:
+        """Copy files into the cache under `key`.
+
+        Args:
+            key: The cache key.
+            files: Mapping of names (plain file names) to files to store.
+
+        Returns:
+            Mapping of names to the cached copies.
+        """
+        entry = self._entry_dir(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(dir=entry.parent, prefix=f".{key[:8]}-"))
+        try:
+            for name, src in files.items():
+                if Path(name).name != name:
+                    raise ValueError(f"cache file names must not contain folders: {name!r}")
+                shutil.copyfile(src, tmp / name)
+            (tmp / MANIFEST).write_text(json.dumps({"files": sorted(files), "created": time.time()}))
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                if self._complete_files(entry) is None:
+                    # A broken entry (cut short or partly removed) is in the way: replace it
+                    logger.warning(f"Replacing incomplete cache entry {entry}")
+                    shutil.rmtree(entry, ignore_errors=True)
+                    try:
+                        os.rename(tmp, entry)
+                    except OSError:
+                        if self._complete_files(entry) is None:
+                            raise
+                # Else someone else stored the same entry first; theirs is just as good
+                shutil.rmtree(tmp, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.evict(keep=entry)  # Never drop what the caller is about to use
+        return {name: entry / name for name in files}
+
+    def size_bytes(self) -> int:
+        """Total size of all entries."""
+        return sum(p.stat().st_size for p in self.root.glob("*/*/*") if p.is_file())
+
+    def evict(self, keep: Optional[Path] = None) -> None:
+        """Remove least recently used entries until the cache fits in max_bytes.
+
+        Args:
+            keep: An entry folder that must not be removed (put() passes the
+                one it just stored, even if that alone is over max_bytes).
+        """
+        entries = []
+        total = 0
+        for manifest in self.root.glob(f"*/*/{MANIFEST}"):
+            try:
+                size = sum(p.stat().st_size for p in manifest.parent.iterdir())
+                entries.append((manifest.stat().st_mtime, size, manifest.parent))
+            except OSError:
+                continue
+            total += size
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters for this cache object."""
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def materialize(cached: str | Path, out_path: str | Path) -> Path:
+    """Copy a cached file to where the caller asked for it.
+
+    A copy (not a link) is used, so later writes to `out_path` can never
+    change the cached file.
+    """
+    out_path = Path(out_path)
+    if out_path.resolve() != Path(cached).resolve():
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(cached, out_path)
+    return out_path
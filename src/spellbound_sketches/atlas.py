@@ -0,0 +1,232 @@
+"""Pack all character parts into one image (a part atlas).
+
+Instead of one PNG per part, each with lots of see-through padding, the
+parts are trimmed to the pixels they actually use and packed side by
+side into a single "atlas.png". A small "atlas.json" manifest says where
+each part sits in the atlas, where it came from in the character image,
+and its anchor point (where it attaches to the rest of the character).
+Loading all parts is then one file read and one decode.
+
+Manifest layout:
+
+    {
+      "version": 1,
+      "source_size": [w, h],          # size of the character image
+      "parts": {
+        "head": {
+          "box": [x, y, w, h],        # where the trimmed part is in the atlas
+          "offset": [x, y],           # its top-left in the character image
+          "cell": [x0, y0, x1, y1],   # the layout crop it was cut from
+          "anchor": [x, y]            # attach point, relative to "offset"
+        },
+        ...
+      }
+    }
+
+A part with no visible pixels gets an empty box (w = h = 0).
+"""
+
+import json
+import logging
+import math
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger("spellbound_sketches.atlas")
+
+ATLAS_VERSION = 1
+ATLAS_IMAGE = "atlas.png"
+ATLAS_MANIFEST = "atlas.json"
+PADDING = 1  # Empty pixels between parts, so resampling never bleeds between them
+
+
+class AtlasPart(NamedTuple):
+    """Where one part is stored in the atlas and where it belongs."""
+
+    box: Tuple[int, int, int, int]  # (x, y, w, h) in the atlas
+    offset: Tuple[int, int]  # Top-left of the trimmed part in the character image
+    cell: Tuple[int, int, int, int]  # Layout crop (x0, y0, x1, y1) in the character image
+    anchor: Tuple[int, int]  # Attach point, relative to offset
+
+
+def _cell_box(size: Tuple[int, int], fractions: Tuple[float, float, float, float]) -> Tuple[int, int, int, int]:
+    """Turn a layout entry (fractions of the image size) into a pixel box."""
+    w, h = size
+    left, top, right, bottom = fractions
+    return (int(w*left), int(h*top), int(w*right), int(h*bottom))
+
+
+def _shelf_pack(sizes: List[Tuple[int, int]], padding: int = PADDING) -> Tuple[List[Tuple[int, int]], Tuple[int, int]]:
+    """Place rectangles on rows ("shelves"), tallest first.
+
+    Returns:
+        The top-left position of every rectangle (in the order given) and
+        the size of the atlas that holds them all.
+    """
+    area = sum((w + padding) * (h + padding) for w, h in sizes)
+    widest = max((w for w, _ in sizes), default=0)
+    limit = max(widest, int(math.ceil(math.sqrt(area))))
+    positions = [(0, 0)] * len(sizes)
+    x = y = shelf_h = atlas_w = 0
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        w, h = sizes[i]
+        if w == 0 or h == 0:
+            continue
+        if x > 0 and x + w > limit:
+            # Row is full, start a new one below it
+            y += shelf_h + padding
+            x = shelf_h = 0
+        positions[i] = (x, y)
+        x += w + padding
+        shelf_h = max(shelf_h, h)
+        atlas_w = max(atlas_w, x - padding)
+    return positions, (max(1, atlas_w), max(1, y + shelf_h))
+
+
+def pack_parts(
+    image: Image.Image,
+    layout: Dict[str, Tuple[float, float, float, float]],
+) -> Tuple[Image.Image, Dict]:
+    """Cut parts out of a character image, trim them and pack them.
+
+    Args:
+        image: The RGBA character image.
+        layout: Part name -> (left, top, right, bottom) fractions of the
+            image size, like preprocess.PART_LAYOUT.
+
+    Returns:
+        (atlas image, manifest dict).
+    """
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    alpha = image.getchannel("A")
+    crops = {}
+    for name, fractions in layout.items():
+        cell = _cell_box(image.size, fractions)
+        # Trim to the pixels that are not fully transparent
+        tight = alpha.crop(cell).getbbox()
+        if tight is None:
+            crops[name] = (cell, None)
+        else:
+            crops[name] = (cell, (cell[0] + tight[0], cell[1] + tight[1], cell[0] + tight[2], cell[1] + tight[3]))
+    names = list(crops)
+    sizes = [(b[2] - b[0], b[3] - b[1]) if b else (0, 0) for _, b in (crops[n] for n in names)]
+    positions, atlas_size = _shelf_pack(sizes)
+
+    atlas = Image.new("RGBA", atlas_size, (0, 0, 0, 0))
+    parts = {}
+    for name, (x, y), (pw, ph) in zip(names, positions, sizes):
+        cell, tight = crops[name]
+        offset = tight[:2] if tight else cell[:2]
+        if tight:
+            atlas.paste(image.crop(tight), (x, y))
+        # Parts hang from the middle of their layout cell
+        anchor = ((cell[0] + cell[2]) // 2 - offset[0], (cell[1] + cell[3]) // 2 - offset[1])
+        parts[name] = {
+            "box": [x, y, pw, ph] if tight else [0, 0, 0, 0],
+            "offset": list(offset),
+            "cell": list(cell),
+            "anchor": list(anchor),
+        }
+    manifest = {"version": ATLAS_VERSION, "source_size": list(image.size), "parts": parts}
+    return atlas, manifest
+
+
+def _write_atomic(path: Path, write) -> None:
+    """Write a file through a temporary name, so readers never see half of it."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=path.suffix + ".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            write(fh)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_atlas(
+    image: Image.Image,
+    out_dir: str | Path,
+    layout: Dict[str, Tuple[float, float, float, float]],
+) -> Tuple[Path, Path]:
+    """Pack the parts of `image` and write atlas.png and atlas.json to `out_dir`.
+
+    Returns:
+        The paths of the atlas image and the manifest.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    atlas, manifest = pack_parts(image, layout)
+    image_path, manifest_path = out_dir / ATLAS_IMAGE, out_dir / ATLAS_MANIFEST
+    _write_atomic(image_path, lambda fh: atlas.save(fh, format="PNG"))
+    # The manifest goes last: once it exists, the atlas it describes does too
+    _write_atomic(manifest_path, lambda fh: fh.write(json.dumps(manifest, indent=1).encode()))
+    return image_path, manifest_path
+
+
+class Atlas:
+    """A loaded part atlas.
+
+    Args:
+        image: The decoded atlas image.
+        manifest: The manifest dict (see the module docstring).
+    """
+
+    def __init__(self, image: Image.Image, manifest: Dict) -> None:
+        if manifest.get("version") != ATLAS_VERSION:
+            raise ValueError(f"Unsupported atlas version {manifest.get('version')!r}")
+        self.image = image
+        self.source_size = tuple(manifest["source_size"])
+        self.parts: Dict[str, AtlasPart] = {
+            name: AtlasPart(tuple(p["box"]), tuple(p["offset"]), tuple(p["cell"]), tuple(p["anchor"]))
+            for name, p in manifest["parts"].items()
+        }
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.parts
+
+    def names(self) -> Iterable[str]:
+        return self.parts.keys()
+
+    def get(self, name: str) -> Optional[Image.Image]:
+        """The trimmed part image, or None if the part has no visible pixels."""
+        x, y, w, h = self.parts[name].box
+        if w == 0 or h == 0:
+            return None
+        return self.image.crop((x, y, x + w, y + h))
+
+    def cell_image(self, name: str) -> Image.Image:
+        """The part at the size of its layout cell, like the old per-part PNGs."""
+        part = self.parts[name]
+        x0, y0, x1, y1 = part.cell
+        out = Image.new("RGBA", (x1 - x0, y1 - y0), (0, 0, 0, 0))
+        trimmed = self.get(name)
+        if trimmed is not None:
+            out.paste(trimmed, (part.offset[0] - x0, part.offset[1] - y0))
+        return out
+
+
+def has_atlas(parts_dir: str | Path) -> bool:
+    """Check whether a parts folder holds an atlas."""
+    return (Path(parts_dir) / ATLAS_MANIFEST).is_file()
+
+
+def load_atlas(parts_dir: str | Path) -> Atlas:
+    """Read atlas.json and decode atlas.png from a parts folder.
+
+    Raises:
+        OSError: If the files can not be read.
+        ValueError: If the manifest is malformed.
+    """
+    parts_dir = Path(parts_dir)
+    manifest = json.loads((parts_dir / ATLAS_MANIFEST).read_text())
+    with Image.open(parts_dir / ATLAS_IMAGE) as im:
+        image = im.convert("RGBA")  # convert() decodes once and gives an independent copy
+    try:
+        return Atlas(image, manifest)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Malformed atlas manifest: {e}") from e
@@ -0,0 +1,194 @@
+"""Run the whole sketch pipeline for many drawings without any questions.
+
+A batch is described by a JSONL manifest: one JSON object per line with
+the keys
+
+  - "drawing": path to the photo/scan of the drawing (required)
+  - "output": where to write the finished GIF (required)
+  - "onboarding": the onboarding answers as a dict (optional)
+  - "plan": a ready-made animation plan (optional; asked from the
+    adapter when missing)
+  - "id": a name to show in the summary (optional)
+  - "engine": background removal engine, "numpy" or "opencv"
+    (optional; defaults to "numpy")
+
+Relative paths are resolved against the folder of the manifest. Every
+item runs remove_background -> export_parts -> plan -> render on its own,
+so one broken drawing never stops the rest of the batch.
+"""
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from spellbound_sketches.adapter import multimodal_plan_for_animation
+from spellbound_sketches.animator import render_animation_from_plan
+from spellbound_sketches.background import DEFAULT_ENGINE
+from spellbound_sketches.plan_cache import PlanCache, default_cache_dir as plan_cache_dir
+from spellbound_sketches.preprocess import export_parts, remove_background
+
+logger = logging.getLogger("spellbound_sketches.batch")
+
+
+def load_manifest(manifest_path: str | Path) -> List[Dict[str, Any]]:
+    """Read a JSONL manifest into a list of batch items.
+
+    Args:
+        manifest_path: Path to the manifest file.
+
+    Returns:
+        The items, with "drawing" and "output" turned into absolute paths.
+
+    Raises:
+        ValueError: If a line is not valid JSON or misses a required key.
+    """
+    manifest_path = Path(manifest_path)
+    base_dir = manifest_path.resolve().parent
+    items = []
+    with open(manifest_path, encoding="utf-8") as fh:
+        for lineno, line in enumerate(fh, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue  # Skip blank lines and comments
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{manifest_path}:{lineno}: invalid JSON ({e})") from e
+            if not isinstance(item, dict):
+                raise ValueError(f"{manifest_path}:{lineno}: expected a JSON object")
+            for key in ("drawing", "output"):
+                if not item.get(key):
+                    raise ValueError(f"{manifest_path}:{lineno}: missing '{key}'")
+            item["drawing"] = str(base_dir / item["drawing"])
+            item["output"] = str(base_dir / item["output"])
+            item.setdefault("id", f"line{lineno}")
+            item.setdefault("onboarding", {})
+            items.append(item)
+    return items
+
+
+_plan_cache: Optional[PlanCache] = None
+
+
+def _worker_plan_cache() -> PlanCache:
+    """The plan cache of this (worker) process; the disk store is shared by all of them."""
+    global _plan_cache
+    if _plan_cache is None:
+        _plan_cache = PlanCache(disk_dir=plan_cache_dir())
+    return _plan_cache
+
+
+def is_item_done(item: Dict[str, Any]) -> bool:
+    """Check whether an item's GIF was already written by an earlier run.
+
+    Outputs are only moved into place once they are complete, so an
+    existing output file means the item finished.
+    """
+    return Path(item["output"]).is_file()
+
+
+def process_item(item: Dict[str, Any], resume: bool = True) -> Dict[str, Any]:
+    """Run the full pipeline for one batch item.
+
+    Intermediate files (character.png and parts/) go into a
+    "<output name>.work" folder next to the output.
+
+    Args:
+        item: One manifest item (see the module docstring).
+        resume: If True, items whose output already exists are skipped.
+
+    Returns:
+        A result dict with "id", "output", "status" ("ok", "skipped" or
+        "failed"), "error" and "seconds". This function never raises.
+    """
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"id": item.get("id"), "output": item.get("output"), "status": "ok", "error": None}
+    try:
+        if resume and is_item_done(item):
+            result["status"] = "skipped"
+            return result
+        out_path = Path(item["output"])
+        work_dir = out_path.parent / f"{out_path.stem}.work"
+        work_dir.mkdir(parents=True, exist_ok=True)
+
+        charpng = remove_background(item["drawing"], out_path=work_dir / "character.png",
+                                    engine=item.get("engine", DEFAULT_ENGINE))
+        if not charpng:
+            raise RuntimeError(f"could not remove background from {item['drawing']}")
+        parts_dir = work_dir / "parts"
+        if export_parts(charpng, parts_dir=parts_dir, auto=True, atlas=True) is None:
+            logger.warning(f"[{result['id']}] could not export parts, using main image only")
+
+        plan = item.get("plan")
+        if plan is None:
+            plan = multimodal_plan_for_animation(image_path=charpng, onboarding=item.get("onboarding") or {},
+                                                 cache=_worker_plan_cache())
+
+        # Render next to the output first, so a half-written GIF never looks finished
+        partial = out_path.with_name(f"{out_path.stem}.partial{out_path.suffix}")
+        if not render_animation_from_plan(plan, charpng, parts_dir=parts_dir, out_gif=partial):
+            raise RuntimeError("could not render animation")
+        os.replace(partial, out_path)
+    except Exception as e:
+        logger.error(f"[{result['id']}] failed: {e}")
+        result["status"] = "failed"
+        result["error"] = str(e)
+    finally:
+        result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def run_batch(
+    manifest: str | Path | List[Dict[str, Any]],
+    workers: Optional[int] = None,
+    resume: bool = True,
+) -> Dict[str, Any]:
+    """Process every item of a manifest, optionally in parallel.
+
+    Args:
+        manifest: Path to a JSONL manifest, or already loaded items.
+        workers: Number of worker processes. None uses one per CPU, and
+            1 runs everything in this process.
+        resume: If True, items whose output already exists are skipped.
+
+    Returns:
+        A summary dict with counts ("total", "ok", "skipped", "failed"),
+        "seconds", "items_per_second", the list of "failures" and the
+        per-item "results" in manifest order.
+    """
+    items = load_manifest(manifest) if isinstance(manifest, (str, Path)) else list(manifest)
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+
+    if workers == 1 or len(items) <= 1:
+        for i, item in enumerate(items):
+            results[i] = process_item(item, resume=resume)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(items))) as pool:
+            futures = {pool.submit(process_item, item, resume): i for i, item in enumerate(items)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    # The worker itself died (not just the item), keep going with the rest
+                    logger.error(f"[{items[i].get('id')}] worker failed: {e}")
+                    results[i] = {"id": items[i].get("id"), "output": items[i].get("output"),
+                                  "status": "failed", "error": str(e), "seconds": 0.0}
+
+    seconds = time.perf_counter() - started
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in ("ok", "skipped", "failed")}
+    processed = counts["ok"] + counts["failed"]
+    return {
+        "total": len(items),
+        **counts,
+        "seconds": seconds,
+        "items_per_second": processed / seconds if seconds > 0 else 0.0,
+        "failures": [{"id": r["id"], "error": r["error"]} for r in results if r["status"] == "failed"],
+        "results": results,
+    }
@@ -1,15 +1,19 @@
 import random
-"""Command line interface for creating a simple animated GIF from a drawing."""
+"""Command line interface for creating a simple animated GIF from a drawing.
+
+The pipeline (Pillow, NumPy, OpenCV) and the player (Tk, text-to-speech)
+are imported inside the commands that use them, so a command only pays
+for what it needs and headless machines never load Tk or pyttsx3.
+"""
 
 import logging
 import json
+import sys
+import time
 import typer
 from pathlib import Path
 
-from spellbound_sketches.adapter import multimodal_plan_for_animation
-from spellbound_sketches.preprocess import remove_background, export_parts
-from spellbound_sketches.animator import render_animation_from_plan
-from spellbound_sketches.player import playgifwithtts
+from spellbound_sketches import tracing
 
 # Set up logging (for messages and errors)
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +23,9 @@ logger = logging.getLogger(name)
 # This makes it easy to create command-line commands
 app = typer.Typer(pretty_exceptions_enable=False)
 
+# Same as background.DEFAULT_ENGINE, written out so --help does not load NumPy
+DEFAULT_BG_ENGINE = "numpy"
+
 def cli_collect_onboarding() -> dict:
     """Collect preferences to personalize the animation, including age group and more."""
     logger.info("Welcome! Let's personalize your animation experience.")
@@ -67,9 +74,83 @@ def cli_collect_onboarding() -> dict:
     print("\nThank you! Your preferences are saved.\n")
     return onboarding
 
+@app.callback(invoke_without_command=True)
+def main(
+    ctx: typer.Context,
+    import_profile: bool = typer.Option(
+        False, "--import-profile", help="Run the command and report how long each module took to import."),
+    trace: Path = typer.Option(
+        None, help="Time every stage and write the spans here (.jsonl for JSON lines, else a Chrome trace)."),
+    memprofile: bool = typer.Option(
+        False, "--memprofile", help="Report peak memory and the biggest allocations of every stage."),
+) -> None:
+    """Bring your drawings to life. Runs `sketch` when no command is given."""
+    if import_profile:
+        from spellbound_sketches.importprofile import profile_command
+        raise typer.Exit(code=profile_command([a for a in sys.argv[1:] if a != "--import-profile"]))
+    if trace is not None:
+        tracer = tracing.enable()
+        ctx.call_on_close(lambda: write_trace(tracer, trace))
+    if memprofile:
+        from spellbound_sketches.memprofile import MemoryProfiler
+        profiler = MemoryProfiler()
+        profiler.attach(tracing.get_tracer() or tracing.enable())
+        profiler.start()
+        ctx.call_on_close(lambda: write_memory_report(profiler))
+    if ctx.invoked_subcommand is None:
+        sketch(bg_engine=DEFAULT_BG_ENGINE)
+
+def write_trace(tracer: tracing.Tracer, path: Path) -> None:
+    """Save the collected spans and log how long each stage took."""
+    tracing.disable()
+    for name, entry in sorted(tracer.summary().items(), key=lambda kv: -kv[1]["total_ms"]):
+        logger.info(f"[Trace] {name}: {entry['count']}x, {entry['total_ms']:.1f} ms total, "
+                    f"{entry['max_ms']:.1f} ms max, {entry['errors']} errors")
+    try:
+        tracer.export(path)
+        print(f"[Trace] Saved {len(tracer.spans)} spans to {path}")
+    except OSError as e:
+        logger.error(f"Could not write trace to {path}: {e}")
+
+def write_memory_report(profiler) -> None:
+    """Stop memory profiling and print what every stage used."""
+    profiler.stop()
+    print("\n--- Memory profile ---")
+    print(profiler.format_report())
+
+def show_preview(plan: dict, charpng: Path, parts_dir: Path, sprite_cache=None, frame_cache=None) -> None:
+    """Render a quick low-resolution preview of the plan and play it."""
+    from spellbound_sketches.animator import render_preview
+    started = time.perf_counter()
+    preview = render_preview(plan, charpng, parts_dir=parts_dir, out_gif=Path("preview.gif"), sprite_cache=sprite_cache,
+                             frame_cache=frame_cache)
+    if not preview:
+        print("[Warning] Could not render a preview. You can still accept the plan.")
+        return
+    print(f"[Preview] Rendered a preview in {(time.perf_counter() - started) * 1000:.0f} ms. "
+          "Close the preview window to continue.")
+    try:
+        from spellbound_sketches.player import playgifwithtts  # Loads Tk only now
+        playgifwithtts(preview, "")
+    except Exception as e:
+        print(f"[Info] Could not show the preview window ({e}); it is saved as {preview}")
+        logger.warning(f"Could not play preview: {e}")
+
 @app.command()
-def sketch() -> None:
+def sketch(
+    bg_engine: str = typer.Option(
+        DEFAULT_BG_ENGINE, "--bg-engine",
+        help="Background remover: numpy (clean white paper) or opencv (phone photos, grey or unevenly lit paper)."),
+) -> None:
     """Create an animation from a user supplied drawing."""
+    from spellbound_sketches.adapter import multimodal_plan_for_animation
+    from spellbound_sketches.animator import render_animation_from_plan
+    from spellbound_sketches.artifact_cache import ArtifactCache
+    from spellbound_sketches.framecache import FrameCache
+    from spellbound_sketches.plan_cache import PlanCache, default_cache_dir as plan_cache_dir
+    from spellbound_sketches.preprocess import export_parts, remove_background
+    from spellbound_sketches.sprites import SpriteCache
+
     logger.info("Sketchbook Animator — quick prototype")
     print("\n--- Image Selection ---")
     print("Tip: You can use your own drawing (PNG/JPG) or just press Enter to use the sample.")
@@ -81,28 +162,37 @@ def sketch() -> None:
 
     logger.info("Preprocessing image (removing background)...")
     print("\n[Info] Removing background from your image...")
-    charpng = remove_background(img_path, out_path=Path("character.png"))
+    cache = ArtifactCache()  # Reuse earlier results for drawings we've seen before
+    charpng = remove_background(img_path, out_path=Path("character.png"), cache=cache, engine=bg_engine)
     if not charpng:
         print("[Error] Failed to preprocess image. Please check the file path and format.")
         logger.error("Failed to preprocess image. Exiting.")
         return
 
-    logger.info("Optional: export parts for better puppeting (head, body, leftwing, rightwing).")
+    logger.info("Optional: export parts for better puppeting (head, body, left_wing, right_wing).")
     print("[Info] Exporting character parts for animation...")
     parts_dir = Path("parts")
-    parts = export_parts(charpng, parts_dir=parts_dir, auto=True)  # returns dict or None
+    parts = export_parts(charpng, parts_dir=parts_dir, auto=True, cache=cache, atlas=True)  # returns dict or None
     if parts is None:
         print("[Warning] Could not export parts. Continuing with main image only.")
         logger.warning("Could not export parts. Continuing with main image only.")
 
     logger.info("Requesting animation plan from multimodal adapter...")
     print("[Info] Requesting animation plan from the AI...")
-    plan = multimodal_plan_for_animation(image_path=charpng, onboarding=onboarding)
+    plan_cache = PlanCache(disk_dir=plan_cache_dir())  # Same drawing + answers: no new AI request
+    plan = multimodal_plan_for_animation(image_path=charpng, onboarding=onboarding, cache=plan_cache)
 
     # --- Animation Plan Preview Step ---
+    # A small, quick render is shown after every change; the full render only runs on accept
+    sprite_cache = SpriteCache()  # Previews of the same drawing share their resizes
+    frame_cache = FrameCache()  # ...and their frames, so an edit only redraws what changed
+    changed = True
     while True:
         print("\n[Preview] Here is your animation plan:")
         print(json.dumps(plan, indent=2))
+        if changed:
+            show_preview(plan, charpng, parts_dir, sprite_cache=sprite_cache, frame_cache=frame_cache)
+            changed = False
         print("Options:")
         print("  [a] Accept and render animation")
         print("  [e] Edit plan (duration/fps/actions)")
@@ -123,8 +213,7 @@ def sketch() -> None:
                 new_sound = input(f"Enter voice line (sound_text) [{plan.get('sound_text', '')}]: ").strip()
                 if new_sound:
                     plan['sound_text'] = new_sound
-                print("[Edit] Updated plan:")
-                print(json.dumps(plan, indent=2))
+                changed = True
             except Exception as e:
                 print(f"[Error] Invalid input: {e}")
         elif choice == "r":
@@ -138,9 +227,11 @@ def sketch() -> None:
                         act["start_frame"] = random.randint(0, max(0, plan.get("fps", 12) - 2))
                         act["end_frame"] = act["start_frame"] + random.randint(1, 4)
                 print("[Randomize] Actions shuffled and timings randomized.")
+                changed = True
             else:
                 print("[Info] Regenerating animation plan...")
-                plan = multimodal_plan_for_animation(image_path=charpng, onboarding=onboarding)
+                plan = multimodal_plan_for_animation(image_path=charpng, onboarding=onboarding, cache=plan_cache)
+                changed = True
         elif choice == "q":
             print("[Info] Exiting without rendering.")
             return
@@ -149,7 +240,7 @@ def sketch() -> None:
 
     logger.info("Rendering animation frames...")
     print("[Info] Rendering animation frames...")
-    gifpath = render_animation_from_plan(plan, charpng, parts_dir=parts_dir)
+    gifpath = render_animation_from_plan(plan, charpng, parts_dir=parts_dir, shared_palette=True, frame_cache=frame_cache)
     if not gifpath:
         print("[Error] Failed to render animation. Please check your image and try again.")
         logger.error("Failed to render animation. Exiting.")
@@ -160,12 +251,48 @@ def sketch() -> None:
     logger.info("Playing animation with short voice line...")
     print("[Info] Playing animation with voice line...")
     try:
+        from spellbound_sketches.player import playgifwithtts  # Loads Tk and the voice only now
         playgifwithtts(gifpath, plan.get("sound_text", ""))
     except Exception as e:
         print(f"[Error] Could not play animation or TTS: {e}")
         logger.error(f"Error playing animation or TTS: {e}")
 
 
+@app.command()
+def batch(
+    manifest: Path = typer.Argument(..., help="JSONL file with one drawing/onboarding/plan/output item per line."),
+    workers: int = typer.Option(0, help="Number of worker processes (0 = one per CPU)."),
+    resume: bool = typer.Option(True, "--resume/--no-resume", help="Skip items whose output GIF already exists."),
+) -> None:
+    """Animate many drawings from a manifest, without asking any questions."""
+    from spellbound_sketches.batch import run_batch
+    logger.info(f"Running batch from {manifest}")
+    try:
+        summary = run_batch(manifest, workers=workers or None, resume=resume)
+    except (OSError, ValueError) as e:
+        print(f"[Error] Could not read manifest: {e}")
+        raise typer.Exit(code=2)
+    print(f"[Batch] {summary['total']} items: {summary['ok']} done, {summary['skipped']} skipped, {summary['failed']} failed")
+    print(f"[Batch] {summary['seconds']:.1f}s total, {summary['items_per_second']:.2f} items/s")
+    for failure in summary["failures"]:
+        print(f"[Failed] {failure['id']}: {failure['error']}")
+    if summary["failed"]:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", help="Address to listen on."),
+    port: int = typer.Option(8766, help="Port to listen on."),
+    socket: Path = typer.Option(None, help="Listen on this unix socket instead of host/port."),
+    workers: int = typer.Option(0, help="Number of warm worker processes (0 = one per CPU)."),
+    queue_size: int = typer.Option(16, help="Most jobs waiting or running; more get HTTP 429."),
+) -> None:
+    """Run a local render service that keeps warm workers between requests."""
+    from spellbound_sketches.service import serve as run_service
+    run_service(host=host, port=port, socket_path=socket, workers=workers or None, max_queue=queue_size)
+
+
 # This lets you run the app by typing 'python cli.py' in the terminal
 if __name__ == "__main__":
     app()
\ No newline at end of file
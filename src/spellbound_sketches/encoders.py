@@ -0,0 +1,592 @@
+"""Write animation frames to a file one at a time.
+
+Pillow's `save(..., append_images=...)` needs every frame in memory
+before it starts writing. The writers here take frames as they are
+rendered instead, so memory stays the same no matter how long the
+animation is.
+
+GifWriter lets Pillow encode each frame on its own (colour reduction
+and LZW compression) and then stitches the encoded frames into one
+animated GIF, giving each frame its own local colour table. When a
+shared Palette is given, frames are mapped through it instead and the
+palette is written once as the GIF's global colour table.
+
+GIF only has 256 colours and on/off transparency. The other writers
+keep full colour and alpha: APNGWriter (stitched the same way as GIF),
+WebPWriter (animated WebP) and MP4Writer (video through OpenCV, on a
+background colour). make_writer picks one from the file extension or an
+encoder name (see ENCODERS).
+"""
+
+import io
+import logging
+import struct
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from spellbound_sketches.palette import Palette
+from spellbound_sketches.tracing import traced
+
+logger = logging.getLogger("spellbound_sketches.encoders")
+
+Box = Tuple[int, int, int, int]
+
+
+def frames_identical(a: Image.Image, b: Image.Image) -> bool:
+    """Check whether two frames have exactly the same size, mode and pixels."""
+    return a.size == b.size and a.mode == b.mode and a.tobytes() == b.tobytes()
+
+
+def opaque_where_changed(prev: Image.Image, cur: Image.Image) -> bool:
+    """Check that `cur` is fully opaque on every pixel that differs from `prev`.
+
+    When this holds, `cur` can be drawn on top of `prev` (GIF disposal 1)
+    and only the changed area needs to be stored. Otherwise something
+    turned (partly) transparent and the canvas must be cleared first.
+    """
+    a = np.asarray(prev.convert("RGBA"))
+    b = np.asarray(cur.convert("RGBA"))
+    changed = (a != b).any(axis=2)
+    return bool((b[:, :, 3][changed] == 255).all())
+
+
+def changed_box(prev: Image.Image, cur: Image.Image) -> Optional[Box]:
+    """Return the bounding box of all pixels that differ, or None if none do."""
+    changed = (np.asarray(prev) != np.asarray(cur)).any(axis=2)
+    rows = np.flatnonzero(changed.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(changed.any(axis=0))
+    return (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+
+
+def _union(a: Optional[Box], b: Optional[Box]) -> Optional[Box]:
+    """Smallest box containing both boxes (either may be None)."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _read_sub_blocks(data: bytes, pos: int) -> int:
+    """Skip a chain of GIF data sub-blocks and return the position after it."""
+    while True:
+        size = data[pos]
+        pos += 1 + size
+        if size == 0:
+            return pos
+
+
+def _split_single_frame_gif(data: bytes) -> Tuple[bytes, bytes, bytes, bytes]:
+    """Pull the pieces of one frame out of a single-frame GIF file.
+
+    Returns:
+        (graphic control extension, image descriptor, colour table,
+        image data). The colour table is the file's global table, which
+        the caller turns into the frame's local table.
+    """
+    packed = data[10]
+    pos = 13
+    colour_table = b""
+    if packed & 0x80:
+        table_len = 3 * (2 << (packed & 0x07))
+        colour_table = data[pos:pos + table_len]
+        pos += table_len
+    control = b""
+    while True:
+        marker = data[pos]
+        if marker == 0x21:  # Extension block
+            end = _read_sub_blocks(data, pos + 2)
+            if data[pos + 1] == 0xF9:
+                control = data[pos:end]
+            pos = end
+        elif marker == 0x2C:  # Image descriptor
+            descriptor = data[pos:pos + 10]
+            pos += 10
+            if descriptor[9] & 0x80:
+                # The frame already has its own colour table
+                table_len = 3 * (2 << (descriptor[9] & 0x07))
+                colour_table = data[pos:pos + table_len]
+                pos += table_len
+            elif colour_table:
+                # Move the global table into the frame: same size bits, local flag set
+                descriptor = descriptor[:9] + bytes([descriptor[9] | 0x80 | (packed & 0x07)])
+            end = _read_sub_blocks(data, pos + 1)  # Skip the LZW code size byte
+            return control, descriptor, colour_table, data[pos:end]
+        else:
+            raise ValueError(f"Unexpected GIF block 0x{marker:02x}")
+
+
+class FrameWriter:
+    """Base class for writers that take frames one at a time.
+
+    Use it as a context manager: frames go in with `write`, and the file
+    is finished when the block ends. If the block fails, the unfinished
+    file is removed.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.frames_in = 0
+        self.frames_out = 0
+
+    def write(self, frame: Image.Image, duration_ms: int) -> None:
+        """Add one frame that is shown for `duration_ms` milliseconds."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Finish the file."""
+        raise NotImplementedError
+
+    def abort(self) -> None:
+        """Stop writing and remove the unfinished file."""
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+    def write_all(self, frames: Iterable[Image.Image], duration_ms: int) -> None:
+        """Write every frame from an iterable with the same duration."""
+        for frame in frames:
+            self.write(frame, duration_ms)
+
+    def __enter__(self) -> "FrameWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class GifWriter(FrameWriter):
+    """Write an animated GIF frame by frame.
+
+    Identical consecutive frames are always merged into one longer frame
+    (`collapsed` counts how many were merged away). Only the part of each
+    frame that has content is stored.
+
+    Args:
+        path: Output GIF path.
+        loop: How often the animation repeats (0 = forever).
+        deltas: If True, a frame is drawn on top of the previous one
+            (GIF disposal 1) whenever that is safe, and only the box
+            that changed since the previous frame is stored. Otherwise
+            the canvas is cleared between frames (disposal 2).
+        palette: Optional shared palette. Every frame is mapped through
+            it instead of being quantized on its own.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        loop: int = 0,
+        deltas: bool = False,
+        palette: Optional[Palette] = None,
+    ) -> None:
+        super().__init__(path)
+        self.loop = loop
+        self.deltas = deltas
+        self.palette = palette
+        self.collapsed = 0
+        self._fp: Optional[io.BufferedWriter] = None
+        self._size: Optional[Tuple[int, int]] = None
+        self._pending: Optional[Image.Image] = None
+        self._pending_ms = 0
+        self._shown: Optional[Image.Image] = None  # Last frame written
+        self._canvas_clear = True  # Whether the viewer's canvas is empty before the next frame
+        self._dirty: Optional[Box] = None  # Area drawn since the canvas was last cleared
+
+    def write(self, frame: Image.Image, duration_ms: int) -> None:
+        if frame.mode != "RGBA":
+            frame = frame.convert("RGBA")
+        if self._size is None:
+            self._size = frame.size
+            self._fp = open(self.path, "wb")
+            self._write_header()
+        elif frame.size != self._size:
+            raise ValueError(f"Frame size {frame.size} does not match {self._size}")
+        self.frames_in += 1
+        if self._pending is not None:
+            if frames_identical(self._pending, frame):
+                self._pending_ms += duration_ms  # Same picture again: show it longer
+                self.collapsed += 1
+                return
+            self._flush(next_frame=frame)
+        self._pending, self._pending_ms = frame, duration_ms
+
+    def close(self) -> None:
+        if self._fp is None:
+            raise ValueError("Cannot write a GIF without frames")
+        if self._pending is not None:
+            self._flush(next_frame=None)
+        self._fp.write(b";")  # GIF trailer
+        self._fp.close()
+
+    def abort(self) -> None:
+        if self._fp is not None:
+            # Only remove the file if we started writing it
+            self._fp.close()
+            super().abort()
+
+    def _write_header(self) -> None:
+        w, h = self._size
+        if self.palette is not None:
+            # Global colour table with all 256 palette entries
+            self._fp.write(b"GIF89a" + struct.pack("<HHBBB", w, h, 0xF7, 0, 0) + self.palette.palette_bytes)
+        else:
+            # Logical screen without a global colour table; every frame brings its own
+            self._fp.write(b"GIF89a" + struct.pack("<HHBBB", w, h, 0x70, 0, 0))
+        if self.loop is not None:
+            self._fp.write(b"!\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", self.loop) + b"\x00")
+
+    def _flush(self, next_frame: Optional[Image.Image]) -> None:
+        """Write the pending frame, now that its duration is known."""
+        frame = self._pending
+        if self._canvas_clear or not self.deltas:
+            box = frame.getbbox()  # Everything that is not fully transparent
+        else:
+            box = changed_box(self._shown, frame)
+        # Draw the next frame on top of this one only when nothing turns transparent;
+        # the last frame always clears, so the loop restarts on an empty canvas
+        keep = self.deltas and next_frame is not None and opaque_where_changed(frame, next_frame)
+        if keep:
+            disposal = 1
+            self._dirty = _union(self._dirty, box)
+        else:
+            disposal = 2
+            # Clearing only removes this frame's box, so make it cover everything drawn so far
+            box = _union(box, self._dirty)
+            self._dirty = None
+        self._canvas_clear = not keep
+        if box is None:
+            box = (0, 0, 1, 1)  # A fully transparent frame still needs one pixel
+        self._write_frame(frame.crop(box), box[:2], self._pending_ms, disposal)
+        self._shown = frame
+        self._pending = None
+        self.frames_out += 1
+
+    @traced("render.encode")
+    def _write_frame(self, image: Image.Image, offset: Tuple[int, int], duration_ms: int, disposal: int) -> None:
+        buf = io.BytesIO()
+        if self.palette is not None:
+            image = self.palette.quantize(image)
+            image.save(buf, format="GIF", duration=duration_ms, disposal=disposal,
+                       transparency=self.palette.transparent_index, optimize=False)
+        else:
+            image.save(buf, format="GIF", duration=duration_ms, disposal=disposal)
+        control, descriptor, colour_table, image_data = _split_single_frame_gif(buf.getvalue())
+        descriptor = b"," + struct.pack("<HH", *offset) + descriptor[5:]
+        if self.palette is not None and colour_table == self.palette.palette_bytes:
+            # Same colours as the global table, so the frame does not need its own
+            descriptor = descriptor[:9] + bytes([descriptor[9] & 0x78])
+            colour_table = b""
+        self._fp.write(control + descriptor + colour_table + image_data)
+
+
+class _MergingWriter(FrameWriter):
+    """Base for writers that merge identical consecutive frames.
+
+    A frame is held back until the next different one arrives (or the
+    file is closed), so its full duration is known when `_emit` writes it.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        super().__init__(path)
+        self.collapsed = 0
+        self._size: Optional[Tuple[int, int]] = None
+        self._pending: Optional[Image.Image] = None
+        self._pending_ms = 0
+
+    def write(self, frame: Image.Image, duration_ms: int) -> None:
+        if frame.mode != "RGBA":
+            frame = frame.convert("RGBA")
+        if self._size is None:
+            self._size = frame.size
+            self._open()
+        elif frame.size != self._size:
+            raise ValueError(f"Frame size {frame.size} does not match {self._size}")
+        self.frames_in += 1
+        if self._pending is not None:
+            if frames_identical(self._pending, frame):
+                self._pending_ms += duration_ms
+                self.collapsed += 1
+                return
+            self._emit(self._pending, self._pending_ms)
+            self.frames_out += 1
+        self._pending, self._pending_ms = frame, duration_ms
+
+    def close(self) -> None:
+        if self._size is None:
+            raise ValueError("Cannot write an animation without frames")
+        self._emit(self._pending, self._pending_ms)
+        self.frames_out += 1
+        self._pending = None
+        self._finish()
+
+    def _open(self) -> None:
+        """Called once the first frame (and so the size) is known."""
+
+    def _emit(self, frame: Image.Image, duration_ms: int) -> None:
+        raise NotImplementedError
+
+    def _finish(self) -> None:
+        raise NotImplementedError
+
+
+# Longest delay one APNG frame can have (fcTL's delay is 16 bits, in ms here)
+APNG_MAX_DELAY_MS = 65535
+
+
+def _png_chunks(data: bytes) -> Iterable[Tuple[bytes, bytes]]:
+    """(type, data) of every chunk in a PNG file."""
+    pos = 8  # Skip the PNG signature
+    while pos < len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        yield kind, data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+class APNGWriter(_MergingWriter):
+    """Write an animated PNG frame by frame, with full alpha and colour.
+
+    Like GifWriter, each frame is encoded by Pillow on its own and the
+    pieces are stitched into one file, so frames are never all in memory.
+    After the first frame only the box that changed is stored (drawn over
+    the previous frame, which APNG can do even with transparency).
+    A frame shown longer than APNG_MAX_DELAY_MS is split into several
+    frames (the extra ones repeat a single pixel, so nothing changes).
+
+    Args:
+        path: Output path (.png or .apng).
+        loop: How often the animation repeats (0 = forever).
+        compress_level: zlib level 0-9; lower is faster, higher is smaller.
+    """
+
+    def __init__(self, path: str | Path, loop: int = 0, compress_level: int = 6) -> None:
+        super().__init__(path)
+        self.loop = loop
+        self.compress_level = compress_level
+        self._fp: Optional[io.BufferedRandom] = None
+        self._actl_pos = 0
+        self._sequence = 0
+        self._frames_written = 0  # APNG frames, including the pieces of long frames
+        self._shown: Optional[Image.Image] = None
+
+    def _open(self) -> None:
+        self._fp = open(self.path, "w+b")
+
+    def _emit(self, frame: Image.Image, duration_ms: int) -> None:
+        box = (0, 0) + frame.size if self._shown is None else changed_box(self._shown, frame)
+        if box is None:
+            box = (0, 0, 1, 1)
+        while True:
+            # fcTL stores the delay in 16 bits, so long frames are shown as several pieces
+            piece = min(duration_ms, APNG_MAX_DELAY_MS)
+            self._write_frame(frame, box, piece)
+            self._shown = frame
+            duration_ms -= piece
+            if duration_ms <= 0:
+                return
+            box = (0, 0, 1, 1)  # The same picture again: redraw one unchanged pixel
+
+    def _write_frame(self, frame: Image.Image, box: Box, duration_ms: int) -> None:
+        buf = io.BytesIO()
+        frame.crop(box).save(buf, format="PNG", compress_level=self.compress_level)
+        chunks = list(_png_chunks(buf.getvalue()))
+        if self._shown is None:
+            ihdr = next(data for kind, data in chunks if kind == b"IHDR")
+            self._fp.write(b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", ihdr))
+            self._actl_pos = self._fp.tell()
+            self._fp.write(_png_chunk(b"acTL", struct.pack(">II", 0, self.loop)))  # Frame count comes at the end
+        control = struct.pack(">IIIIIHHBB", self._sequence, box[2] - box[0], box[3] - box[1], box[0], box[1],
+                              duration_ms, 1000, 0, 0)  # Keep the canvas, replace the pixels in the box
+        self._fp.write(_png_chunk(b"fcTL", control))
+        self._sequence += 1
+        for kind, data in chunks:
+            if kind != b"IDAT":
+                continue
+            if self._shown is None:
+                self._fp.write(_png_chunk(b"IDAT", data))  # The first frame is also the still image
+            else:
+                self._fp.write(_png_chunk(b"fdAT", struct.pack(">I", self._sequence) + data))
+                self._sequence += 1
+        self._frames_written += 1
+
+    def _finish(self) -> None:
+        self._fp.write(_png_chunk(b"IEND", b""))
+        self._fp.seek(self._actl_pos)
+        self._fp.write(_png_chunk(b"acTL", struct.pack(">II", self._frames_written, self.loop)))
+        self._fp.close()
+
+    def abort(self) -> None:
+        if self._fp is not None:
+            self._fp.close()
+            super().abort()
+
+
+class WebPWriter(_MergingWriter):
+    """Write an animated WebP with full alpha.
+
+    Pillow's WebP encoder needs all frames at once, so frames are kept
+    until the file is closed (identical ones only once).
+
+    Args:
+        path: Output .webp path.
+        loop: How often the animation repeats (0 = forever).
+        quality: 0-100 (for lossless: how hard to try to compress).
+        lossless: Keep every pixel exactly.
+        method: 0-6; higher is slower but smaller.
+    """
+
+    def __init__(self, path: str | Path, loop: int = 0, quality: int = 80, lossless: bool = False,
+                 method: int = 4) -> None:
+        super().__init__(path)
+        self.loop = loop
+        self.quality = quality
+        self.lossless = lossless
+        self.method = method
+        self._frames: List[Image.Image] = []
+        self._durations: List[int] = []
+
+    def _emit(self, frame: Image.Image, duration_ms: int) -> None:
+        self._frames.append(frame)
+        self._durations.append(duration_ms)
+
+    def _finish(self) -> None:
+        first, rest = self._frames[0], self._frames[1:]
+        first.save(self.path, format="WEBP", save_all=True, append_images=rest, duration=self._durations,
+                   loop=self.loop, quality=self.quality, lossless=self.lossless, method=self.method)
+        self._frames, self._durations = [], []
+
+
+class MP4Writer(_MergingWriter):
+    """Write an MP4 video through OpenCV's VideoWriter.
+
+    H.264 is used when this OpenCV build can write it, otherwise MPEG-4
+    part 2 ("mp4v"). Video has no transparency, so frames are put on a
+    background colour. Video runs at one fixed frame rate; frames shown
+    longer (like merged identical frames) are repeated.
+
+    Args:
+        path: Output .mp4 path.
+        loop: Ignored (videos do not say how often to repeat).
+        background: RGB colour shown where frames are transparent.
+        codecs: FourCC codes to try, in order.
+        fps: The video's frame rate. By default it is taken from the
+            duration of the first frame written (before any merging).
+
+    Raises:
+        RuntimeError: If OpenCV is not installed or no codec works.
+    """
+
+    def __init__(self, path: str | Path, loop: int = 0, background: Tuple[int, int, int] = (255, 255, 255),
+                 codecs: Tuple[str, ...] = ("avc1", "mp4v"), fps: Optional[float] = None) -> None:
+        super().__init__(path)
+        try:
+            import cv2  # Optional; only needed for video output
+        except ImportError as e:
+            raise RuntimeError("MP4 output needs OpenCV (pip install opencv-python)") from e
+        self._cv2 = cv2
+        self.background = background
+        self.codecs = codecs
+        self.codec: Optional[str] = None
+        self.fps = fps
+        self._video = None
+        self._frame_ms = 1000.0 / fps if fps else 0.0
+        self._owed_ms = 0.0  # Time the video is behind the animation
+        self._written = 0
+
+    def write(self, frame: Image.Image, duration_ms: int) -> None:
+        if not self._frame_ms:
+            # The first frame's own duration; merged runs of frames are multiples of it
+            self._frame_ms = float(max(1, duration_ms))
+        super().write(frame, duration_ms)
+
+    def _open_video(self) -> None:
+        cv2 = self._cv2
+        w, h = self._size
+        for codec in self.codecs:
+            video = cv2.VideoWriter(str(self.path), cv2.VideoWriter_fourcc(*codec), 1000.0 / self._frame_ms,
+                                    (w + w % 2, h + h % 2))  # Most codecs need an even size
+            if video.isOpened():
+                self._video, self.codec = video, codec
+                logger.info(f"Writing {self.path.name} with the {codec} codec")
+                return
+            video.release()
+        raise RuntimeError(f"OpenCV could not write {self.path} with any of {self.codecs}")
+
+    def _emit(self, frame: Image.Image, duration_ms: int) -> None:
+        if self._video is None:
+            self._open_video()
+        w, h = frame.size
+        canvas = Image.new("RGB", (w + w % 2, h + h % 2), self.background)
+        canvas.paste(frame, (0, 0), frame)
+        bgr = np.asarray(canvas)[:, :, ::-1].copy()
+        self._owed_ms += duration_ms
+        # Frames shorter than half a video frame are dropped (the video never has none)
+        repeats = max(1 if not self._written else 0, round(self._owed_ms / self._frame_ms))
+        self._owed_ms -= repeats * self._frame_ms
+        for _ in range(repeats):
+            self._video.write(bgr)
+        self._written += repeats
+
+    def _finish(self) -> None:
+        self._video.release()
+
+    def abort(self) -> None:
+        if self._video is not None:
+            self._video.release()
+        super().abort()
+
+
+ENCODERS: Dict[str, Callable[..., FrameWriter]] = {
+    "gif": GifWriter,
+    "apng": APNGWriter,
+    "webp": WebPWriter,
+    "mp4": MP4Writer,
+}
+
+EXTENSIONS = {".gif": "gif", ".png": "apng", ".apng": "apng", ".webp": "webp", ".mp4": "mp4"}
+
+
+def encoder_for(path: str | Path, encoder: Optional[str] = None, default: Optional[str] = None) -> str:
+    """Pick the encoder name: `encoder` if given, else from the file extension.
+
+    Args:
+        path: The output file.
+        encoder: An encoder name from ENCODERS, or None to go by extension.
+        default: Encoder for unknown extensions (None = raise instead).
+
+    Raises:
+        ValueError: If the encoder or extension is unknown.
+    """
+    if encoder is not None:
+        if encoder not in ENCODERS:
+            raise ValueError(f"Unknown encoder {encoder!r}, expected one of {sorted(ENCODERS)}")
+        return encoder
+    suffix = Path(path).suffix.lower()
+    if suffix not in EXTENSIONS:
+        if default is not None:
+            return default
+        raise ValueError(f"Can not tell the format of {Path(path).name}; use one of {sorted(EXTENSIONS)}")
+    return EXTENSIONS[suffix]
+
+
+def make_writer(path: str | Path, encoder: Optional[str] = None, **options: Any) -> FrameWriter:
+    """Make the frame writer for an output file (see encoder_for).
+
+    Options are passed to the writer, such as loop=0 (all of them) or
+    palette=... (GIF only).
+    """
+    return ENCODERS[encoder_for(path, encoder)](path, **options)
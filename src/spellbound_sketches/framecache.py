@@ -0,0 +1,240 @@
+"""Remember rendered frames, so editing a plan only redraws what changed.
+
+Every frame of an animation is fully described by a few numbers: where
+the character is (offset), how it is stretched (scale) and which head
+variant is shown. Together with the source images (and the render
+settings) that decides every pixel. FrameCache keys frames by exactly
+that, so a re-render after an edit (a new duration, fps or one changed
+action) finds the frames that look the same as before and only composes
+the new ones. Idle frames inside one animation share a single entry too.
+
+Frames are kept in memory (least recently used ones are dropped past
+`max_bytes`) and, optionally, as PNG files on disk (oldest dropped past
+`max_disk_bytes`), so they are also reused by the next run of the app.
+Cached frames are shared: callers must not change them.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from PIL import Image
+
+from spellbound_sketches.artifact_cache import default_cache_root, file_digest
+
+logger = logging.getLogger("spellbound_sketches.framecache")
+
+# Bump when the way frames are drawn changes, so old cached frames are not used
+FRAME_CACHE_VERSION = 1
+
+
+def default_cache_dir() -> Path:
+    """Folder for cached frames (SPELLBOUND_CACHE_DIR or ~/.cache/spellbound_sketches)."""
+    return default_cache_root() / "frames"
+
+
+def _image_bytes(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+class FrameCache:
+    """In-memory LRU of rendered frames with an optional disk store.
+
+    Args:
+        max_bytes: Memory budget for frames (their raw pixel size).
+        disk_dir: Optional folder to also keep frames in, as PNG files.
+        max_disk_bytes: Size limit for the disk folder; the least
+            recently used files are removed when it is passed.
+
+    Attributes:
+        hits: Lookups answered from memory or disk.
+        disk_hits: The part of `hits` that had to be read from disk.
+        misses: Lookups that found nothing (the frame had to be drawn).
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 128 * 1024 * 1024,
+        disk_dir: Optional[str | Path] = None,
+        max_disk_bytes: int = 512 * 1024 * 1024,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir is not None else None
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes: Optional[int] = None  # Counted on first write
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def source_key(char_png: str | Path, variants: Dict[str, str | Path], **settings: Any) -> str:
+        """Make a key for everything a render's frames are drawn from.
+
+        Args:
+            char_png: The character image.
+            variants: Variant name -> image file (the ones that exist).
+            **settings: Anything else that changes the pixels, such as
+                the resolution or whether the drawing has a head part.
+
+        Raises:
+            OSError: If an image can not be read.
+        """
+        sources = {"character": file_digest(char_png)}
+        for name, path in sorted(variants.items()):
+            sources[f"variant:{name}"] = file_digest(path)
+        text = json.dumps({"sources": sources, "settings": settings, "version": FRAME_CACHE_VERSION},
+                          sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    @staticmethod
+    def frame_key(source_key: str, offset: Tuple[int, int], scale: Tuple[float, float], variant: Optional[str]) -> str:
+        """Make the key for one frame: the sources plus the frame's state."""
+        state = json.dumps([list(offset), [repr(float(s)) for s in scale], variant])
+        return hashlib.sha256(f"{source_key}\n{state}".encode()).hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.png"
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        """Look up a frame, or None if it was never stored (or was dropped)."""
+        with self._lock:
+            frame = self._entries.get(key)
+            if frame is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return frame
+        frame = self._load_from_disk(key)
+        with self._lock:
+            if frame is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+        self._remember(key, frame)
+        return frame
+
+    def put(self, key: str, frame: Image.Image) -> None:
+        """Store a frame (in memory, and on disk if there is a disk folder)."""
+        self._remember(key, frame)
+        self._save_to_disk(key, frame)
+
+    def _remember(self, key: str, frame: Image.Image) -> None:
+        size = _image_bytes(frame)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= _image_bytes(old)
+            self._entries[key] = frame
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, dropped = self._entries.popitem(last=False)
+                self._bytes -= _image_bytes(dropped)
+
+    def _load_from_disk(self, key: str) -> Optional[Image.Image]:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with Image.open(path) as im:
+                frame = im.convert("RGBA")
+            os.utime(path)  # Mark as recently used
+            return frame
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cached frame {path}: {e}")
+            return None
+
+    def _save_to_disk(self, key: str, frame: Image.Image) -> None:
+        if self.disk_dir is None:
+            return
+        path = self._disk_path(key)
+        try:
+            if path.exists():
+                return
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as fh:
+                    frame.save(fh, format="PNG", compress_level=1)  # Fast to write; frames are re-read rarely
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            written = path.stat().st_size
+        except OSError as e:
+            logger.warning(f"Could not store frame in {self.disk_dir}: {e}")
+            return
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self.disk_size_bytes()
+            else:
+                self._disk_bytes += written
+            over = self._disk_bytes > self.max_disk_bytes
+        if over:
+            self.evict_disk()
+
+    def _disk_files(self) -> Iterable[Path]:
+        return self.disk_dir.glob("*/*.png") if self.disk_dir is not None else ()
+
+    def disk_size_bytes(self) -> int:
+        """Total size of the frames on disk."""
+        total = 0
+        for path in self._disk_files():
+            try:
+                total += path.stat().st_size
+            except OSError:
+                continue
+        return total
+
+    def evict_disk(self) -> None:
+        """Remove least recently used frame files until the disk folder fits in max_disk_bytes."""
+        files = []
+        total = 0
+        for path in self._disk_files():
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    def memory_bytes(self) -> int:
+        """Raw pixel size of the frames kept in memory."""
+        with self._lock:
+            return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Forget every frame kept in memory (disk files stay)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and memory use for this cache object."""
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "entries": len(self._entries), "memory_bytes": self._bytes}
@@ -0,0 +1,97 @@
+"""Find out which imports make the CLI slow to start.
+
+`cli --import-profile <command> ...` runs the command again in a fresh
+Python with `-X importtime`, which prints how long every module took to
+import, and then shows a short report: the total, the packages that cost
+the most, and the slowest single imports.
+
+Only the pipeline a command really needs should be imported: the CLI
+loads its modules inside the commands, and the player (Tk) and the
+voice (pyttsx3) are only loaded when something is played or spoken.
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+
+
+class ImportTiming(NamedTuple):
+    """How long one module took to import.
+
+    Attributes:
+        module: The module name.
+        self_us: Microseconds spent in the module itself.
+        cumulative_us: Microseconds including the modules it imported.
+        depth: How deeply nested the import was (1 = imported directly).
+    """
+
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(text: str) -> Tuple[List[ImportTiming], List[str]]:
+    """Split `-X importtime` output from the rest of a program's stderr.
+
+    Returns:
+        (timings, other stderr lines).
+    """
+    timings, other = [], []
+    for line in text.splitlines():
+        if not line.startswith("import time:"):
+            other.append(line)
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # The header line
+        name = fields[2].rstrip()
+        module = name.lstrip()
+        depth = (len(name) - len(module) - 1) // 2
+        timings.append(ImportTiming(module, int(fields[0]), int(fields[1]), depth))
+    return timings, other
+
+
+def format_report(timings: Sequence[ImportTiming], top: int = 15) -> str:
+    """A readable summary of import timings."""
+    total_us = sum(t.self_us for t in timings)
+    packages: Dict[str, int] = {}
+    for t in timings:
+        package = t.module.split(".")[0]
+        packages[package] = packages.get(package, 0) + t.self_us
+    lines = [f"Imported {len(timings)} modules in {total_us / 1000:.1f} ms", "", "By package:"]
+    for package, us in sorted(packages.items(), key=lambda kv: -kv[1])[:top]:
+        lines.append(f"  {us / 1000:8.1f} ms  {package}")
+    lines += ["", "Slowest imports (including what they import):"]
+    for t in sorted(timings, key=lambda t: -t.cumulative_us)[:top]:
+        lines.append(f"  {t.cumulative_us / 1000:8.1f} ms  {t.module}")
+    return "\n".join(lines)
+
+
+def profile_command(args: Sequence[str], top: int = 15) -> int:
+    """Run a CLI command with import timing on and print the report.
+
+    The command's own output is shown as usual (its log messages come
+    out after it finishes).
+
+    Args:
+        args: The CLI arguments, without --import-profile.
+        top: How many packages and modules to list.
+
+    Returns:
+        The command's exit code.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (str(SRC_DIR), env.get("PYTHONPATH")) if p)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-m", "spellbound_sketches.cli", *args],
+                          stderr=subprocess.PIPE, text=True, env=env)
+    timings, other = parse_importtime(proc.stderr)
+    if other:
+        print("\n".join(other), file=sys.stderr)
+    print("\n--- Import profile ---")
+    print(format_report(timings, top=top))
+    return proc.returncode
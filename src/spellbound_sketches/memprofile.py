@@ -0,0 +1,252 @@
+"""Measure how much memory each stage of the pipeline needs.
+
+MemoryProfiler hooks into the tracing spans (see tracing) and records,
+for every stage:
+
+- the tracemalloc peak: the most memory Python code (and NumPy) held
+  above what was in use when the stage started,
+- the RSS peak: how far the whole process grew, sampled in the
+  background, which also catches memory tracemalloc can not see (Pillow
+  image buffers, for example),
+- for top-level stages, the lines whose allocations grew the most
+  while the stage ran (what it left behind, or leaked).
+
+Use it from code (or tests, to check memory budgets):
+
+    with memprofile.profile() as prof:
+        render_animation_from_plan(plan, "character.png")
+    assert prof.stages["render"].rss_peak_bytes < 200 * 1024 * 1024
+
+or from the command line with `cli --memprofile ...`.
+"""
+
+import os
+import sysconfig
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from spellbound_sketches import tracing
+
+MB = 1024 * 1024
+
+# Allocations made by the profiler itself are left out of the report
+_IGNORED = [tracemalloc.Filter(False, path) for path in (__file__, tracing.__file__, tracemalloc.__file__)]
+# Library code; an allocation site is shown as the last line outside these
+_LIBRARY_DIRS = tuple({sysconfig.get_paths()[key] for key in ("stdlib", "purelib", "platlib")})
+_PACKAGE_DIR = os.path.dirname(__file__)
+
+
+def current_rss() -> Optional[int]:
+    """Resident memory of this process in bytes, or None if it can not be read here."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil  # Optional; used on systems without /proc
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+class StageMemory(NamedTuple):
+    """Memory use of one stage (all its runs together).
+
+    Attributes:
+        name: The span name, like "render".
+        count: How many times the stage ran.
+        peak_bytes: Largest tracemalloc peak above the stage's start.
+        rss_peak_bytes: Largest RSS growth above the stage's start (None
+            when RSS can not be read).
+        top: Lines ("file:line", bytes) whose allocations grew the most
+            during the run with the largest peak (top-level stages only).
+    """
+
+    name: str
+    count: int
+    peak_bytes: int
+    rss_peak_bytes: Optional[int]
+    top: List[Tuple[str, int]]
+
+
+def _site(traceback: tracemalloc.Traceback) -> str:
+    """The most recent frame of an allocation that is not inside a library."""
+    frames = list(traceback)  # Oldest call first
+    for frame in reversed(frames):
+        if frame.filename.startswith(_PACKAGE_DIR) or not frame.filename.startswith(_LIBRARY_DIRS + ("<",)):
+            return f"{frame.filename}:{frame.lineno}"
+    return f"{frames[-1].filename}:{frames[-1].lineno}"
+
+
+class _Active:
+    __slots__ = ("base", "peak", "rss_base", "rss_peak", "snapshot")
+
+    def __init__(self, base: int, rss: Optional[int], snapshot: Optional[tracemalloc.Snapshot]) -> None:
+        self.base = self.peak = base
+        self.rss_base = self.rss_peak = rss
+        self.snapshot = snapshot
+
+
+class MemoryProfiler:
+    """Record memory per tracing span.
+
+    Args:
+        top_n: How many allocation sites to keep per top-level stage.
+        rss_interval: Seconds between RSS samples while a stage runs.
+        frames: Stack frames tracemalloc keeps per allocation (more is
+            slower but can see past NumPy/Pillow to the calling code).
+    """
+
+    def __init__(self, top_n: int = 5, rss_interval: float = 0.005, frames: int = 4) -> None:
+        self.top_n = top_n
+        self.rss_interval = rss_interval
+        self.frames = frames
+        self.stages: Dict[str, StageMemory] = {}
+        self._active: Dict[int, _Active] = {}
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+        self._running = False
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._running = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracemalloc = True
+        if current_rss() is not None:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample_rss, name="rss-sampler", daemon=True)
+            self._sampler.start()
+
+    def stop(self) -> None:
+        self._running = False
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def attach(self, tracer: tracing.Tracer) -> None:
+        """Start recording the spans of a tracer."""
+        tracer.add_hook(on_start=self._on_start, on_end=self._on_end)
+
+    def detach(self, tracer: tracing.Tracer) -> None:
+        """Stop recording the spans of a tracer (undoes attach)."""
+        tracer.remove_hook(on_start=self._on_start, on_end=self._on_end)
+
+    def _sample_rss(self) -> None:
+        while not self._stop.wait(self.rss_interval):
+            self._update_rss(current_rss())
+
+    def _update_rss(self, rss: Optional[int]) -> None:
+        if rss is None:
+            return
+        with self._lock:
+            for entry in self._active.values():
+                if entry.rss_peak is not None and rss > entry.rss_peak:
+                    entry.rss_peak = rss
+
+    def _update_peaks(self) -> int:
+        """Fold the tracemalloc peak so far into every running stage; returns current use."""
+        current, peak = tracemalloc.get_traced_memory()
+        for entry in self._active.values():
+            entry.peak = max(entry.peak, peak)
+        tracemalloc.reset_peak()  # Only one peak exists, so start a fresh one for the new span
+        return current
+
+    def _on_start(self, span: tracing.Span) -> None:
+        if not self._running or not tracemalloc.is_tracing():
+            return
+        snapshot = None
+        if span.parent_id is None and self.top_n:
+            snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        rss = current_rss()
+        self._update_rss(rss)
+        with self._lock:
+            current = self._update_peaks()
+            self._active[span.id] = _Active(current, rss, snapshot)
+
+    def _on_end(self, span: tracing.Span) -> None:
+        self._update_rss(current_rss())
+        with self._lock:
+            if span.id not in self._active:
+                return
+            self._update_peaks()
+            entry = self._active.pop(span.id)
+        peak = entry.peak - entry.base
+        rss_peak = entry.rss_peak - entry.rss_base if entry.rss_base is not None else None
+        top: List[Tuple[str, int]] = []
+        if entry.snapshot is not None and tracemalloc.is_tracing():
+            stats = tracemalloc.take_snapshot().filter_traces(_IGNORED).compare_to(entry.snapshot, "traceback")
+            sites: Dict[str, int] = {}
+            for stat in stats:
+                if stat.size_diff > 0:
+                    site = _site(stat.traceback)
+                    sites[site] = sites.get(site, 0) + stat.size_diff
+            top = sorted(sites.items(), key=lambda kv: -kv[1])[:self.top_n]
+        span.set(mem_peak_kb=peak // 1024, rss_peak_kb=rss_peak // 1024 if rss_peak is not None else None)
+        with self._lock:
+            old = self.stages.get(span.name)
+            if old is None:
+                self.stages[span.name] = StageMemory(span.name, 1, peak, rss_peak, top)
+                return
+            rss_values = [v for v in (old.rss_peak_bytes, rss_peak) if v is not None]
+            self.stages[span.name] = StageMemory(
+                span.name, old.count + 1, max(old.peak_bytes, peak), max(rss_values) if rss_values else None,
+                top if peak >= old.peak_bytes and top else old.top)
+
+    def budget_violations(self, budgets_mb: Dict[str, float], rss: bool = False) -> List[str]:
+        """Stages whose peak went over their budget, as readable messages.
+
+        Args:
+            budgets_mb: Stage name -> allowed peak in MB.
+            rss: Check the RSS peak instead of the tracemalloc peak.
+        """
+        problems = []
+        for name, limit in budgets_mb.items():
+            stage = self.stages.get(name)
+            if stage is None:
+                continue
+            used = stage.rss_peak_bytes if rss else stage.peak_bytes
+            if used is not None and used > limit * MB:
+                problems.append(f"{name}: {used / MB:.1f} MB > {limit:.1f} MB")
+        return problems
+
+    def format_report(self) -> str:
+        """A readable table of every stage, biggest first."""
+        lines = [f"{'stage':<32} {'runs':>5} {'peak MB':>9} {'RSS MB':>8}"]
+        for stage in sorted(self.stages.values(), key=lambda s: -s.peak_bytes):
+            rss = f"{stage.rss_peak_bytes / MB:8.1f}" if stage.rss_peak_bytes is not None else f"{'-':>8}"
+            lines.append(f"{stage.name:<32} {stage.count:>5} {stage.peak_bytes / MB:>9.1f} {rss}")
+            for site, size in stage.top:
+                lines.append(f"    {size / MB:7.2f} MB  {site}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def profile(top_n: int = 5, frames: int = 4) -> Iterator[MemoryProfiler]:
+    """Profile memory per stage inside a `with` block.
+
+    Tracing is turned on for the block if it was off (and off again
+    afterwards); an already active tracer is reused.
+    """
+    tracer = tracing.get_tracer()
+    own_tracer = tracer is None
+    if own_tracer:
+        tracer = tracing.enable()
+    profiler = MemoryProfiler(top_n=top_n, frames=frames)
+    profiler.attach(tracer)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        profiler.detach(tracer)  # A reused tracer outlives the block
+        if own_tracer:
+            tracing.disable()
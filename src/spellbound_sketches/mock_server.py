@@ -0,0 +1,136 @@
+"""A tiny local plan server, for tests and for trying the HTTP provider.
+
+It answers every POST with an animation plan (the canned one unless
+told otherwise), keeps connections open between requests like a real
+API would, and can be told to be slow or to fail, so retries, timeouts
+and the circuit breaker can be tried out without a real model.
+
+Run it on its own with:
+
+    PYTHONPATH=src python -m spellbound_sketches.mock_server --port 8765
+
+and point the app at it with SPELLBOUND_API_URL=http://127.0.0.1:8765/plan.
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from spellbound_sketches.adapter import canned_plan_for_animation
+
+
+class MockPlanServer:
+    """A plan server running on a background thread.
+
+    Args:
+        plan: The plan to answer with. Defaults to the canned plan.
+        delay: Seconds to wait before answering each request.
+        host, port: Where to listen (port 0 picks a free one).
+
+    Attributes:
+        requests: The JSON bodies received, in order.
+        connections: How many TCP connections were opened to it.
+        max_active: The most requests it was answering at the same time.
+        fail_next: HTTP statuses to answer the next requests with, one
+            per request, before answering normally again.
+    """
+
+    def __init__(
+        self,
+        plan: Optional[Dict[str, Any]] = None,
+        delay: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.plan = plan if plan is not None else canned_plan_for_animation()
+        self.delay = delay
+        self.requests: List[Dict[str, Any]] = []
+        self.connections = 0
+        self.max_active = 0
+        self._active = 0
+        self.fail_next: List[int] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/plan"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep connections open between requests
+
+            def setup(self) -> None:
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with server._lock:
+                    try:
+                        server.requests.append(json.loads(body))
+                    except ValueError:
+                        server.requests.append({})
+                    status = server.fail_next.pop(0) if server.fail_next else 200
+                    server._active += 1
+                    server.max_active = max(server.max_active, server._active)
+                if server.delay:
+                    time.sleep(server.delay)
+                with server._lock:
+                    server._active -= 1
+                data = json.dumps(server.plan if status == 200 else {"error": "mock failure"}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass  # Keep test output quiet
+
+        return Handler
+
+    def start(self) -> "MockPlanServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05},
+                                        name="mock-plan-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockPlanServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve canned animation plans over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before each answer.")
+    args = parser.parse_args()
+    server = MockPlanServer(delay=args.delay, host=args.host, port=args.port)
+    print(f"Serving plans at {server.url} (Ctrl+C to stop)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""One shared colour palette for every frame of a GIF.
+
+A GIF frame can only use 256 colours. Normally each frame gets its own
+palette picked by Pillow, which is slow and makes colours flicker a bit
+from frame to frame. Here we pick one palette for the whole animation
+(from the character and variant images) and map every frame through it
+with a lookup table. Palettes are saved on disk, keyed by a hash of the
+source images, so rendering the same drawing again skips this step.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+from PIL import Image
+
+from spellbound_sketches.artifact_cache import default_cache_root
+
+logger = logging.getLogger("spellbound_sketches.palette")
+
+# Bump this when the way palettes are built changes, so old cache files are ignored
+PALETTE_VERSION = 1
+LUT_BITS = 5  # Colours are looked up with 5 bits per channel (32 x 32 x 32 table)
+ALPHA_CUTOFF = 128  # Pixels less opaque than this become transparent
+MAX_SAMPLES = 1 << 18
+
+
+class Palette:
+    """A fixed set of colours plus a fast RGB -> palette index table.
+
+    Args:
+        colors: Array of shape (n, 3) with n <= 255 colours. One more
+            index (n) is used for transparent pixels.
+        lut: A lookup table made earlier for the same colours (as saved
+            with the palette). Built from the colours when missing.
+    """
+
+    def __init__(self, colors: np.ndarray, lut: Optional[np.ndarray] = None) -> None:
+        colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+        if not 1 <= len(colors) <= 255:
+            raise ValueError("a palette needs between 1 and 255 colours")
+        if lut is not None and lut.shape != (1 << (3 * LUT_BITS),):
+            raise ValueError("lookup table has the wrong size")
+        self.colors = colors
+        self.transparent_index = len(colors)
+        self.lut = lut if lut is not None else _nearest_colour_table(colors)
+        padded = np.zeros((256, 3), dtype=np.uint8)
+        padded[:len(colors)] = colors
+        self.palette_bytes = padded.tobytes()  # Always 256 entries (768 bytes)
+
+    def __len__(self) -> int:
+        return len(self.colors)
+
+    def quantize(self, frame: Image.Image) -> Image.Image:
+        """Map an RGBA frame onto this palette.
+
+        Returns:
+            A "P" image using this palette, with `info["transparency"]`
+            set to the transparent index.
+        """
+        arr = np.asarray(frame.convert("RGBA"))
+        shift = 8 - LUT_BITS
+        r = arr[:, :, 0] >> shift
+        g = arr[:, :, 1] >> shift
+        b = arr[:, :, 2] >> shift
+        cell = (r.astype(np.intp) << (2 * LUT_BITS)) | (g.astype(np.intp) << LUT_BITS) | b
+        indices = self.lut[cell]
+        indices[arr[:, :, 3] < ALPHA_CUTOFF] = self.transparent_index
+        out = Image.fromarray(indices, "P")
+        out.putpalette(self.palette_bytes)
+        out.info["transparency"] = self.transparent_index
+        return out
+
+    def save(self, path: str | Path) -> None:
+        """Write the colours and lookup table to `path` (atomically)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(bytes([len(self.colors) - 1]) + self.colors.tobytes() + self.lut.tobytes())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str | Path) -> "Palette":
+        """Read a palette written by `save`."""
+        data = np.frombuffer(Path(path).read_bytes(), dtype=np.uint8)
+        n = int(data[0]) + 1
+        return cls(data[1:1 + 3 * n], lut=data[1 + 3 * n:].copy())
+
+
+def _nearest_colour_table(colors: np.ndarray) -> np.ndarray:
+    """For every cell of the RGB lookup grid, find the nearest palette colour."""
+    steps = 1 << LUT_BITS
+    half = 1 << (8 - LUT_BITS - 1)
+    centres = np.arange(steps, dtype=np.int32) * (256 // steps) + half
+    grid = np.stack(np.meshgrid(centres, centres, centres, indexing="ij"), axis=-1).reshape(-1, 3)
+    pal = colors.astype(np.float64)
+    # |g - p|^2 = |g|^2 - 2 g.p + |p|^2, and |g|^2 is the same for every p
+    scores = pal @ (-2.0 * grid.T) + (pal * pal).sum(axis=1)[:, None]
+    return np.argmin(scores, axis=0).astype(np.uint8)
+
+
+def build_palette(images: Iterable[Image.Image], colors: int = 255, seed: int = 0) -> Palette:
+    """Pick one adaptive palette for a set of images.
+
+    Opaque pixels of all images are pooled (a random sample of them for
+    big images) and Pillow's median-cut quantizer picks the colours.
+
+    Args:
+        images: Source images, for example the character and its variants,
+            or a few rendered frames.
+        colors: Maximum number of colours (1-255; one index stays free
+            for transparency).
+        seed: Seed for the pixel sampling, so palettes are reproducible.
+    """
+    colors = max(1, min(255, colors))
+    pools = []
+    for image in images:
+        arr = np.asarray(image.convert("RGBA")).reshape(-1, 4)
+        pools.append(arr[arr[:, 3] >= ALPHA_CUTOFF, :3])
+    pixels = np.concatenate(pools) if pools else np.zeros((0, 3), dtype=np.uint8)
+    if len(pixels) == 0:
+        return Palette(np.zeros((1, 3), dtype=np.uint8))
+    if len(pixels) > MAX_SAMPLES:
+        pick = np.random.default_rng(seed).choice(len(pixels), MAX_SAMPLES, replace=False)
+        pixels = pixels[np.sort(pick)]
+    strip = Image.fromarray(np.ascontiguousarray(pixels.reshape(1, -1, 3)), "RGB")
+    quantized = strip.quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
+    used = int(np.asarray(quantized).max()) + 1  # Median cut fills indices 0..used-1
+    return Palette(np.asarray(quantized.getpalette()[:3 * used], dtype=np.uint8))
+
+
+def content_hash(paths: Iterable[str | Path]) -> str:
+    """SHA-256 over the bytes of several files, in the order given."""
+    digest = hashlib.sha256()
+    for path in paths:
+        data = Path(path).read_bytes()
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def default_cache_dir() -> Path:
+    """Folder for cached palettes (SPELLBOUND_CACHE_DIR or ~/.cache/spellbound_sketches)."""
+    return default_cache_root() / "palettes"
+
+
+def load_or_build_palette(
+    image_paths: Iterable[str | Path],
+    colors: int = 255,
+    cache_dir: Optional[str | Path] = None,
+) -> Palette:
+    """Get the palette for a set of source images, from disk if possible.
+
+    Args:
+        image_paths: The character PNG and its variant images.
+        colors: Maximum number of colours.
+        cache_dir: Where palettes are stored. Defaults to default_cache_dir().
+
+    Returns:
+        The palette. Cache problems are logged and never fatal.
+    """
+    image_paths = [Path(p) for p in image_paths]
+    cache_dir = Path(cache_dir) if cache_dir is not None else default_cache_dir()
+    key = f"{content_hash(image_paths)}-{colors}-v{PALETTE_VERSION}"
+    cached = cache_dir / f"{key}.pal"
+    try:
+        if cached.exists():
+            return Palette.load(cached)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable palette cache {cached}: {e}")
+    images = []
+    for path in image_paths:
+        with Image.open(path) as im:
+            images.append(im.convert("RGBA"))
+    palette = build_palette(images, colors=colors)
+    try:
+        palette.save(cached)
+    except OSError as e:
+        logger.warning(f"Could not cache palette in {cache_dir}: {e}")
+    return palette
@@ -0,0 +1,172 @@
+"""Make the drawing small before it is sent to the plan service.
+
+Scans and phone photos are often many megapixels, but the model only
+needs a modest picture to plan an animation. prepare_image_payload
+turns phone photos the right way up (their EXIF orientation tag would
+be lost when re-encoding), shrinks the image so its longest edge is at
+most `max_edge`, re-encodes it compactly (WebP by default, or JPEG/PNG)
+and base64-encodes it, ready to go into a JSON request. Because of the
+size limit the payload is small (tens of KB), so it is simply kept in
+memory as one string. The result is kept on disk, keyed by a hash of
+the image file and the settings, so sending the same drawing again
+costs nothing.
+"""
+
+import base64
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from PIL import Image, ImageOps, features
+
+from spellbound_sketches.artifact_cache import default_cache_root, file_digest
+
+logger = logging.getLogger("spellbound_sketches.payload")
+
+# Bump this when the way payloads are made changes, so old cache files are ignored
+PAYLOAD_VERSION = 2
+DEFAULT_MAX_EDGE = 768
+DEFAULT_FORMAT = "webp"
+DEFAULT_QUALITY = 80
+
+MIME_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+
+
+class ImagePayload(NamedTuple):
+    """An image ready to send.
+
+    Attributes:
+        data: The encoded image, base64 text.
+        mime_type: Such as "image/webp".
+        size: (width, height) of the encoded image.
+        encoded_bytes: Size of the encoded image file.
+        payload_bytes: Size of the base64 text (what actually goes over the wire).
+        encode_seconds: Time spent shrinking and encoding (0 when cached).
+        cached: Whether it came from the payload cache.
+    """
+
+    data: str
+    mime_type: str
+    size: tuple
+    encoded_bytes: int
+    payload_bytes: int
+    encode_seconds: float
+    cached: bool
+
+
+def default_cache_dir() -> Path:
+    """Folder for cached payloads (SPELLBOUND_CACHE_DIR or ~/.cache/spellbound_sketches)."""
+    return default_cache_root() / "payloads"
+
+
+def _resolve_format(fmt: str) -> str:
+    fmt = fmt.lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in MIME_TYPES:
+        raise ValueError(f"Unknown payload format {fmt!r} (choose from {', '.join(MIME_TYPES)})")
+    if fmt == "webp" and not features.check("webp"):
+        logger.warning("This Pillow has no WebP support; sending PNG instead")
+        return "png"
+    return fmt
+
+
+def encode_image(image: Image.Image, fmt: str, quality: int) -> bytes:
+    """Encode an image compactly in the given format."""
+    buf = io.BytesIO()
+    if fmt == "jpeg":
+        # JPEG has no transparency, so put the drawing on white paper
+        if image.mode in ("RGBA", "LA", "P"):
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, (0, 0), rgba)
+        image.convert("RGB").save(buf, format="JPEG", quality=quality, optimize=True)
+    elif fmt == "webp":
+        image.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+def prepare_image_payload(
+    image_path: str | Path,
+    max_edge: int = DEFAULT_MAX_EDGE,
+    fmt: str = DEFAULT_FORMAT,
+    quality: int = DEFAULT_QUALITY,
+    cache_dir: Optional[str | Path] = None,
+    use_cache: bool = True,
+) -> ImagePayload:
+    """Shrink, re-encode and base64-encode an image for a plan request.
+
+    Args:
+        image_path: The drawing (or character PNG).
+        max_edge: Longest edge in pixels after shrinking (images are
+            never made bigger).
+        fmt: "webp", "jpeg" or "png".
+        quality: Quality for WebP and JPEG (1-100).
+        cache_dir: Where payloads are cached. Defaults to default_cache_dir().
+        use_cache: Set to False to always encode and not store the result.
+
+    Returns:
+        The payload, with its sizes and how long encoding took.
+
+    Raises:
+        OSError: If the image can not be read.
+        ValueError: If the format is unknown.
+    """
+    image_path = Path(image_path)
+    fmt = _resolve_format(fmt)
+    cache_dir = Path(cache_dir) if cache_dir is not None else default_cache_dir()
+    settings = f"{max_edge}-{fmt}-{quality}-v{PAYLOAD_VERSION}"
+    key = hashlib.sha256(f"{file_digest(image_path)}\n{settings}".encode()).hexdigest()
+    cached = cache_dir / f"{key}.b64"
+
+    if use_cache:
+        try:
+            with open(cached, "r", encoding="ascii") as fh:
+                header = fh.readline().split()
+                data = fh.read()
+            w, h, encoded_bytes = (int(v) for v in header)
+            return ImagePayload(data, MIME_TYPES[fmt], (w, h), encoded_bytes, len(data), 0.0, True)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable payload cache {cached}: {e}")
+
+    started = time.perf_counter()
+    with Image.open(image_path) as src:
+        src.draft("RGB", (max_edge, max_edge))  # Lets JPEG decoding skip detail we would throw away
+        im = ImageOps.exif_transpose(src)  # Rotated phone photos: apply the orientation tag
+        if max(im.size) > max_edge:
+            scale = max_edge / max(im.size)
+            im = im.resize((max(1, round(im.width * scale)), max(1, round(im.height * scale))),
+                           Image.Resampling.LANCZOS, reducing_gap=3.0)
+        else:
+            im.load()
+        size = im.size
+        encoded = encode_image(im, fmt, quality)
+    data = base64.b64encode(encoded).decode("ascii")
+    seconds = time.perf_counter() - started
+    logger.info(f"Image payload: {len(encoded)} bytes {fmt} ({len(data)} base64) at {size[0]}x{size[1]}, "
+                f"{seconds * 1000:.0f} ms")
+
+    if use_cache:
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="ascii") as fh:
+                    fh.write(f"{size[0]} {size[1]} {len(encoded)}\n")
+                    fh.write(data)
+                os.replace(tmp, cached)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as e:
+            logger.warning(f"Could not cache payload in {cache_dir}: {e}")
+    return ImagePayload(data, MIME_TYPES[fmt], size, len(encoded), len(data), seconds, False)
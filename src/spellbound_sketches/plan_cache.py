@@ -0,0 +1,236 @@
+"""Remember animation plans, so the same request is only sent once.
+
+Asking the multimodal model for a plan is the slowest and most expensive
+step. Many requests are the same: the same (sample) drawing with the
+same onboarding answers. PlanCache keeps plans in memory (the most
+recently used ones), optionally also on disk, and forgets them after a
+while (TTL). If the same request is made again while the first one is
+still waiting for the model, the second caller simply waits for the
+first answer instead of sending another request.
+
+Everything going in and out of the cache is deep-copied, so a caller
+editing its plan (like the CLI's edit step) never changes the cached
+one.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from spellbound_sketches.artifact_cache import default_cache_root, file_digest
+
+logger = logging.getLogger("spellbound_sketches.plan_cache")
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+def default_cache_dir() -> Path:
+    """Folder for cached plans (SPELLBOUND_CACHE_DIR or ~/.cache/spellbound_sketches)."""
+    return default_cache_root() / "plans"
+
+
+def normalize_onboarding(onboarding: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Tidy up onboarding answers so near-identical ones look the same.
+
+    Keys and text values are trimmed and lower-cased; other values are
+    kept as they are.
+    """
+    normalized = {}
+    for key, value in (onboarding or {}).items():
+        if isinstance(value, str):
+            value = " ".join(value.split()).lower()
+        normalized[str(key).strip().lower()] = value
+    return dict(sorted(normalized.items()))
+
+
+class _InFlight:
+    """A request that is being worked on; other callers wait for it."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class PlanCache:
+    """In-memory LRU of plans with an optional disk store and a TTL.
+
+    Args:
+        max_entries: How many plans to keep in memory.
+        ttl_seconds: How long a plan stays valid (None = forever).
+        disk_dir: Optional folder to also keep plans in, so they survive
+            restarts and are shared between processes.
+        clock: Function returning the time in seconds (for tests).
+
+    Attributes:
+        hits, misses: Lookups that found (or did not find) a plan.
+        coalesced: Requests that waited for an identical one in flight.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 128,
+        ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+        disk_dir: Optional[str | Path] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = Path(disk_dir) if disk_dir is not None else None
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(image_path: str | Path, onboarding: Optional[Dict[str, Any]], prompt_version: int) -> str:
+        """Make a key from the drawing's content, the onboarding answers and the prompt version.
+
+        Raises:
+            OSError: If the image can not be read.
+        """
+        settings = json.dumps(normalize_onboarding(onboarding), sort_keys=True, default=str)
+        text = f"{file_digest(image_path)}\n{settings}\nprompt-v{prompt_version}"
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _fresh(self, created: float) -> bool:
+        return self.ttl_seconds is None or self.clock() - created < self.ttl_seconds
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.json"
+
+    def _load_from_disk(self, key: str) -> Optional[Tuple[float, Any]]:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            stored = json.loads(path.read_text())
+            return float(stored["created"]), stored["plan"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable cached plan {path}: {e}")
+            return None
+
+    def _save_to_disk(self, key: str, created: float, plan: Any) -> None:
+        if self.disk_dir is None:
+            return
+        try:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as fh:
+                    json.dump({"created": created, "plan": plan}, fh)
+                os.replace(tmp, self._disk_path(key))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not store plan in {self.disk_dir}: {e}")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Look up a plan (a deep copy), or None if there is no fresh one."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._fresh(entry[0]):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            entry = self._load_from_disk(key)
+            if entry is not None and not self._fresh(entry[0]):
+                entry = None
+            if entry is not None:
+                self._remember(key, *entry)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def _remember(self, key: str, created: float, plan: Any) -> None:
+        with self._lock:
+            self._entries[key] = (created, plan)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, key: str, plan: Any) -> None:
+        """Store a plan (a deep copy of it)."""
+        created = self.clock()
+        plan = copy.deepcopy(plan)
+        self._remember(key, created, plan)
+        self._save_to_disk(key, created, plan)
+
+    def get_or_create(self, key: str, create: Callable[[], Tuple[Any, bool]]) -> Any:
+        """Return the cached plan for `key`, or make it with `create`.
+
+        If another thread is already making the plan for the same key,
+        this waits for that result instead of calling `create` again.
+
+        Args:
+            key: The cache key (see `key`).
+            create: Makes the plan and returns (plan, cacheable). Plans
+                that are not cacheable (such as fallbacks used when the
+                model could not be reached) are handed out but not stored.
+
+        Returns:
+            A deep copy of the plan.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            # Another caller may have stored the plan (and left _inflight) since our lookup
+            entry = self._entries.get(key)
+            if entry is not None and self._fresh(entry[0]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.misses -= 1  # The lookup above counted a miss that turned out to be a hit
+                return copy.deepcopy(entry[1])
+            call = self._inflight.get(key)
+            owner = call is None
+            if owner:
+                call = self._inflight[key] = _InFlight()
+            else:
+                self.coalesced += 1
+        if not owner:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.value)
+        try:
+            plan, cacheable = create()
+            if cacheable:
+                self.put(key, plan)
+            call.value = copy.deepcopy(plan)
+            return plan
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+
+    def clear(self) -> None:
+        """Forget every plan kept in memory (disk files stay)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/coalesced counters for this cache object."""
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
@@ -0,0 +1,335 @@
+"""Decode animation frames in the background while they play.
+
+The player used to turn every frame into a Tk image before showing the
+first one, which freezes the window for seconds on big animations.
+FrameDecoder instead starts a worker thread that decodes frames in
+order, converts them to RGBA, shrinks them to fit the window (worked out
+once, from the first frame) and keeps a few of them ready in a small
+buffer. The player takes frames out as it shows them, so the first
+frame appears as soon as it is decoded.
+
+PlaybackScheduler decides when each frame goes on screen. Every frame
+has a fixed time it is due (start time plus the durations of all frames
+before it), measured on a monotonic clock, so small delays never add up.
+When playback falls behind, frames whose time has completely passed are
+skipped instead of slowing everything down, which keeps the animation
+in step with the voice.
+
+Nothing in here touches Tk, so it can be tested without a display. (Tk
+images still have to be made on the Tk thread; that is the only step
+left for the player.)
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+from spellbound_sketches.tracing import span
+
+logger = logging.getLogger("spellbound_sketches.playback")
+
+DEFAULT_DURATION_MS = 100  # Used when a frame does not say how long to show it
+DEFAULT_BUFFER_FRAMES = 16
+VIDEO_EXTENSIONS = {".mp4", ".m4v", ".mov", ".avi"}
+
+
+class DecodedFrame(NamedTuple):
+    """One frame, ready to show."""
+
+    index: int
+    image: Image.Image
+    duration_ms: int
+
+
+def fit_size(size: Tuple[int, int], max_size: Optional[Tuple[int, int]]) -> Tuple[int, int]:
+    """The largest size with the same shape as `size` that fits in `max_size`.
+
+    Images are only ever made smaller, never bigger.
+    """
+    if max_size is None:
+        return size
+    w, h = size
+    scale = min(1.0, max_size[0] / w, max_size[1] / h)
+    return (max(1, round(w * scale)), max(1, round(h * scale)))
+
+
+def frame_duration(im: Image.Image) -> int:
+    """How long the current frame of `im` should be shown, in milliseconds."""
+    duration = im.info.get("duration")
+    if not duration:
+        return DEFAULT_DURATION_MS
+    return int(duration)
+
+
+class VideoFile:
+    """Just enough of a Pillow image to let FrameDecoder read a video through OpenCV.
+
+    Raises:
+        OSError: If OpenCV is missing or can not open the file.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        try:
+            import cv2  # Optional; only needed to play videos
+        except ImportError as e:
+            raise OSError("Playing videos needs OpenCV (pip install opencv-python)") from e
+        self._cv2 = cv2
+        self._cap = cv2.VideoCapture(str(path))
+        if not self._cap.isOpened():
+            raise OSError(f"Can not open video {path}")
+        self.n_frames = max(1, int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.size = (int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        fps = self._cap.get(cv2.CAP_PROP_FPS)
+        self.info = {"duration": round(1000 / fps) if fps > 0 else DEFAULT_DURATION_MS}
+        self._position = 0  # Index of the frame the next read returns
+        self._frame = None
+
+    def seek(self, index: int) -> None:
+        if index != self._position:
+            self._cap.set(self._cv2.CAP_PROP_POS_FRAMES, index)
+        ok, frame = self._cap.read()
+        if not ok:
+            raise EOFError(f"No frame {index} in the video")
+        self._frame = frame
+        self._position = index + 1
+
+    def convert(self, mode: str) -> Image.Image:
+        return Image.fromarray(self._cv2.cvtColor(self._frame, self._cv2.COLOR_BGR2RGB)).convert(mode)
+
+    def close(self) -> None:
+        self._cap.release()
+
+
+def open_animation(path: str | Path) -> Any:
+    """Open an animation: videos through OpenCV, everything else (GIF, APNG, WebP) through Pillow."""
+    if Path(path).suffix.lower() in VIDEO_EXTENSIONS:
+        return VideoFile(path)
+    return Image.open(path)
+
+
+class FrameDecoder:
+    """Decode the frames of an animation on a background thread.
+
+    Frames come out of `get` in playback order. When `loop` is set they
+    start over after the last one. If the whole animation fits in the
+    buffer, every frame is decoded only once and then reused; otherwise
+    at most `buffer_frames` frames are kept and the file is decoded
+    again on every loop.
+
+    Args:
+        path: The animation file (GIF, APNG, animated WebP, MP4 or
+            anything else Pillow can open; see open_animation).
+        max_size: Optional (width, height) to shrink frames to fit into.
+        buffer_frames: How many decoded frames may be waiting at once.
+        loop: Whether playback starts over after the last frame.
+
+    Raises:
+        OSError: If the file can not be opened.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_size: Optional[Tuple[int, int]] = None,
+        buffer_frames: int = DEFAULT_BUFFER_FRAMES,
+        loop: bool = True,
+    ) -> None:
+        self.path = Path(path)
+        self._im = open_animation(self.path)
+        self.n_frames = getattr(self._im, "n_frames", 1)
+        self.source_size = self._im.size
+        self.size = fit_size(self._im.size, max_size)
+        self.capacity = max(1, buffer_frames)
+        self.loop = loop
+        self.error: Optional[Exception] = None
+        # Small animations are decoded once into `_all`; long ones stream through `_ring`
+        self._keep_all = self.n_frames <= self.capacity
+        self._all: List[DecodedFrame] = []
+        self._ring: Deque[DecodedFrame] = deque()
+        self._next = 0  # Position in `_all` of the next frame to hand out
+        self._done = False  # The worker has stopped (finished, failed or closed)
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="frame-decoder", daemon=True)
+        self._thread.start()
+
+    def _decode(self, index: int) -> DecodedFrame:
+        with span("player.decode", frame=index):
+            self._im.seek(index)
+            duration = frame_duration(self._im)
+            image = self._im.convert("RGBA")
+            if image.size != self.size:
+                image = image.resize(self.size, Image.Resampling.BILINEAR)
+        return DecodedFrame(index, image, duration)
+
+    def _run(self) -> None:
+        try:
+            while True:
+                for index in range(self.n_frames):
+                    frame = self._decode(index)
+                    with self._cond:
+                        if self._keep_all:
+                            self._all.append(frame)
+                        else:
+                            # Wait for room in the buffer
+                            while len(self._ring) >= self.capacity and not self._closed:
+                                self._cond.wait()
+                            self._ring.append(frame)
+                        self._cond.notify_all()
+                        if self._closed:
+                            return
+                if self._keep_all or not self.loop:
+                    return
+        except Exception as e:
+            logger.error(f"Error decoding {self.path}: {e}")
+            self.error = e
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+            self._im.close()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[DecodedFrame]:
+        """Take the next frame.
+
+        Args:
+            timeout: Seconds to wait for a frame that is not decoded yet
+                (None waits as long as needed, 0 does not wait at all).
+
+        Returns:
+            The next frame, or None if it is not ready in time or there
+            are no more frames (check `finished`).
+        """
+        with self._cond:
+            self._cond.wait_for(self._ready, timeout)
+            if not self._available():
+                return None  # Not decoded yet, or no more frames
+            if self._keep_all:
+                frame = self._all[self._next]
+                self._next += 1
+                if self.loop and self._next == self.n_frames:
+                    self._next = 0
+                return frame
+            frame = self._ring.popleft()
+            self._cond.notify_all()  # Room for the worker again
+            return frame
+
+    def _available(self) -> bool:
+        """Whether a frame can be handed out right now (call with the lock held)."""
+        if self._keep_all:
+            return self._next < len(self._all)
+        return bool(self._ring)
+
+    def _ready(self) -> bool:
+        return self._available() or self._done
+
+    @property
+    def finished(self) -> bool:
+        """True when no more frames will come out of `get`."""
+        with self._cond:
+            return self._done and not self._available()
+
+    def buffered(self) -> int:
+        """How many decoded frames are waiting to be taken."""
+        with self._cond:
+            if self._keep_all:
+                return len(self._all)
+            return len(self._ring)
+
+    def close(self) -> None:
+        """Stop the worker and drop the buffered frames."""
+        with self._cond:
+            self._closed = True
+            self._ring.clear()
+            self._cond.notify_all()
+        self._thread.join(timeout=1.0)
+
+    def __enter__(self) -> "FrameDecoder":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+class PlaybackScheduler:
+    """Show frames at fixed times and skip the ones that are too late.
+
+    Call `start` when the first frame is about to be shown, then `offer`
+    each frame in order. A frame whose whole showing time has already
+    passed is dropped; otherwise it is shown and `offer` says how long
+    to wait before the next one.
+
+    Args:
+        clock: Function returning the current time in seconds. Defaults
+            to time.monotonic; tests can pass a fake clock.
+
+    Attributes:
+        started: Whether the timeline is running.
+        shown, dropped: How many frames were shown and skipped.
+        max_lateness_ms: The most any shown frame was behind its time.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self.started = False
+        self._reset()
+
+    def _reset(self) -> None:
+        self.shown = 0
+        self.dropped = 0
+        self.max_lateness_ms = 0.0
+        self._total_lateness_ms = 0.0
+        self._due = 0.0  # When the next frame should appear (clock seconds)
+
+    def start(self) -> None:
+        """Start the timeline now and clear the counters."""
+        self._reset()
+        self.started = True
+        self._due = self.clock()
+
+    def stop(self) -> None:
+        """Forget the timeline; the next `offer` (or `start`) begins a new one."""
+        self.started = False
+
+    def offer(self, duration_ms: int) -> Optional[int]:
+        """Decide what to do with the next frame.
+
+        Args:
+            duration_ms: How long this frame is meant to be shown.
+
+        Returns:
+            None if the frame should be skipped (take the next one and
+            offer that), or the milliseconds to wait after showing it
+            before the next frame is due.
+        """
+        if not self.started:
+            self.start()
+        now = self.clock()
+        due, self._due = self._due, self._due + duration_ms / 1000
+        if now >= self._due and self.shown > 0:
+            self.dropped += 1  # Its time is already over: skip it and catch up
+            return None
+        lateness_ms = max(0.0, (now - due) * 1000)
+        self.shown += 1
+        self._total_lateness_ms += lateness_ms
+        self.max_lateness_ms = max(self.max_lateness_ms, lateness_ms)
+        return max(0, round((self._due - now) * 1000))
+
+    @property
+    def mean_lateness_ms(self) -> float:
+        """Average of how far behind its time each shown frame was."""
+        return self._total_lateness_ms / self.shown if self.shown else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """All counters in one dict."""
+        return {
+            "shown": self.shown,
+            "dropped": self.dropped,
+            "mean_lateness_ms": self.mean_lateness_ms,
+            "max_lateness_ms": self.max_lateness_ms,
+        }
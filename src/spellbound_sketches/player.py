@@ -2,32 +2,43 @@
 """Display animated GIFs and optionally speak accompanying text (TTS)."""
 
 import tkinter as tk  # tkinter helps us make simple windows and GUIs (Graphical User Interfaces)
-from PIL import Image, ImageTk, ImageSequence  # PIL lets us work with images and animations
-import threading  # threading lets us do two things at once (like talking and showing pictures)
-import pyttsx3  # pyttsx3 is a library that makes the computer talk (Text-to-Speech)
+from PIL import ImageTk  # PIL lets us work with images and animations
 import time
 import logging
-from typing import Optional
+from typing import Optional, Tuple
+
+from spellbound_sketches.playback import FrameDecoder, PlaybackScheduler
+from spellbound_sketches.tts import get_service
 
 logger = logging.getLogger("spellbound_sketches.player")
 
+POLL_MS = 5  # How often to check again when the next frame is not decoded yet
+FIRST_FRAME_TIMEOUT = 5.0  # Seconds to wait for the very first frame
+
 def playtts(text: Optional[str]) -> None:
-    """Speak the given text using the system TTS engine."""
+    """Speak the given text using the shared TTS service, and wait until it is done."""
     if not text:
         return  # If there's nothing to say, just stop
     try:
-        engine = pyttsx3.init()  # Start the text-to-speech engine
-        engine.say(text)  # Tell the engine what to say
-        engine.runAndWait()  # Make it actually speak out loud
+        get_service().say(text).wait()  # One engine is reused for every line
     except Exception as e:
         logger.error(f"Error with text-to-speech: {e}")
 
-def playgifwithtts(gif_path: str, tts_text: Optional[str] = "") -> None:
+def playgifwithtts(
+    gif_path: str,
+    tts_text: Optional[str] = "",
+    max_size: Optional[Tuple[int, int]] = None,
+) -> None:
     """Play an animated GIF and optionally speak text at the same time.
 
+    Frames are decoded in the background (see playback.FrameDecoder), so
+    the first frame shows right away, and every frame is shown for its
+    own duration.
+
     Args:
         gif_path: Path to the GIF file.
         tts_text: Optional text to speak via TTS while the GIF plays.
+        max_size: Optional (width, height) the animation is shrunk to fit.
     """
     # Always show a window, even if error occurs
     root = tk.Tk()
@@ -41,21 +52,53 @@ def playgifwithtts(gif_path: str, tts_text: Optional[str] = "") -> None:
     lbl.config(text="Loading animation...", image="")
     root.update()
 
+    playing = {"decoder": None, "after": None, "photo": None}
+    scheduler = PlaybackScheduler()
+
+    def stop_playing():
+        if playing["after"] is not None:
+            root.after_cancel(playing["after"])
+            playing["after"] = None
+        if playing["decoder"] is not None:
+            playing["decoder"].close()
+            playing["decoder"] = None
+
     def load_and_play_image(path):
         try:
+            stop_playing()
             # If there's text to say, start talking in the background
+            # (anything still being said about the last animation is stopped first)
             if tts_text:
-                threading.Thread(target=playtts, args=(tts_text,), daemon=True).start()
+                speech = get_service()
+                speech.cancel()
+                speech.say(tts_text)
 
-            im = Image.open(path)
-            frames = [ImageTk.PhotoImage(frame.convert("RGBA"), master=root) for frame in ImageSequence.Iterator(im)]
-            durations = im.info.get("duration", 100)
+            decoder = FrameDecoder(path, max_size=max_size)
+            playing["decoder"] = decoder
 
-            def animate(i=0):
-                lbl.config(image=frames[i], text="")
-                root.after(durations, lambda: animate((i+1) % len(frames)))
+            def animate(wait=0.0):
+                while True:
+                    frame = decoder.get(timeout=wait)
+                    if frame is None:
+                        if decoder.error is not None:
+                            lbl.config(text=f"Error: Could not play animation.\n{decoder.error}", image="")
+                        elif not decoder.finished:
+                            playing["after"] = root.after(POLL_MS, animate)  # Not decoded yet, look again soon
+                        return
+                    if not scheduler.started:
+                        scheduler.start()  # The clock starts with the first frame
+                    # Frames that are already too late are skipped, so we catch up with the voice
+                    delay_ms = scheduler.offer(frame.duration_ms)
+                    if delay_ms is not None:
+                        break
+                    wait = 0.0
+                # Keep a reference, or Tk forgets the picture
+                playing["photo"] = ImageTk.PhotoImage(frame.image, master=root)
+                lbl.config(image=playing["photo"], text="")
+                playing["after"] = root.after(delay_ms, animate)
 
-            animate(0)
+            scheduler.stop()  # A new animation gets a new timeline
+            animate(wait=FIRST_FRAME_TIMEOUT)  # Show the first frame as soon as it is ready
             help_lbl.config(text="Tip: Drag and drop a new GIF/PNG to reload.", fg="gray")
         except Exception as e:
             logger.error(f"Error playing GIF or TTS: {e}")
@@ -66,7 +109,7 @@ def playgifwithtts(gif_path: str, tts_text: Optional[str] = "") -> None:
     def on_drop(event):
         # event.data may contain file path(s)
         path = event.data if hasattr(event, 'data') else event.widget.tk.splitlist(event.data)[0]
-        if path and (path.endswith('.gif') or path.endswith('.png')):
+        if path and path.lower().endswith(('.gif', '.png', '.apng', '.webp', '.mp4')):
             lbl.config(text="Loading animation...", image="")
             root.update()
             load_and_play_image(path)
@@ -93,3 +136,11 @@ def playgifwithtts(gif_path: str, tts_text: Optional[str] = "") -> None:
         lbl.config(text=f"Error: Could not initialize drag-and-drop.\n{e}", image="")
         help_lbl.config(text="Help: Try installing tkinterdnd2 for drag-and-drop support.", fg="red")
     root.mainloop()
+    if playing["decoder"] is not None:
+        playing["decoder"].close()
+    if tts_text:
+        get_service().cancel()  # The window is gone, so stop talking too
+    if scheduler.shown:
+        stats = scheduler.stats()
+        logger.info(f"Playback: {stats['shown']} frames shown, {stats['dropped']} dropped, "
+                    f"{stats['mean_lateness_ms']:.1f} ms late on average (max {stats['max_lateness_ms']:.1f} ms)")
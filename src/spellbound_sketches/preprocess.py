@@ -6,14 +6,91 @@ from pathlib import Path
 import logging
 from typing import Optional, Dict
 
+from spellbound_sketches.artifact_cache import ArtifactCache, materialize
+from spellbound_sketches.atlas import ATLAS_IMAGE, ATLAS_MANIFEST, write_atlas
+from spellbound_sketches.background import DEFAULT_ENGINE, DEFAULT_THRESHOLD, get_engine, resolve_engine_name
+from spellbound_sketches.tracing import record_error, set_attributes, traced
+
 logger = logging.getLogger("spellbound_sketches.preprocess")
 
-def remove_background(input_path: str | Path, out_path: str | Path = "character.png") -> Optional[str]:
+# Bump this when the output of these functions changes, so cached results are not reused
+PREPROCESS_VERSION = 2
+
+# Where each part is cut from, as fractions (left, top, right, bottom) of the image size
+PART_LAYOUT = {
+    "head": (0.35, 0.05, 0.65, 0.35),
+    "body": (0.25, 0.25, 0.75, 0.75),
+    "left_wing": (0.0, 0.25, 0.35, 0.6),
+    "right_wing": (0.65, 0.25, 1.0, 0.6),
+}
+
+def _store(cache: ArtifactCache, key: str, files: Dict[str, Path]) -> None:
+    """Put results into the cache; a full or broken cache only logs a warning."""
+    try:
+        cache.put(key, files)
+    except OSError as e:
+        logger.warning(f"Could not store results in cache: {e}")
+
+# Working bytes per pixel of one strip in the tiled path: the cropped RGBA
+# copy and its NumPy view (4 + 4), the two np.minimum results, the
+# comparison, the scaled mask and its L-mode image (1 each). About 12
+# was measured; this leaves some headroom, but the budget is approximate.
+_STRIP_BYTES_PER_PIXEL = 16
+
+def _strip_rows(width: int, max_memory_mb: float) -> int:
+    """How many rows fit in one strip for the given working-memory budget."""
+    return max(1, int(max_memory_mb * 1024 * 1024) // (width * _STRIP_BYTES_PER_PIXEL))
+
+def _remove_background_tiled(img: Image.Image, threshold: int, max_memory_mb: float) -> Image.Image:
+    """Set the alpha of `img` in place, a horizontal strip at a time.
+
+    Only one strip of pixels is copied into NumPy at once, so besides the
+    decoded image itself (and a 1-byte-per-pixel alpha plane) memory use
+    stays within about `max_memory_mb`. The result is identical to the
+    whole-image path.
+    """
+    w, h = img.size
+    rows = _strip_rows(w, max_memory_mb)
+    alpha = Image.new("L", (w, h))
+    for y0 in range(0, h, rows):
+        y1 = min(h, y0 + rows)
+        strip = np.asarray(img.crop((0, y0, w, y1)))
+        lightest = np.minimum(np.minimum(strip[:, :, 0], strip[:, :, 1]), strip[:, :, 2])
+        # Not white where at least one channel is at or below the threshold
+        keep = (lightest <= threshold).view(np.uint8) * np.uint8(255)
+        alpha.paste(Image.fromarray(keep, "L"), (0, y0))
+        del strip, lightest, keep
+    img.putalpha(alpha)
+    return img
+
+@traced("preprocess.remove_background")
+def remove_background(
+    input_path: str | Path,
+    out_path: str | Path = "character.png",
+    threshold: Optional[int] = None,
+    cache: Optional[ArtifactCache] = None,
+    max_memory_mb: Optional[float] = None,
+    engine: str = DEFAULT_ENGINE,
+) -> Optional[str]:
     """Remove (near-)white background and save a transparent PNG.
 
     Args:
         input_path: Path to the source drawing (RGBA will be used).
         out_path: Output path for the processed PNG.
+        threshold: Background level. For the "numpy" engine, pixels whose
+            red, green and blue are all above this count as background
+            (default 240). The "opencv" engine picks it from the image
+            unless one is given.
+        cache: Optional artifact cache. On a hit the cached PNG is copied
+            to out_path without decoding or re-encoding anything.
+        max_memory_mb: If given, the image is processed in horizontal
+            strips using at most about this much working memory on top
+            of the decoded image. Use it for very large scans; the
+            output is byte-identical either way. Only the "numpy" engine
+            works in strips; the "opencv" engine needs the whole image.
+        engine: Background engine name, "numpy" or "opencv" (see the
+            background module). "opencv" falls back to "numpy" when
+            OpenCV is not installed.
 
     Returns:
         The output path on success, or None on failure.
@@ -21,23 +98,49 @@ def remove_background(input_path: str | Path, out_path: str | Path = "character.
     try:
         input_path = Path(input_path)
         out_path = Path(out_path)
+        engine = resolve_engine_name(engine)
+        if engine == "numpy" and threshold is None:
+            threshold = DEFAULT_THRESHOLD
+        set_attributes(engine=engine, cache_hit=False)
+        key = None
+        if cache is not None:
+            key = cache.key(input_path, op="remove_background", engine=engine, threshold=threshold,
+                            version=PREPROCESS_VERSION)
+            hit = cache.get(key)
+            if hit is not None:
+                set_attributes(cache_hit=True)
+                return str(materialize(hit["character.png"], out_path))
+        if max_memory_mb is not None and engine == "numpy":
+            img = Image.open(input_path)
+            if img.mode != "RGBA":
+                img = img.convert("RGBA")
+            img = _remove_background_tiled(img, threshold, max_memory_mb)
+            img.info = {}  # Save without ICC profile, dpi..., like the whole-image path
+            img.save(out_path)
+            if cache is not None:
+                _store(cache, key, {"character.png": out_path})
+            return str(out_path)
         img = Image.open(input_path).convert("RGBA")
+        set_attributes(width=img.width, height=img.height)
         arr = np.array(img)
-        # This line finds all the pixels that are NOT white (so we keep the character)
-        r, g, b, a = arr[:,:,0], arr[:,:,1], arr[:,:,2], arr[:,:,3]
-        mask = ~((r>240)&(g>240)&(b>240))  # keep non-white
-        arr[:,:,3] = mask.astype(np.uint8)*255  # Make background transparent
+        arr[:,:,3] = get_engine(engine)(arr, threshold)  # Make background transparent
         res = Image.fromarray(arr)
         res.save(out_path)
+        if cache is not None:
+            _store(cache, key, {"character.png": out_path})
         return str(out_path)
     except Exception as e:
         logger.error(f"Error removing background: {e}")
+        record_error(e)
         return None
 
+@traced("preprocess.export_parts")
 def export_parts(
     charpng_path: str | Path,
     parts_dir: str | Path = "parts",
-    auto: bool = True
+    auto: bool = True,
+    cache: Optional[ArtifactCache] = None,
+    atlas: bool = False,
 ) -> Optional[Dict[str, str]]:
     """Naively crop an image into head/body/left_wing/right_wing parts.
 
@@ -45,38 +148,48 @@ def export_parts(
         charpng_path: Path to the character PNG.
         parts_dir: Directory to write part images into.
         auto: Present for API shape; cropping is always naive here.
+        cache: Optional artifact cache. On a hit the cached part PNGs are
+            copied into parts_dir without decoding or re-encoding.
+        atlas: If True, write one trimmed, packed atlas.png plus an
+            atlas.json manifest (see the atlas module) instead of one
+            PNG per part.
 
     Returns:
-        Dict of part names to file paths, or None on failure.
+        Dict of part names to file paths, or None on failure. With
+        atlas=True the dict is {"atlas": <png path>, "manifest": <json path>}.
     """
     try:
         charpng_path = Path(charpng_path)
         parts_dir = Path(parts_dir)
         parts_dir.mkdir(parents=True, exist_ok=True)
+        if atlas:
+            part_paths = {"atlas": parts_dir / ATLAS_IMAGE, "manifest": parts_dir / ATLAS_MANIFEST}
+        else:
+            part_paths = {name: parts_dir / f"{name}.png" for name in PART_LAYOUT}
+        key = None
+        if cache is not None:
+            key = cache.key(charpng_path, op="export_parts", layout=PART_LAYOUT, atlas=atlas,
+                            version=PREPROCESS_VERSION)
+            hit = cache.get(key)
+            set_attributes(cache_hit=hit is not None)
+            if hit is not None:
+                return {name: str(materialize(hit[path.name], path)) for name, path in part_paths.items()}
         img = Image.open(charpng_path).convert("RGBA")
+        if atlas:
+            write_atlas(img, parts_dir, PART_LAYOUT)
+            if cache is not None:
+                _store(cache, key, {path.name: path for path in part_paths.values()})
+            return {name: str(path) for name, path in part_paths.items()}
         w, h = img.size
-        # Split the image into parts using simple math (thirds of the image)
-        head = img.crop((int(w*0.35), int(h*0.05), int(w*0.65), int(h*0.35)))
-        body = img.crop((int(w*0.25), int(h*0.25), int(w*0.75), int(h*0.75)))
-        left_wing = img.crop((0, int(h*0.25), int(w*0.35), int(h*0.6)))
-        right_wing = img.crop((int(w*0.65), int(h*0.25), w, int(h*0.6)))
-
-        head_path = parts_dir / "head.png"
-        body_path = parts_dir / "body.png"
-        left_wing_path = parts_dir / "left_wing.png"
-        right_wing_path = parts_dir / "right_wing.png"
-
-        head.save(head_path)
-        body.save(body_path)
-        left_wing.save(left_wing_path)
-        right_wing.save(right_wing_path)
-
-        return {
-            "head": str(head_path),
-            "body": str(body_path),
-            "left_wing": str(left_wing_path),
-            "right_wing": str(right_wing_path),
-        }
+        # Split the image into parts using simple math (fractions of the image)
+        for name, (left, top, right, bottom) in PART_LAYOUT.items():
+            part = img.crop((int(w*left), int(h*top), int(w*right), int(h*bottom)))
+            part.save(part_paths[name])
+        if cache is not None:
+            _store(cache, key, {path.name: path for path in part_paths.values()})
+
+        return {name: str(path) for name, path in part_paths.items()}
     except Exception as e:
         logger.error(f"Error exporting parts: {e}")
+        record_error(e)
         return None
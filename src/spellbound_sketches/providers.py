@@ -0,0 +1,369 @@
+"""Talk to a plan provider (the multimodal model) over HTTP, asynchronously.
+
+HTTPPlanProvider sends plan requests to a JSON-over-HTTP endpoint:
+
+    POST <url>  {"prompt": "...", "image": "<base64>", "image_type": "image/webp", "image_name": "..."}
+    ->          the animation plan as a JSON object
+
+and is built to keep many requests in flight without trouble:
+
+- connections are kept open and reused (a small pool of keep-alive
+  http.client connections; requests run on worker threads so the event
+  loop never blocks),
+- every request has a timeout, so a hung server can not stall anyone,
+- at most `max_concurrency` requests run at once,
+- failed requests (timeouts, connection errors, HTTP 429 and 5xx) are
+  retried with exponential backoff plus random jitter,
+- a circuit breaker stops calling a provider that keeps failing for a
+  while, so callers fall back to the canned plan right away.
+
+Existing synchronous code uses `plan_sync`. The adapter picks up a
+provider from the SPELLBOUND_API_URL environment variable (and an
+optional SPELLBOUND_API_KEY); see get_provider.
+"""
+
+import asyncio
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Any, Callable, Coroutine, Dict, Optional
+from urllib.parse import urlsplit
+
+from spellbound_sketches.payload import ImagePayload, prepare_image_payload
+
+logger = logging.getLogger("spellbound_sketches.providers")
+
+DEFAULT_TIMEOUT = 30.0
+
+
+class ProviderError(RuntimeError):
+    """A plan request failed.
+
+    Attributes:
+        retryable: Whether trying again later might work.
+    """
+
+    def __init__(self, message: str, retryable: bool = False) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class CircuitOpenError(ProviderError):
+    """The provider failed too often recently, so it is not called at all."""
+
+
+class CircuitBreaker:
+    """Stop calling a provider after too many failures in a row.
+
+    After `failure_threshold` failures the circuit "opens" and every call
+    is refused for `reset_seconds`. Then one trial call is let through:
+    if it works the circuit closes again, otherwise it stays open for
+    another `reset_seconds`.
+
+    Args:
+        failure_threshold: Failures in a row that open the circuit.
+        reset_seconds: How long to wait before trying again.
+        clock: Function returning the time in seconds (for tests).
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """"closed" (working), "open" (refusing calls) or "half-open" (trying again)."""
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._trial_running or self.clock() - self._opened_at >= self.reset_seconds:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        """Check whether a call may go ahead now."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_running or self.clock() - self._opened_at < self.reset_seconds:
+                return False
+            self._trial_running = True  # Let exactly one trial call through
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Plan provider keeps failing; using the fallback for a while")
+                self._opened_at = self.clock()
+            self._trial_running = False
+
+
+class ConnectionPool:
+    """Keep-alive HTTP connections to one server, shared between threads.
+
+    Args:
+        url: Any URL on the server (only scheme, host and port are used).
+        size: Most connections open at once; more callers wait for one.
+        timeout: Socket timeout in seconds for connecting and reading.
+    """
+
+    def __init__(self, url: str, size: int = 4, timeout: float = DEFAULT_TIMEOUT) -> None:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Not an http(s) URL: {url!r}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.timeout = timeout
+        self.size = max(1, size)
+        self.opened = 0  # Connections made so far (handy to check reuse)
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _connect(self) -> http.client.HTTPConnection:
+        self.opened += 1
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method: str, path: str, body: bytes, headers: Dict[str, str]) -> tuple:
+        """Send one request and read the whole response.
+
+        Returns:
+            (status, body bytes).
+
+        Raises:
+            OSError: On connection problems and timeouts.
+            http.client.HTTPException: On broken responses.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("No free connection in the pool")
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except BaseException:
+                conn.close()  # Never reuse a connection in an unknown state
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._idle.put(conn)
+            return response.status, data
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        """Close every idle connection."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class PlanProvider:
+    """Something that turns a drawing and a prompt into an animation plan."""
+
+    async def plan(self, image_path: str | Path, prompt: str) -> Dict[str, Any]:
+        """Ask for a plan.
+
+        Raises:
+            ProviderError: If no plan could be made.
+        """
+        raise NotImplementedError
+
+    def plan_sync(self, image_path: str | Path, prompt: str) -> Dict[str, Any]:
+        """Blocking version of `plan`, for code that is not async."""
+        return run_sync(self.plan(image_path, prompt))
+
+
+class HTTPPlanProvider(PlanProvider):
+    """Plan provider that POSTs JSON to an HTTP endpoint (see the module docstring).
+
+    Args:
+        url: The endpoint URL.
+        api_key: Optional key, sent as "Authorization: Bearer <key>".
+        timeout: Seconds one attempt may take.
+        max_concurrency: Most requests in flight at once.
+        retries: Extra attempts after a retryable failure.
+        backoff_base: First retry delay in seconds; doubles each time.
+        backoff_max: Longest retry delay in seconds.
+        breaker: Circuit breaker to use (a default one is made if missing).
+        encode: Turns the image path into the image payload (shrunk and
+            re-encoded, see payload.prepare_image_payload).
+    """
+
+    def __init__(
+        self,
+        url: str,
+        api_key: Optional[str] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_concurrency: int = 4,
+        retries: int = 2,
+        backoff_base: float = 0.25,
+        backoff_max: float = 4.0,
+        breaker: Optional[CircuitBreaker] = None,
+        encode: Callable[[str | Path], ImagePayload] = prepare_image_payload,
+    ) -> None:
+        self.url = url
+        self.path = urlsplit(url).path or "/"
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_concurrency = max(1, max_concurrency)
+        self.retries = max(0, retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.encode = encode
+        self.pool = ConnectionPool(url, size=self.max_concurrency, timeout=timeout)
+        # asyncio semaphores belong to one event loop, and plan_sync makes a new loop per call
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def _post(self, body: bytes) -> Dict[str, Any]:
+        headers = {"Content-Type": "application/json", "Accept": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        try:
+            status, data = self.pool.request("POST", self.path, body, headers)
+        except (OSError, http.client.HTTPException) as e:
+            raise ProviderError(f"request failed: {e}", retryable=True) from e
+        if status == 429 or status >= 500:
+            raise ProviderError(f"server answered {status}", retryable=True)
+        if status >= 400:
+            raise ProviderError(f"server answered {status}: {data[:200]!r}")
+        try:
+            plan = json.loads(data)
+        except ValueError as e:
+            raise ProviderError(f"answer is not JSON: {e}") from e
+        if not isinstance(plan, dict):
+            raise ProviderError("answer is not a JSON object")
+        return plan
+
+    def _backoff(self, attempt: int) -> float:
+        """Delay before retry number `attempt` (0-based): "full jitter" backoff."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def plan(self, image_path: str | Path, prompt: str) -> Dict[str, Any]:
+        try:
+            payload = await asyncio.to_thread(self.encode, image_path)
+        except (OSError, ValueError) as e:
+            raise ProviderError(f"could not prepare the image: {e}") from e
+        body = json.dumps({
+            "prompt": prompt,
+            "image": payload.data,
+            "image_type": payload.mime_type,
+            "image_name": Path(image_path).name,
+        }).encode()
+        async with self._semaphore():
+            attempt = 0
+            while True:
+                if not self.breaker.allow():
+                    raise CircuitOpenError("plan provider is unavailable (circuit open)")
+                try:
+                    plan = await asyncio.wait_for(asyncio.to_thread(self._post, body), self.timeout)
+                except asyncio.TimeoutError:
+                    error = ProviderError(f"no answer within {self.timeout}s", retryable=True)
+                except ProviderError as e:
+                    error = e
+                else:
+                    self.breaker.record_success()
+                    return plan
+                if error.retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()  # The server is up, the request was just bad
+                if not error.retryable or attempt >= self.retries:
+                    raise error
+                delay = self._backoff(attempt)
+                logger.info(f"Plan request failed ({error}); retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+def run_sync(coro: Coroutine) -> Any:
+    """Run a coroutine to the end from synchronous code.
+
+    Works even when called from inside a running event loop (the
+    coroutine then runs on its own loop in a helper thread).
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    result: Dict[str, Any] = {}
+
+    def runner() -> None:
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=runner, name="provider-sync")
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+_provider: Optional[PlanProvider] = None
+_provider_url: Optional[str] = None
+_provider_lock = threading.Lock()
+
+
+def get_provider() -> Optional[PlanProvider]:
+    """The provider configured by SPELLBOUND_API_URL, or None if it is not set.
+
+    The same provider (and so the same connections and circuit breaker)
+    is reused for as long as the URL stays the same.
+    """
+    global _provider, _provider_url
+    url = os.environ.get("SPELLBOUND_API_URL")
+    with _provider_lock:
+        if url != _provider_url:
+            if isinstance(_provider, HTTPPlanProvider):
+                _provider.close()
+            _provider = HTTPPlanProvider(url, api_key=os.environ.get("SPELLBOUND_API_KEY")) if url else None
+            _provider_url = url
+        return _provider
@@ -0,0 +1,389 @@
+"""A long-running local render service.
+
+Every CLI run starts Python, imports Pillow/NumPy/OpenCV and begins with
+empty caches, and most of that time is wasted when a web frontend asks
+for one GIF after another. RenderService keeps a pool of worker
+processes that are started once (with the pipeline modules imported and
+their caches ready) and feeds them jobs. Each job runs the same pipeline
+as a batch item (batch.process_item).
+
+The HTTP API (on localhost, or on a unix socket) is small:
+
+    POST /jobs             {"drawing": "<base64 image>" or "drawing_path": "...",
+                            "onboarding": {...}, "plan": {...}, "engine": "numpy"}
+                           -> 202 {"id": ..., "status": "queued", ...}
+                           -> 429 when too many jobs are waiting (try again later)
+                           -> 503 when the workers can not take jobs (try again later)
+    GET  /jobs/<id>        -> the job's status ("queued", "running", "done", "failed")
+    GET  /jobs/<id>/gif    -> the finished GIF (409 while it is not ready yet)
+    GET  /health           -> worker and queue counts
+
+Start it with `spellbound_sketches.cli serve`.
+"""
+
+import base64
+import binascii
+import json
+import logging
+import os
+import shutil
+import socketserver
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor, Executor, Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from spellbound_sketches.artifact_cache import default_cache_root
+from spellbound_sketches.background import DEFAULT_ENGINE, _import_cv2, resolve_engine_name
+from spellbound_sketches.batch import _worker_plan_cache, process_item
+
+logger = logging.getLogger("spellbound_sketches.service")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8766
+DEFAULT_MAX_QUEUE = 16
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+
+class QueueFullError(RuntimeError):
+    """Too many jobs are waiting; the caller should try again later."""
+
+
+class ServiceUnavailableError(RuntimeError):
+    """The workers can not take jobs (the pool broke or was shut down)."""
+
+
+def default_jobs_dir() -> Path:
+    """Folder for job inputs and outputs (SPELLBOUND_CACHE_DIR or ~/.cache/spellbound_sketches)."""
+    return default_cache_root() / "service"
+
+
+def _warm_worker() -> None:
+    """Run once in every worker process, so the first job does not pay for setup."""
+    _worker_plan_cache()
+    try:
+        _import_cv2()  # OpenCV is the slowest import; load it now if it is installed
+    except ImportError:
+        pass
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class Job:
+    """One render request.
+
+    Attributes:
+        id: The job id (used in URLs).
+        output: Where the GIF is written.
+        future: The running work; its result is batch.process_item's dict.
+        created: When the job was submitted (time.time()).
+    """
+
+    def __init__(self, job_id: str, output: Path, future: Future) -> None:
+        self.id = job_id
+        self.output = output
+        self.future = future
+        self.created = time.time()
+
+    @property
+    def status(self) -> str:
+        if not self.future.done():
+            return "running" if self.future.running() else "queued"
+        if self.future.cancelled() or self.future.exception() is not None:
+            return "failed"
+        return "done" if self.future.result()["status"] == "ok" else "failed"
+
+    def describe(self) -> Dict[str, Any]:
+        """The job's status as a JSON-friendly dict."""
+        info: Dict[str, Any] = {"id": self.id, "status": self.status, "created": self.created,
+                                "error": None, "seconds": None}
+        if self.future.done() and not self.future.cancelled():
+            error = self.future.exception()
+            if error is not None:
+                info["error"] = f"worker failed: {error}"
+            else:
+                result = self.future.result()
+                info["error"], info["seconds"] = result["error"], result["seconds"]
+        return info
+
+
+class RenderService:
+    """Run render jobs on a pool of warm worker processes.
+
+    Args:
+        workers: Number of worker processes (None = one per CPU).
+        max_queue: Most jobs that may be waiting or running at once;
+            more are refused with QueueFullError.
+        jobs_dir: Where job inputs and GIFs are kept. Defaults to
+            default_jobs_dir().
+        keep_jobs: How many finished jobs to remember; older ones (and
+            their files) are removed.
+        executor: Use this executor instead of starting a process pool
+            (for tests).
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        jobs_dir: Optional[str | Path] = None,
+        keep_jobs: int = 256,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max(1, max_queue)
+        self.jobs_dir = Path(jobs_dir) if jobs_dir is not None else default_jobs_dir()
+        self.keep_jobs = max(1, keep_jobs)
+        self._owns_executor = executor is None
+        self.executor = executor if executor is not None else self._new_pool()
+        self.restarts = 0
+        self._closed = False
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+
+    def _submit_item(self, item: Dict[str, Any]) -> Future:
+        """Hand an item to the pool, starting a new pool if a worker died (called with the lock held)."""
+        try:
+            return self.executor.submit(process_item, item, False)
+        except BrokenExecutor as e:
+            # A worker process died (killed for using too much memory, for example);
+            # the pool can not be used any more, so start a fresh one
+            if not self._owns_executor or self._closed:
+                raise ServiceUnavailableError(f"the workers are not available: {e}") from e
+            logger.warning(f"Worker pool broke ({e}); starting new workers")
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = self._new_pool()
+            self.restarts += 1
+            try:
+                return self.executor.submit(process_item, item, False)
+            except (BrokenExecutor, RuntimeError) as e2:
+                raise ServiceUnavailableError(f"the workers are not available: {e2}") from e2
+        except RuntimeError as e:
+            raise ServiceUnavailableError(f"the service is shutting down: {e}") from e
+
+    def warm_up(self) -> None:
+        """Start every worker process now instead of on the first jobs."""
+        if self._owns_executor:
+            pids = {f.result() for f in [self.executor.submit(_ping) for _ in range(self.workers)]}
+            logger.info(f"{len(pids)} warm worker(s) ready")
+
+    def pending(self) -> int:
+        """Jobs that are waiting or running."""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.future.done())
+
+    def submit(
+        self,
+        drawing: bytes | str | Path,
+        onboarding: Optional[Dict[str, Any]] = None,
+        plan: Optional[Dict[str, Any]] = None,
+        engine: str = DEFAULT_ENGINE,
+    ) -> Job:
+        """Queue a drawing to be animated.
+
+        Args:
+            drawing: The image file's bytes, or the path of an image file.
+            onboarding: The onboarding answers (used when asking for a plan).
+            plan: A ready-made animation plan; asked from the adapter when None.
+            engine: Background removal engine.
+
+        Returns:
+            The new job.
+
+        Raises:
+            QueueFullError: If max_queue jobs are already waiting or running.
+            ServiceUnavailableError: If the workers can not take the job.
+            ValueError: If the engine is unknown.
+            OSError: If the drawing can not be stored.
+        """
+        engine = resolve_engine_name(engine)
+        with self._lock:
+            if sum(1 for job in self._jobs.values() if not job.future.done()) >= self.max_queue:
+                raise QueueFullError(f"{self.max_queue} jobs are already waiting")
+            job_id = uuid.uuid4().hex
+            job_dir = self.jobs_dir / job_id
+            job_dir.mkdir(parents=True, exist_ok=True)
+            if isinstance(drawing, bytes):
+                drawing_path = job_dir / "drawing"
+                drawing_path.write_bytes(drawing)
+            else:
+                drawing_path = Path(drawing).resolve()
+            item = {"id": job_id, "drawing": str(drawing_path), "output": str(job_dir / "animation.gif"),
+                    "onboarding": onboarding or {}, "plan": plan, "engine": engine}
+            try:
+                future = self._submit_item(item)
+            except ServiceUnavailableError:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                raise
+            job = Job(job_id, job_dir / "animation.gif", future)
+            self._jobs[job_id] = job
+            self._forget_old_jobs()
+        logger.info(f"Queued job {job_id}")
+        return job
+
+    def _forget_old_jobs(self) -> None:
+        finished = [job for job in self._jobs.values() if job.future.done()]
+        for job in finished[:max(0, len(finished) - self.keep_jobs)]:
+            del self._jobs[job.id]
+            shutil.rmtree(job.output.parent, ignore_errors=True)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {"workers": self.workers, "max_queue": self.max_queue, "restarts": self.restarts,
+                **{s: statuses.count(s) for s in ("queued", "running", "done", "failed")}}
+
+    def close(self) -> None:
+        """Stop the workers (waiting jobs are cancelled)."""
+        self._closed = True
+        if self._owns_executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _make_handler(service: RenderService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status: int, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _job_links(self, job: Job) -> Dict[str, Any]:
+            return {**job.describe(), "status_url": f"/jobs/{job.id}", "gif_url": f"/jobs/{job.id}/gif"}
+
+        def do_POST(self) -> None:
+            if self.path.rstrip("/") != "/jobs":
+                self._send_json(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                self.close_connection = True
+                self._send_json(413, {"error": "request is too big"})
+                return
+            try:
+                request = json.loads(self.rfile.read(length))
+                if not isinstance(request, dict):
+                    raise ValueError("expected a JSON object")
+                if isinstance(request.get("drawing"), str):
+                    drawing: bytes | str = base64.b64decode(request["drawing"], validate=True)
+                elif isinstance(request.get("drawing_path"), str):
+                    drawing = request["drawing_path"]
+                else:
+                    raise ValueError("'drawing' (base64) or 'drawing_path' is required")
+                for key in ("onboarding", "plan"):
+                    if request.get(key) is not None and not isinstance(request[key], dict):
+                        raise ValueError(f"'{key}' must be an object")
+                job = service.submit(drawing, onboarding=request.get("onboarding"), plan=request.get("plan"),
+                                     engine=request.get("engine") or DEFAULT_ENGINE)
+            except QueueFullError as e:
+                self._send_json(429, {"error": str(e)}, {"Retry-After": "1"})
+                return
+            except ServiceUnavailableError as e:
+                self._send_json(503, {"error": str(e)}, {"Retry-After": "5"})
+                return
+            except (ValueError, binascii.Error) as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            except OSError as e:
+                self._send_json(500, {"error": f"could not store the drawing: {e}"})
+                return
+            self._send_json(202, self._job_links(job), {"Location": f"/jobs/{job.id}"})
+
+        def do_GET(self) -> None:
+            parts = [p for p in self.path.split("?")[0].split("/") if p]
+            if parts == ["health"]:
+                self._send_json(200, {"ok": True, **service.stats()})
+                return
+            job = service.get(parts[1]) if len(parts) in (2, 3) and parts[0] == "jobs" else None
+            if job is None or (len(parts) == 3 and parts[2] != "gif"):
+                self._send_json(404, {"error": "no such job"})
+                return
+            if len(parts) == 2:
+                self._send_json(200, self._job_links(job))
+                return
+            status = job.status
+            if status != "done":
+                self._send_json(409 if status in ("queued", "running") else 410, job.describe())
+                return
+            data = job.output.read_bytes()
+            self.send_response(200)
+            self.send_header("Content-Type", "image/gif")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug(format % args)
+
+    return Handler
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(
+    service: RenderService,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    socket_path: Optional[str | Path] = None,
+) -> socketserver.BaseServer:
+    """Make (but do not start) the HTTP server for a service.
+
+    Args:
+        service: The service that runs the jobs.
+        host, port: Where to listen (port 0 picks a free one).
+        socket_path: Listen on this unix socket instead of host/port.
+    """
+    handler = _make_handler(service)
+    if socket_path is not None:
+        socket_path = Path(socket_path)
+        if socket_path.exists():
+            socket_path.unlink()  # Left over from a server that did not shut down cleanly
+        return _UnixHTTPServer(str(socket_path), handler)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    socket_path: Optional[str | Path] = None,
+    workers: Optional[int] = None,
+    max_queue: int = DEFAULT_MAX_QUEUE,
+) -> None:
+    """Run the render service until Ctrl+C."""
+    service = RenderService(workers=workers, max_queue=max_queue)
+    server = make_server(service, host=host, port=port, socket_path=socket_path)
+    try:
+        service.warm_up()
+        where = socket_path if socket_path is not None else f"http://{host}:{server.server_address[1]}"
+        logger.info(f"Render service listening on {where}")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socket_path is not None:
+            Path(socket_path).unlink(missing_ok=True)
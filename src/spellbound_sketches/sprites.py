@@ -0,0 +1,159 @@
+"""Cache resized sprite images so animation frames can share them.
+
+Most frames of an animation use the character at the same few sizes
+(often just the original one), so resizing it again for every frame is
+wasted work. The SpriteCache below remembers recent resizes and hands
+back the same image the next time the same size is asked for.
+
+Resizes are keyed by the source image object, so every render of a
+drawing must use the same one. SpriteCache.load keeps decoded source
+images by file (path, modification time and size), so renders that
+share a cache also share the source, and with it the resizes.
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Hashable, List, Tuple
+
+from PIL import Image
+
+
+def build_mip_pyramid(image: Image.Image, min_size: int = 16) -> List[Image.Image]:
+    """Build a list of images, each half the size of the one before.
+
+    Args:
+        image: The full-size source image (level 0 of the pyramid).
+        min_size: Stop halving once either side would drop below this.
+
+    Returns:
+        The pyramid levels, largest first. Level 0 is the image itself.
+    """
+    levels = [image]
+    current = image
+    while current.width // 2 >= min_size and current.height // 2 >= min_size:
+        current = current.reduce(2)  # Average each 2x2 block of pixels
+        levels.append(current)
+    return levels
+
+
+class SpriteCache:
+    """A small least-recently-used cache of resized sprite images.
+
+    Entries are keyed by (source image identity, target size, resample
+    filter). Each entry keeps a reference to its source image, so the
+    identity can not be reused by another image while the entry lives.
+    Load sources with `load` so the same file gives the same image.
+
+    Args:
+        max_entries: How many resized images (and mip pyramids) to keep
+            before the least recently used one is dropped.
+        max_sources: How many decoded source images `load` keeps.
+        mipmaps: If True, big downscales start from a pre-halved copy of
+            the source (a mip pyramid) instead of the full-size image.
+            This is faster but not pixel-identical to a direct resize.
+    """
+
+    def __init__(self, max_entries: int = 64, mipmaps: bool = False, max_sources: int = 8) -> None:
+        self.max_entries = max(1, max_entries)
+        self.max_sources = max(1, max_sources)
+        self.mipmaps = mipmaps
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[int, Tuple[int, int], int], Tuple[Image.Image, Image.Image]]" = OrderedDict()
+        self._pyramids: "OrderedDict[int, Tuple[Image.Image, List[Image.Image]]]" = OrderedDict()
+        self._sources: "OrderedDict[Hashable, Image.Image]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Forget every cached image, pyramid and source."""
+        self._entries.clear()
+        self._pyramids.clear()
+        self._sources.clear()
+
+    def load(self, path: str | Path, decode: Callable[[Path], Image.Image], *settings: Any) -> Image.Image:
+        """Return the decoded image for a file, decoding it only the first time.
+
+        The file is known by its path, modification time and size, so a
+        changed file is decoded again. The image is shared, so treat it
+        as read-only.
+
+        Args:
+            path: The image file.
+            decode: Makes the image from the path (open, convert, shrink...).
+                Callers must decode a file the same way for the same settings.
+            *settings: Anything else `decode` depends on, like a resolution.
+
+        Raises:
+            OSError: If the file can not be read.
+        """
+        path = Path(path)
+        st = path.stat()
+        key = (str(path.resolve()), st.st_mtime_ns, st.st_size, settings)
+        image = self._sources.get(key)
+        if image is not None:
+            self._sources.move_to_end(key)
+            return image
+        image = decode(path)
+        self._sources[key] = image
+        if len(self._sources) > self.max_sources:
+            self._sources.popitem(last=False)
+        return image
+
+    def _source_for(self, image: Image.Image, size: Tuple[int, int]) -> Image.Image:
+        """Pick the smallest pyramid level that is still at least `size`."""
+        if not self.mipmaps:
+            return image
+        entry = self._pyramids.get(id(image))
+        if entry is None:
+            entry = (image, build_mip_pyramid(image))
+            self._pyramids[id(image)] = entry
+            if len(self._pyramids) > self.max_entries:
+                self._pyramids.popitem(last=False)
+        else:
+            self._pyramids.move_to_end(id(image))
+        source = image
+        for level in entry[1]:
+            if level.width >= size[0] and level.height >= size[1]:
+                source = level
+            else:
+                break
+        return source
+
+    def get(
+        self,
+        image: Image.Image,
+        size: Tuple[int, int],
+        resample: int = Image.Resampling.BICUBIC,
+    ) -> Image.Image:
+        """Return `image` resized to `size`, reusing an earlier resize if possible.
+
+        The returned image is shared between callers, so treat it as
+        read-only (pasting it somewhere else is fine).
+
+        Args:
+            image: The source sprite.
+            size: Target (width, height) in pixels.
+            resample: Pillow resampling filter to use.
+
+        Returns:
+            The resized image. Unscaled requests return `image` itself.
+        """
+        size = (int(size[0]), int(size[1]))
+        if size == image.size:
+            # Nothing to do: the sprite is already the right size
+            self.hits += 1
+            return image
+        key = (id(image), size, int(resample))
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        resized = self._source_for(image, size).resize(size, resample=resample)
+        self._entries[key] = (image, resized)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)  # Drop the oldest entry
+        return resized
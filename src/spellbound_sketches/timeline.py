@@ -0,0 +1,190 @@
+"""Turn an animation plan into per-frame transforms, once, before rendering.
+
+Looking through every action for every frame gets slow when a plan has
+hundreds of small actions. compile_plan checks the plan once and works
+out each action's values for all of its frames in one go with NumPy.
+The renderer then just reads the finished values for each frame.
+"""
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+def _linear(t: np.ndarray) -> np.ndarray:
+    return t
+
+
+def _ease_in(t: np.ndarray) -> np.ndarray:
+    return t * t
+
+
+def _ease_out(t: np.ndarray) -> np.ndarray:
+    # Same formula (and rounding) as animator.ease_out
+    return 1 - (1 - t) * (1 - t)
+
+
+def _ease_in_out(t: np.ndarray) -> np.ndarray:
+    return np.where(t < 0.5, 2 * t * t, 1 - 2 * (1 - t) * (1 - t))
+
+
+# Easing name -> function working on a whole array of times in [0, 1].
+# Plans with an unknown (or no) easing move linearly.
+EASINGS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    "linear": _linear,
+    "ease_in": _ease_in,
+    "ease_out": _ease_out,
+    "ease_in_out": _ease_in_out,
+}
+
+
+class FrameState(NamedTuple):
+    """Everything the renderer needs to know about one frame."""
+
+    offset: Tuple[int, int]
+    scale: Tuple[float, float]
+    variant: Optional[str]
+
+
+class Timeline:
+    """Per-frame transforms for a whole animation, stored as arrays.
+
+    Attributes:
+        total_frames: Number of frames.
+        fps: Frames per second.
+        offset_x, offset_y: Root offset in pixels for each frame.
+        scale_x, scale_y: Root scale factor for each frame.
+        variant_index: Index into `variant_names` per frame, -1 for none.
+        variant_names: Names of the variants used by swap_image actions.
+    """
+
+    def __init__(self, total_frames: int, fps: int) -> None:
+        self.total_frames = total_frames
+        self.fps = fps
+        self.offset_x = np.zeros(total_frames, dtype=np.int64)
+        self.offset_y = np.zeros(total_frames, dtype=np.int64)
+        self.scale_x = np.ones(total_frames, dtype=np.float64)
+        self.scale_y = np.ones(total_frames, dtype=np.float64)
+        self.variant_index = np.full(total_frames, -1, dtype=np.int64)
+        self.variant_names: List[str] = []
+
+    def __len__(self) -> int:
+        return self.total_frames
+
+    def frame(self, f: int) -> FrameState:
+        """Return the transforms for frame `f`."""
+        vi = int(self.variant_index[f])
+        return FrameState(
+            offset=(int(self.offset_x[f]), int(self.offset_y[f])),
+            scale=(float(self.scale_x[f]), float(self.scale_y[f])),
+            variant=self.variant_names[vi] if vi >= 0 else None,
+        )
+
+    def __iter__(self) -> Iterator[FrameState]:
+        for f in range(self.total_frames):
+            yield self.frame(f)
+
+
+def _check_number(value: Any, what: str) -> None:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{what} must be a number, got {value!r}")
+
+
+def _check_pair(value: Any, what: str) -> None:
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError(f"{what} must be a pair of numbers, got {value!r}")
+    for v in value:
+        _check_number(v, what)
+
+
+def plan_timing(plan: Dict[str, Any]) -> Tuple[int, int]:
+    """Work out (total_frames, fps) for a plan, using the usual defaults."""
+    # Get how long the animation should be and how smooth (frames per second)
+    duration_ms = plan.get("duration_ms", 1000)
+    fps = plan.get("fps", 12)
+    total_frames = max(1, int(duration_ms / 1000 * fps))
+    return total_frames, fps
+
+
+def validate_plan(plan: Dict[str, Any]) -> None:
+    """Check that a plan has the shapes the renderer expects.
+
+    Raises:
+        ValueError: Describing the first problem found.
+    """
+    if not isinstance(plan, dict):
+        raise ValueError("plan must be a dict")
+    _check_number(plan.get("duration_ms", 1000), "duration_ms")
+    _check_number(plan.get("fps", 12), "fps")
+    if plan.get("fps", 12) <= 0:
+        raise ValueError("fps must be positive")
+    actions = plan.get("actions", [])
+    if not isinstance(actions, list):
+        raise ValueError("actions must be a list")
+    for i, act in enumerate(actions):
+        where = f"actions[{i}]"
+        if not isinstance(act, dict) or "type" not in act:
+            raise ValueError(f"{where} must be a dict with a 'type'")
+        for key in ("start_frame", "end_frame"):
+            if key in act:
+                _check_number(act[key], f"{where}.{key}")
+        for key in ("start_offset", "end_offset", "start_scale", "end_scale"):
+            if key in act:
+                _check_pair(act[key], f"{where}.{key}")
+
+
+def compile_plan(plan: Dict[str, Any], variants: Optional[Iterable[str]] = None) -> Timeline:
+    """Validate a plan and work out the transforms of every frame.
+
+    The result is exactly what the old frame-by-frame loop computed:
+    offsets from all active translate actions are added up (each one
+    rounded towards zero), scales are multiplied, and the last active
+    swap_image action in the list picks the variant.
+
+    Args:
+        plan: The animation plan (see animator.render_animation_from_plan).
+        variants: Names of the variants that could be loaded. swap_image
+            actions for other variants are ignored. None allows all.
+
+    Returns:
+        The compiled Timeline.
+
+    Raises:
+        ValueError: If the plan is malformed.
+    """
+    validate_plan(plan)
+    total_frames, fps = plan_timing(plan)
+    timeline = Timeline(total_frames, fps)
+    allowed = None if variants is None else set(variants)
+    names: Dict[str, int] = {}
+
+    for act in plan.get("actions", []):
+        sf, ef = act.get("start_frame", 0), act.get("end_frame", total_frames)
+        # The frames this action is active on: sf <= f <= ef, inside the animation
+        lo, hi = max(0, int(np.ceil(sf))), min(total_frames - 1, int(np.floor(ef)))
+        if lo > hi:
+            continue
+        frames = np.arange(lo, hi + 1)
+        sl = slice(lo, hi + 1)
+        kind = act["type"]
+        if kind == "swap_image":
+            vname = act.get("variant")
+            if vname and (allowed is None or vname in allowed):
+                timeline.variant_index[sl] = names.setdefault(vname, len(names))
+            continue
+        if act.get("part") != "root" or kind not in ("translate", "scale"):
+            continue
+        t = (frames - sf) / max(1, (ef - sf))
+        t = EASINGS.get(act.get("easing") or "linear", _linear)(t)
+        if kind == "translate":
+            so = act.get("start_offset", [0, 0])
+            eo = act.get("end_offset", [0, 0])
+            timeline.offset_x[sl] += np.trunc(so[0] + (eo[0] - so[0]) * t).astype(np.int64)
+            timeline.offset_y[sl] += np.trunc(so[1] + (eo[1] - so[1]) * t).astype(np.int64)
+        else:
+            ss = act.get("start_scale", [1.0, 1.0])
+            es = act.get("end_scale", [1.0, 1.0])
+            timeline.scale_x[sl] *= ss[0] + (es[0] - ss[0]) * t
+            timeline.scale_y[sl] *= ss[1] + (es[1] - ss[1]) * t
+
+    timeline.variant_names = sorted(names, key=names.get)
+    return timeline
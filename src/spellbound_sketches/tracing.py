@@ -0,0 +1,272 @@
+"""Measure how long each stage of the pipeline takes.
+
+Code marks a stage with a span:
+
+    with tracing.span("render.compose", frame=i) as sp:
+        ...
+        sp.set(cached=True)
+
+or wraps a whole function with @tracing.traced("preprocess.remove_background").
+Functions that catch their own errors (and return None) call
+tracing.record_error(e), so the failure still shows up on the span.
+
+Tracing is off by default. Then span() hands back one shared do-nothing
+object and nothing is measured or stored, so leaving spans in hot loops
+costs (almost) nothing. Turn it on with enable(); finished spans can be
+written as JSON lines or in the Chrome trace-event format (open it in
+chrome://tracing or https://ui.perfetto.dev).
+
+Hooks (Tracer.add_hook) are called when spans start and end, so other
+tools can measure more per stage (see memprofile).
+"""
+
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_ids = itertools.count(1)
+_current: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("spellbound_span", default=None)
+
+
+class Span:
+    """One timed stage.
+
+    Attributes:
+        name: Stage name, like "preprocess.remove_background".
+        id, parent_id: Span ids; parent_id is the span this one ran inside.
+        start_ns, end_ns: time.perf_counter_ns() at the start and end.
+        thread_id: The thread it ran on.
+        attributes: Extra details (sizes, cache hits, errors...).
+        error: Set when the stage failed.
+    """
+
+    __slots__ = ("name", "id", "parent_id", "start_ns", "end_ns", "thread_id", "attributes", "error",
+                 "_tracer", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.id = next(_ids)
+        parent = _current.get()
+        self.parent_id = parent.id if parent is not None else None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.thread_id = threading.get_ident()
+        self.start_ns = self.end_ns = 0
+        self._tracer = tracer
+        self._token: Optional[contextvars.Token] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set(self, **attributes: Any) -> None:
+        """Add details to the span."""
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        self._tracer._started(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end_ns = time.perf_counter_ns()
+        if exc is not None and self.error is None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _current.reset(self._token)
+        self._tracer._finished(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "id": self.id, "parent_id": self.parent_id, "start_ns": self.start_ns,
+                "duration_ms": self.duration_ms, "thread_id": self.thread_id, "error": self.error,
+                "attributes": self.attributes}
+
+
+class _NoopSpan:
+    """What span() returns while tracing is off."""
+
+    __slots__ = ()
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Tracer:
+    """Collects finished spans and calls hooks.
+
+    Args:
+        max_spans: Most spans kept; later ones are counted in `dropped`
+            but not stored (hooks still see them).
+    """
+
+    def __init__(self, max_spans: int = 100_000) -> None:
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self._hooks: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def add_hook(
+        self,
+        on_start: Optional[Callable[[Span], None]] = None,
+        on_end: Optional[Callable[[Span], None]] = None,
+    ) -> None:
+        """Call `on_start(span)` / `on_end(span)` around every span.
+
+        on_start runs before the span's clock starts and on_end after it
+        stops, so the hooks' own work is not counted in the span.
+        """
+        self._hooks.append((on_start, on_end))
+
+    def remove_hook(
+        self,
+        on_start: Optional[Callable[[Span], None]] = None,
+        on_end: Optional[Callable[[Span], None]] = None,
+    ) -> None:
+        """Stop calling hooks added with the same `add_hook` arguments.
+
+        Raises:
+            ValueError: If no such hooks were added.
+        """
+        with self._lock:
+            hooks = list(self._hooks)  # A new list, so spans running right now keep their own
+            hooks.remove((on_start, on_end))
+            self._hooks = hooks
+
+    def _started(self, span: Span) -> None:
+        for on_start, _ in self._hooks:
+            if on_start is not None:
+                on_start(span)
+
+    def _finished(self, span: Span) -> None:
+        for _, on_end in self._hooks:
+            if on_end is not None:
+                on_end(span)
+        with self._lock:
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Count, total and longest milliseconds per span name."""
+        totals: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            entry = totals.setdefault(span.name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0})
+            entry["count"] += 1
+            entry["total_ms"] += span.duration_ms
+            entry["max_ms"] = max(entry["max_ms"], span.duration_ms)
+            entry["errors"] += span.error is not None
+        return totals
+
+    def export(self, path: str | Path) -> Path:
+        """Write the spans; ".jsonl" files get JSON lines, anything else a Chrome trace."""
+        path = Path(path)
+        with self._lock:
+            spans = list(self.spans)
+        if path.suffix == ".jsonl":
+            write_jsonl(spans, path)
+        else:
+            write_chrome_trace(spans, path)
+        return path
+
+
+def write_jsonl(spans: Iterable[Span], path: str | Path) -> None:
+    """Write spans as JSON lines, one span per line."""
+    with open(path, "w", encoding="utf-8") as fh:
+        for span in spans:
+            fh.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+
+def write_chrome_trace(spans: Iterable[Span], path: str | Path) -> None:
+    """Write spans in the Chrome trace-event format ("X" complete events)."""
+    pid = os.getpid()
+    events = []
+    for span in spans:
+        args = dict(span.attributes)
+        if span.error is not None:
+            args["error"] = span.error
+        events.append({"name": span.name, "cat": span.name.split(".")[0], "ph": "X", "pid": pid,
+                       "tid": span.thread_id, "ts": span.start_ns / 1000, "dur": (span.end_ns - span.start_ns) / 1000,
+                       "args": args})
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fh, default=str)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def enable(tracer: Optional[Tracer] = None) -> Tracer:
+    """Start tracing (with a new Tracer unless one is given) and return the tracer."""
+    global _tracer
+    _tracer = tracer if tracer is not None else Tracer()
+    return _tracer
+
+
+def disable() -> Optional[Tracer]:
+    """Stop tracing; returns the tracer that was active, if any."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def span(name: str, **attributes: Any) -> Any:
+    """A span for a `with` block; a shared do-nothing span while tracing is off."""
+    tracer = _tracer
+    if tracer is None:
+        return _NOOP
+    return Span(tracer, name, attributes)
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Decorator that runs the whole function inside a span."""
+
+    def decorate(fn: F) -> F:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            tracer = _tracer
+            if tracer is None:
+                return fn(*args, **kwargs)
+            with Span(tracer, name, {}):
+                return fn(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def set_attributes(**attributes: Any) -> None:
+    """Add details to the span that is running now (if tracing is on)."""
+    current = _current.get() if _tracer is not None else None
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def record_error(error: BaseException) -> None:
+    """Mark the span that is running now as failed (for errors that are caught)."""
+    current = _current.get() if _tracer is not None else None
+    if current is not None and current.error is None:
+        current.error = f"{type(error).__name__}: {error}"
@@ -0,0 +1,291 @@
+"""A long-lived text-to-speech service.
+
+Starting a pyttsx3 engine is slow, and two engines talking at once fight
+over the sound driver. TTSService starts one engine, on one worker
+thread, and feeds it lines to speak through a queue. Lines that are
+still waiting (or being spoken) can be cancelled.
+
+With `presynthesize=True`, lines are first rendered to WAV files and
+kept on disk, keyed by (text, voice, rate). A line that was said before
+is then just played back, without starting the engine at all. If no
+WAV player is available, the engine speaks directly instead.
+
+The engine is made by `driver_factory` (pyttsx3.init by default), so
+tests can pass a stub with the same methods (say, runAndWait, stop,
+setProperty, save_to_file).
+"""
+
+import hashlib
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from spellbound_sketches.artifact_cache import default_cache_root
+from spellbound_sketches.tracing import span
+
+logger = logging.getLogger("spellbound_sketches.tts")
+
+# Bump this when the way lines are synthesized changes, so old WAV files are ignored
+TTS_CACHE_VERSION = 1
+
+
+def default_cache_dir() -> Path:
+    """Folder for synthesized voice lines (SPELLBOUND_CACHE_DIR or ~/.cache/spellbound_sketches)."""
+    return default_cache_root() / "tts"
+
+
+def default_driver() -> Any:
+    """Start the system TTS engine."""
+    import pyttsx3  # Only loaded when something is actually spoken
+
+    return pyttsx3.init()  # Looked up on every call, so tests can swap pyttsx3.init
+
+
+def find_wav_player() -> Optional[Callable[[Path], Any]]:
+    """Find a way to play a WAV file on this computer.
+
+    Returns:
+        A function that starts playing a file and returns something with
+        wait() and terminate() (a subprocess), or None if there is none.
+    """
+    if sys.platform == "win32":
+        import winsound
+
+        class _WinsoundPlayback:
+            def __init__(self, path: Path) -> None:
+                self.path = path
+
+            def wait(self) -> None:
+                winsound.PlaySound(str(self.path), winsound.SND_FILENAME)  # Returns when done
+
+            def terminate(self) -> None:
+                winsound.PlaySound(None, winsound.SND_PURGE)
+
+        return lambda path: _WinsoundPlayback(path)
+    for command in ("afplay", "paplay", "aplay"):
+        exe = shutil.which(command)
+        if exe:
+            quiet = ["-q"] if command == "aplay" else []
+            return lambda path, exe=exe, quiet=quiet: subprocess.Popen(
+                [exe, *quiet, str(path)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return None
+
+
+class Utterance:
+    """One line given to the service.
+
+    Attributes:
+        text: What to say.
+        cancelled: Whether it was cancelled before it finished.
+        error: The exception that stopped it, if any.
+        cached: Whether it was played from a synthesized WAV file that
+            already existed.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.cancelled = False
+        self.error: Optional[Exception] = None
+        self.cached = False
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the line is spoken, cancelled or failed.
+
+        Returns:
+            True if it finished within the timeout.
+        """
+        return self._done.wait(timeout)
+
+
+class TTSService:
+    """Speak lines one after another on a single, reused engine.
+
+    Args:
+        driver_factory: Makes the engine; called once, on the worker
+            thread. Defaults to pyttsx3.init.
+        voice: Optional voice id to use.
+        rate: Optional speaking rate (words per minute).
+        presynthesize: If True, lines are rendered to cached WAV files
+            and played from there.
+        cache_dir: Where WAV files are kept. Defaults to default_cache_dir().
+        wav_player: Function that starts playing a WAV file (see
+            find_wav_player). Found automatically when not given.
+    """
+
+    def __init__(
+        self,
+        driver_factory: Callable[[], Any] = default_driver,
+        voice: Optional[str] = None,
+        rate: Optional[int] = None,
+        presynthesize: bool = False,
+        cache_dir: Optional[str | Path] = None,
+        wav_player: Optional[Callable[[Path], Any]] = None,
+    ) -> None:
+        self.driver_factory = driver_factory
+        self.voice = voice
+        self.rate = rate
+        self.presynthesize = presynthesize
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else default_cache_dir()
+        self.wav_player = wav_player if wav_player is not None else (find_wav_player() if presynthesize else None)
+        self._queue: "queue.Queue[Optional[Utterance]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._driver: Any = None
+        self._current: Optional[Utterance] = None
+        self._playback: Any = None  # The WAV playback in progress, if any
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def say(self, text: str) -> Utterance:
+        """Queue a line to be spoken and return at once.
+
+        Raises:
+            RuntimeError: If the service was closed.
+        """
+        utterance = Utterance(str(text))
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("TTS service is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="tts-worker", daemon=True)
+                self._thread.start()
+            self._queue.put(utterance)
+        return utterance
+
+    def cancel(self) -> None:
+        """Drop every waiting line and stop the one being spoken."""
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is None:
+                self._queue.put(None)  # Keep the shutdown request
+                break
+            pending.cancelled = True
+            pending._done.set()
+        with self._lock:
+            current, playback, driver = self._current, self._playback, self._driver
+        if current is not None:
+            current.cancelled = True
+            try:
+                if playback is not None:
+                    playback.terminate()
+                elif driver is not None:
+                    driver.stop()
+            except Exception as e:
+                logger.warning(f"Could not stop speech: {e}")
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Cancel everything and stop the worker thread."""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        self.cancel()
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def cache_path(self, text: str) -> Path:
+        """Where the WAV file for a line (with this voice and rate) is kept."""
+        key = f"{text}\n{self.voice}\n{self.rate}\nv{TTS_CACHE_VERSION}"
+        return self.cache_dir / f"{hashlib.sha256(key.encode()).hexdigest()}.wav"
+
+    def _engine(self) -> Any:
+        if self._driver is None:
+            driver = self.driver_factory()
+            if self.voice is not None:
+                driver.setProperty("voice", self.voice)
+            if self.rate is not None:
+                driver.setProperty("rate", self.rate)
+            with self._lock:
+                self._driver = driver
+        return self._driver
+
+    def _synthesize(self, text: str, path: Path) -> None:
+        """Render a line to a WAV file (through a temporary name)."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".wav.tmp")
+        os.close(fd)
+        try:
+            engine = self._engine()
+            engine.save_to_file(text, tmp)
+            engine.runAndWait()
+            if os.path.getsize(tmp) == 0:
+                raise RuntimeError("the TTS engine wrote an empty file")
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _speak(self, utterance: Utterance) -> None:
+        if self.presynthesize and self.wav_player is not None:
+            path = self.cache_path(utterance.text)
+            if path.is_file():
+                utterance.cached = True
+            else:
+                self._synthesize(utterance.text, path)
+            if utterance.cancelled:
+                return
+            playback = self.wav_player(path)
+            with self._lock:
+                self._playback = playback
+            try:
+                playback.wait()
+            finally:
+                with self._lock:
+                    self._playback = None
+            return
+        engine = self._engine()
+        engine.say(utterance.text)
+        engine.runAndWait()
+
+    def _run(self) -> None:
+        while True:
+            utterance = self._queue.get()
+            if utterance is None:
+                return
+            if utterance.cancelled:
+                continue
+            with self._lock:
+                self._current = utterance
+            try:
+                with span("tts.speak", chars=len(utterance.text)) as sp:
+                    self._speak(utterance)
+                    sp.set(cached=utterance.cached, cancelled=utterance.cancelled)
+            except Exception as e:
+                logger.error(f"Error with text-to-speech: {e}")
+                utterance.error = e
+                with self._lock:
+                    self._driver = None  # Start a fresh engine next time
+            finally:
+                with self._lock:
+                    self._current = None
+                utterance._done.set()
+
+
+_service: Optional[TTSService] = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> TTSService:
+    """The shared TTS service used by the player (made on first use).
+
+    Setting SPELLBOUND_TTS_CACHE=1 turns on pre-synthesis for it.
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TTSService(presynthesize=os.environ.get("SPELLBOUND_TTS_CACHE") == "1")
+        return _service
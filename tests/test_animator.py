@@ -24,3 +24,83 @@ def test_render_animation_from_plan(tmp_path):
     result = animator.render_animation_from_plan(plan, str(char_path), out_gif=str(out_gif))
     assert result == str(out_gif)
     assert os.path.exists(out_gif)
+
+def test_render_animation_collapse_duplicates(tmp_path):
+    # Frames 0-1 and 6-9 are idle, so they collapse into longer frames
+    plan = {
+        "duration_ms": 1000,
+        "fps": 10,
+        "actions": [
+            {"type": "translate", "part": "root", "start_frame": 2, "end_frame": 5, "start_offset": [0, 0], "end_offset": [0, -3]},
+        ],
+        "variants": {}
+    }
+    char_path = tmp_path / "char.png"
+    Image.new("RGBA", (10, 10), (255, 0, 0, 255)).save(char_path)
+    out_gif = tmp_path / "out.gif"
+    result = animator.render_animation_from_plan(plan, str(char_path), out_gif=str(out_gif), collapse_duplicates=True)
+    assert result == str(out_gif)
+    with Image.open(out_gif) as im:
+        durations = []
+        for i in range(im.n_frames):
+            im.seek(i)
+            durations.append(im.info["duration"])
+    assert sum(durations) == 1000
+    assert len(durations) < 10
+
+def test_iter_animation_frames_streams(tmp_path):
+    char_path = tmp_path / "char.png"
+    Image.new("RGBA", (10, 10), (255, 0, 0, 255)).save(char_path)
+    frames = animator.iter_animation_frames({"duration_ms": 500, "fps": 10}, str(char_path))
+    assert not isinstance(frames, list)
+    sizes = [frame.size for frame in frames]
+    assert sizes == [(10, 10)] * 5
+
+@pytest.mark.parametrize("name,fmt", [("out.webp", "WEBP"), ("out.png", "PNG"), ("out.anim", "PNG")])
+def test_render_picks_encoder_from_extension_or_argument(tmp_path, name, fmt):
+    plan = {"duration_ms": 300, "fps": 10, "variants": {}, "actions": [
+        {"type": "translate", "part": "root", "start_frame": 0, "end_frame": 3, "start_offset": [0, 0], "end_offset": [0, -3]}]}
+    char_path = tmp_path / "char.png"
+    Image.new("RGBA", (10, 10), (255, 0, 0, 200)).save(char_path)
+    encoder = "apng" if name.endswith(".anim") else None
+    result = animator.render_animation_from_plan(plan, char_path, out_gif=tmp_path / name, encoder=encoder)
+    with Image.open(result) as im:
+        assert im.format == fmt and im.n_frames == 3
+
+def test_iter_animation_frames_resolution_and_step(tmp_path):
+    char_path = tmp_path / "char.png"
+    Image.new("RGBA", (40, 20), (255, 0, 0, 255)).save(char_path)
+    plan = {"duration_ms": 1000, "fps": 10, "actions": [
+        {"type": "translate", "part": "root", "start_frame": 0, "end_frame": 9, "start_offset": [0, 0], "end_offset": [20, 0]}]}
+    frames = list(animator.iter_animation_frames(plan, char_path, resolution=0.5, frame_step=3))
+    assert [f.size for f in frames] == [(20, 10)] * 4  # Frames 0, 3, 6 and 9
+    assert frames[-1].getbbox() == (10, 0, 20, 10)  # Moved 20 * 0.5 pixels
+    with pytest.raises(ValueError):
+        next(animator.iter_animation_frames(plan, char_path, resolution=2))
+
+def test_render_preview_is_small_and_quick(tmp_path):
+    import time
+    from spellbound_sketches.adapter import canned_plan_for_animation
+    char_path = tmp_path / "char.png"
+    Image.new("RGBA", (1024, 1024), (255, 0, 0, 255)).save(char_path)
+    plan = canned_plan_for_animation()
+    plan["fps"] = 24
+    started = time.perf_counter()
+    result = animator.render_preview(plan, char_path, out_gif=tmp_path / "preview.gif")
+    assert time.perf_counter() - started < 1.0
+    with Image.open(result) as im:
+        assert im.size == (256, 256)
+        assert len(im.convert("RGBA").getcolors()) <= 33  # 32 colours and transparency
+        durations = []
+        for i in range(im.n_frames):
+            im.seek(i)
+            durations.append(im.info["duration"])
+    assert len(durations) <= plan["duration_ms"] * 8 // 1000  # At most 8 frames a second
+    assert sum(durations) == pytest.approx(plan["duration_ms"], abs=50)
+
+def test_render_preview_keeps_small_drawings_visible(tmp_path):
+    char_path = tmp_path / "char.png"
+    Image.new("RGBA", (200, 100), (255, 0, 0, 255)).save(char_path)
+    result = animator.render_preview({"duration_ms": 200, "fps": 10}, char_path, out_gif=tmp_path / "p.gif")
+    with Image.open(result) as im:
+        assert im.size == (128, 64)
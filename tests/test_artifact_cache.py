@@ -0,0 +1,92 @@
+import os
+import sys
+import pytest
+from PIL import Image
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import preprocess
+from spellbound_sketches.artifact_cache import ArtifactCache
+
+def make_drawing(path):
+    img = Image.new("RGBA", (20, 20), (255, 255, 255, 255))
+    img.paste((0, 0, 0, 255), (5, 5, 15, 15))
+    img.save(path)
+
+def test_cache_put_get_and_counters(tmp_path):
+    src = tmp_path / "in.txt"
+    src.write_text("hello")
+    cache = ArtifactCache(tmp_path / "cache")
+    key = cache.key(src, op="test", threshold=1)
+    assert key != cache.key(src, op="test", threshold=2)
+    assert cache.get(key) is None
+    stored = cache.put(key, {"out.txt": src})
+    assert cache.get(key) == stored
+    assert stored["out.txt"].read_text() == "hello"
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache", max_bytes=10_000)
+    keys = []
+    for i in range(3):
+        src = tmp_path / f"in{i}.bin"
+        src.write_bytes(bytes([i]) * 4000)
+        keys.append(cache.key(src))
+        cache.put(keys[-1], {"data.bin": src})
+        os.utime(cache.root / keys[-1][:2] / keys[-1] / "manifest.json", (i, i))
+    cache.evict()
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) is not None
+
+def test_remove_background_cache_hit_skips_processing(tmp_path, monkeypatch):
+    make_drawing(tmp_path / "in.png")
+    cache = ArtifactCache(tmp_path / "cache")
+    first = preprocess.remove_background(tmp_path / "in.png", tmp_path / "a.png", cache=cache)
+    monkeypatch.setattr("PIL.Image.open", lambda *a, **kw: 1 / 0)
+    second = preprocess.remove_background(tmp_path / "in.png", tmp_path / "b.png", cache=cache)
+    assert second == str(tmp_path / "b.png")
+    assert (tmp_path / "a.png").read_bytes() == (tmp_path / "b.png").read_bytes()
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert first is not None
+
+def test_export_parts_cache_hit(tmp_path):
+    make_drawing(tmp_path / "char.png")
+    cache = ArtifactCache(tmp_path / "cache")
+    first = preprocess.export_parts(tmp_path / "char.png", tmp_path / "p1", cache=cache)
+    second = preprocess.export_parts(tmp_path / "char.png", tmp_path / "p2", cache=cache)
+    assert cache.hits == 1
+    assert set(second) == {"head", "body", "left_wing", "right_wing"}
+    for name in first:
+        with open(first[name], "rb") as a, open(second[name], "rb") as b:
+            assert a.read() == b.read()
+
+
+def test_engine_is_part_of_the_cache_key(tmp_path):
+    pytest.importorskip("cv2")
+    Image.new("RGBA", (8, 8), (200, 200, 200, 255)).save(tmp_path / "in.png")
+    cache = ArtifactCache(tmp_path / "cache")
+    preprocess.remove_background(tmp_path / "in.png", tmp_path / "a.png", cache=cache)
+    preprocess.remove_background(tmp_path / "in.png", tmp_path / "b.png", cache=cache, engine="opencv")
+    assert cache.hits == 0
+
+
+def test_put_replaces_an_incomplete_entry(tmp_path):
+    src = tmp_path / "in.txt"
+    src.write_text("hello")
+    cache = ArtifactCache(tmp_path / "cache")
+    key = cache.key(src)
+    cache.put(key, {"out.txt": src, "more.txt": src})
+    (cache.root / key[:2] / key / "more.txt").unlink()  # Cut short, e.g. by a crash
+    assert cache.get(key) is None
+    stored = cache.put(key, {"out.txt": src, "more.txt": src})
+    assert all(p.read_text() == "hello" for p in stored.values())
+    assert cache.get(key) == stored
+
+
+def test_put_keeps_an_entry_bigger_than_the_limit(tmp_path):
+    src = tmp_path / "in.bin"
+    src.write_bytes(b"x" * 4000)
+    cache = ArtifactCache(tmp_path / "cache", max_bytes=1000)
+    stored = cache.put(cache.key(src), {"data.bin": src})
+    assert stored["data.bin"].read_bytes() == src.read_bytes()
+    src.write_bytes(b"y" * 10)
+    cache.put(cache.key(src), {"data.bin": src})
+    assert not stored["data.bin"].exists()  # Dropped by the next put, as the oldest
@@ -0,0 +1,64 @@
+import sys
+import os
+import json
+from PIL import Image, ImageDraw
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import atlas, preprocess, animator
+
+
+def make_character(path):
+    img = Image.new("RGBA", (120, 100), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((45, 8, 75, 32), fill=(200, 50, 50, 255))  # Head
+    draw.rectangle((35, 30, 85, 70), fill=(40, 120, 200, 255))  # Body
+    draw.polygon([(5, 40), (38, 35), (38, 55)], fill=(50, 180, 60, 255))  # Left wing
+    img.save(path)
+    return img
+
+
+def test_atlas_parts_match_separate_pngs(tmp_path):
+    make_character(tmp_path / "char.png")
+    separate = preprocess.export_parts(tmp_path / "char.png", tmp_path / "sep")
+    packed = preprocess.export_parts(tmp_path / "char.png", tmp_path / "atl", atlas=True)
+    assert set(packed) == {"atlas", "manifest"}
+    assert sorted(os.listdir(tmp_path / "atl")) == ["atlas.json", "atlas.png"]
+    loaded = atlas.load_atlas(tmp_path / "atl")
+    for name, path in separate.items():
+        with Image.open(path) as im:
+            assert loaded.cell_image(name).tobytes() == im.tobytes()
+
+
+def test_atlas_is_tight_and_records_offsets(tmp_path):
+    img = make_character(tmp_path / "char.png")
+    packed, manifest = atlas.pack_parts(img, preprocess.PART_LAYOUT)
+    separate_area = 0
+    for fractions in preprocess.PART_LAYOUT.values():
+        x0, y0, x1, y1 = atlas._cell_box(img.size, fractions)
+        separate_area += (x1 - x0) * (y1 - y0)
+    assert packed.width * packed.height < separate_area
+    head = manifest["parts"]["head"]
+    x, y, w, h = head["box"]
+    ox, oy = head["offset"]
+    assert packed.crop((x, y, x + w, y + h)).tobytes() == img.crop((ox, oy, ox + w, oy + h)).tobytes()
+    json.dumps(manifest)  # Plain JSON types only
+
+
+def test_atlas_handles_empty_parts(tmp_path):
+    img = Image.new("RGBA", (40, 40), (0, 0, 0, 0))
+    img.paste((255, 0, 0, 255), (15, 15, 25, 25))
+    atlas.write_atlas(img, tmp_path, preprocess.PART_LAYOUT)
+    loaded = atlas.load_atlas(tmp_path)
+    assert loaded.get("left_wing") is None
+    assert loaded.cell_image("left_wing").getbbox() is None
+    assert loaded.get("body") is not None
+
+
+def test_animator_loads_atlas_and_old_names(tmp_path):
+    make_character(tmp_path / "char.png")
+    preprocess.export_parts(tmp_path / "char.png", tmp_path / "atl", atlas=True)
+    assert set(animator.load_parts(tmp_path / "atl")) == {"head", "body", "left_wing", "right_wing"}
+    old = tmp_path / "old"
+    old.mkdir()
+    Image.new("RGBA", (4, 4)).save(old / "leftwing.png")
+    Image.new("RGBA", (4, 4)).save(old / "head.png")
+    assert set(animator.load_parts(old)) == {"head", "left_wing"}
@@ -0,0 +1,70 @@
+import sys
+import os
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import background, preprocess
+
+needs_cv2 = pytest.mark.skipif(background.resolve_engine_name("opencv") != "opencv", reason="OpenCV not installed")
+
+
+def phone_photo():
+    """Grey paper that gets lighter to the right, with a ring drawn on it."""
+    rng = np.random.default_rng(1)
+    xx = np.linspace(0, 1, 200)[None, :, None]
+    paper = 150 + 60 * xx + rng.normal(0, 3, (150, 200, 3))
+    img = Image.fromarray(np.clip(paper, 0, 255).astype(np.uint8)).convert("RGBA")
+    draw = ImageDraw.Draw(img)
+    # A dark outline with almost-white paper inside it (like the white of an eye)
+    draw.ellipse((50, 25, 150, 125), outline=(20, 20, 20), width=4, fill=(245, 245, 245))
+    draw.point((10, 10), fill=(0, 0, 0))  # A speck of dirt
+    return np.array(img)
+
+
+def test_numpy_engine_matches_fixed_threshold():
+    arr = np.random.default_rng(0).integers(200, 256, size=(20, 30, 4), dtype=np.uint8)
+    alpha = background.numpy_alpha(arr, 240)
+    expected = ~((arr[:, :, 0] > 240) & (arr[:, :, 1] > 240) & (arr[:, :, 2] > 240))
+    assert (alpha == expected * 255).all()
+
+
+@needs_cv2
+def test_opencv_engine_handles_grey_uneven_paper():
+    arr = phone_photo()
+    alpha = background.opencv_alpha(arr)
+    assert alpha.shape == arr.shape[:2] and alpha.dtype == np.uint8
+    assert alpha[5, 5] == 0 and alpha[140, 195] == 0  # Dark and light paper both removed
+    assert alpha[75, 100] == 255  # White inside the outline stays
+    assert alpha[10, 10] == 0  # The speck is cleaned away
+    # The fixed threshold keeps the grey paper and removes the inside instead
+    fixed = background.numpy_alpha(arr)
+    assert fixed[5, 5] == 255 and fixed[75, 100] == 0
+
+
+@needs_cv2
+def test_opencv_engine_feathers_edges():
+    arr = phone_photo()
+    soft = background.opencv_alpha(arr, feather=1.5)
+    hard = background.opencv_alpha(arr, feather=0)
+    assert set(np.unique(hard)) <= {0, 255}
+    assert ((soft > 0) & (soft < 255)).any()
+
+
+def test_unknown_engine_raises():
+    with pytest.raises(ValueError):
+        background.get_engine("magic")
+
+
+def test_opencv_falls_back_to_numpy_without_cv2(monkeypatch):
+    monkeypatch.setitem(sys.modules, "cv2", None)  # Makes "import cv2" fail
+    assert background.resolve_engine_name("opencv") == "numpy"
+    assert background.get_engine("opencv") is background.numpy_alpha
+
+
+@needs_cv2
+def test_remove_background_with_opencv_engine(tmp_path):
+    Image.fromarray(phone_photo()).save(tmp_path / "photo.png")
+    out = preprocess.remove_background(tmp_path / "photo.png", tmp_path / "char.png", engine="opencv")
+    alpha = np.asarray(Image.open(out))[:, :, 3]
+    assert alpha[5, 5] == 0 and alpha[75, 100] == 255
@@ -0,0 +1,55 @@
+import json
+import os
+import sys
+import pytest
+from PIL import Image
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import batch
+
+PLAN = {"duration_ms": 200, "fps": 5, "actions": [], "variants": {}}
+
+def write_manifest(tmp_path, items):
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text("\n".join(json.dumps(item) for item in items) + "\n")
+    return manifest
+
+def make_drawing(path):
+    img = Image.new("RGBA", (20, 20), (255, 255, 255, 255))
+    img.paste((0, 0, 0, 255), (5, 5, 15, 15))
+    img.save(path)
+
+def test_load_manifest_resolves_paths(tmp_path):
+    manifest = write_manifest(tmp_path, [{"drawing": "a.png", "output": "out/a.gif"}])
+    items = batch.load_manifest(manifest)
+    assert items[0]["drawing"] == str(tmp_path / "a.png")
+    assert items[0]["output"] == str(tmp_path / "out" / "a.gif")
+    assert items[0]["onboarding"] == {}
+
+def test_load_manifest_rejects_missing_output(tmp_path):
+    manifest = write_manifest(tmp_path, [{"drawing": "a.png"}])
+    with pytest.raises(ValueError):
+        batch.load_manifest(manifest)
+
+def test_run_batch_isolates_failures_and_resumes(tmp_path):
+    make_drawing(tmp_path / "good.png")
+    manifest = write_manifest(tmp_path, [
+        {"id": "good", "drawing": "good.png", "plan": PLAN, "output": "out/good.gif"},
+        {"id": "missing", "drawing": "missing.png", "plan": PLAN, "output": "out/missing.gif"},
+    ])
+    summary = batch.run_batch(manifest, workers=1)
+    assert (summary["total"], summary["ok"], summary["failed"]) == (2, 1, 1)
+    assert summary["failures"][0]["id"] == "missing"
+    assert (tmp_path / "out" / "good.gif").exists()
+
+    again = batch.run_batch(manifest, workers=1)
+    assert again["skipped"] == 1
+    assert again["results"][0]["status"] == "skipped"
+
+def test_run_batch_process_pool(tmp_path):
+    items = []
+    for i in range(3):
+        make_drawing(tmp_path / f"d{i}.png")
+        items.append({"drawing": f"d{i}.png", "plan": PLAN, "output": f"out/d{i}.gif"})
+    summary = batch.run_batch(write_manifest(tmp_path, items), workers=2)
+    assert summary["ok"] == 3
+    assert [r["output"] for r in summary["results"]] == [str(tmp_path / "out" / f"d{i}.gif") for i in range(3)]
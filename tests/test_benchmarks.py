@@ -0,0 +1,44 @@
+import json
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchmarks import suite
+from create_sample_image import make_drawing
+
+
+def test_make_drawing_scales():
+    small, big = make_drawing(256), make_drawing(512, extra_shapes=5, seed=1)
+    assert small.size == (256, 256) and big.size == (512, 512)
+    assert small.getpixel((128, 128)) == (255, 255, 200, 255)  # Inside the face
+
+
+def test_make_plan_has_requested_actions():
+    plan = suite.make_plan(fps=10, duration_ms=1000, actions=7)
+    assert len(plan["actions"]) == 7
+    assert all(0 <= a["start_frame"] < a["end_frame"] <= 10 for a in plan["actions"])
+
+
+def test_run_and_compare(tmp_path, capsys):
+    report = suite.run_suite([64], [5], [400], [2], repeat=1, log=None)
+    assert {"remove_background/64", "export_parts/64", "render/64/fps5/400ms/2act",
+            "decode/64/fps5/400ms/2act"} <= set(report["results"])
+    encodes = {name: r for name, r in report["results"].items() if name.startswith("encode/")}
+    assert {r["params"]["encoder"] for r in encodes.values()} == set(suite.available_encoders())
+    assert all(r["bytes"] > 0 for r in encodes.values())
+    slower = json.loads(json.dumps(report))
+    slower["results"]["render/64/fps5/400ms/2act"]["best"] *= 2
+    rows = {row["name"]: row for row in suite.compare(report, slower, threshold=0.5)}
+    assert rows["render/64/fps5/400ms/2act"]["regression"]
+    assert not rows["remove_background/64"]["regression"]
+    bigger = json.loads(json.dumps(report))
+    bigger["results"]["encode/64/fps5/400ms/gif"]["bytes"] *= 2
+    rows = {row["name"]: row for row in suite.compare(report, bigger)}
+    assert rows["encode/64/fps5/400ms/gif"]["size_ratio"] == 2
+    assert rows["encode/64/fps5/400ms/gif"]["regression"]
+
+    (tmp_path / "base.json").write_text(json.dumps(report))
+    (tmp_path / "now.json").write_text(json.dumps(slower))
+    assert suite.main(["compare", str(tmp_path / "base.json"), str(tmp_path / "base.json")]) == 0
+    assert suite.main(["compare", str(tmp_path / "base.json"), str(tmp_path / "now.json")]) == 1
+    assert "SLOWER" in capsys.readouterr().out
@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+from PIL import Image
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import importprofile
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src'))
+HEAVY_UI = ("tkinter", "_tkinter", "pyttsx3")
+
+# Runs the CLI in a fresh interpreter and reports which modules it loaded
+PROBE = """
+import json, sys
+from spellbound_sketches import cli
+loaded_by_import = sorted(sys.modules)
+sys.argv = ["cli", *json.loads(sys.argv[1])]
+try:
+    cli.app()
+except SystemExit:
+    pass
+print(json.dumps({"import": loaded_by_import, "run": sorted(sys.modules)}))
+"""
+
+
+def probe(args, cwd):
+    env = dict(os.environ, PYTHONPATH=SRC, SPELLBOUND_CACHE_DIR=str(cwd / "cache"))
+    env.pop("SPELLBOUND_API_URL", None)
+    proc = subprocess.run([sys.executable, "-c", PROBE, json.dumps(args)], cwd=cwd, env=env,
+                          capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def test_importing_the_cli_loads_no_pipeline_or_ui(tmp_path):
+    modules = probe(["--help"], tmp_path)["import"]
+    for name in (*HEAVY_UI, "numpy", "PIL", "cv2"):
+        assert name not in modules
+
+
+def test_headless_batch_never_imports_tk_or_tts(tmp_path):
+    img = Image.new("RGBA", (20, 20), (255, 255, 255, 255))
+    img.paste((0, 0, 0, 255), (5, 5, 15, 15))
+    img.save(tmp_path / "d.png")
+    plan = {"duration_ms": 200, "fps": 5, "actions": [], "variants": {}}
+    (tmp_path / "m.jsonl").write_text(json.dumps({"drawing": "d.png", "plan": plan, "output": "d.gif"}) + "\n")
+    modules = probe(["batch", str(tmp_path / "m.jsonl"), "--workers", "1"], tmp_path)["run"]
+    assert (tmp_path / "d.gif").exists()
+    assert "spellbound_sketches.animator" in modules
+    for name in HEAVY_UI:
+        assert name not in modules
+
+
+def test_parse_importtime():
+    text = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       120 |        120 |     numpy.core",
+        "import time:       300 |        420 |   numpy",
+        "INFO:something happened",
+    ])
+    timings, other = importprofile.parse_importtime(text)
+    assert timings == [importprofile.ImportTiming("numpy.core", 120, 120, 2),
+                       importprofile.ImportTiming("numpy", 300, 420, 1)]
+    assert other == ["INFO:something happened"]
+    report = importprofile.format_report(timings)
+    assert "0.4 ms  numpy" in report
+
+
+def test_sketch_background_engine_option(tmp_path, monkeypatch):
+    from typer.testing import CliRunner
+    from spellbound_sketches import cli, preprocess
+    engines = []
+
+    def fake_remove_background(input_path, out_path, cache=None, engine=preprocess.DEFAULT_ENGINE, **kwargs):
+        engines.append(engine)
+        return None  # Makes sketch stop right after this step
+
+    monkeypatch.setenv("SPELLBOUND_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(preprocess, "remove_background", fake_remove_background)
+    runner = CliRunner()
+    assert runner.invoke(cli.app, ["sketch"], input="\n" * 7).exit_code == 0
+    assert runner.invoke(cli.app, ["sketch", "--bg-engine", "opencv"], input="\n" * 7).exit_code == 0
+    assert runner.invoke(cli.app, [], input="\n" * 7).exit_code == 0  # No command runs sketch
+    assert engines == ["numpy", "opencv", "numpy"]
+    assert cli.DEFAULT_BG_ENGINE == preprocess.DEFAULT_ENGINE
@@ -0,0 +1,63 @@
+import os
+import sys
+import numpy as np
+import pytest
+from PIL import Image
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import animator
+from spellbound_sketches.compositor import NumpyCompositor
+
+def random_sprite(rng, size):
+    return Image.fromarray(rng.integers(0, 256, size=(size[1], size[0], 4), dtype=np.uint8), "RGBA")
+
+@pytest.mark.parametrize("pos", [(0, 0), (5, 3), (-7, -4), (20, 25), (40, 40), (-30, 0)])
+def test_paste_matches_pil(pos):
+    rng = np.random.default_rng(0)
+    first, second = random_sprite(rng, (30, 30)), random_sprite(rng, (16, 12))
+    canvas = Image.new("RGBA", (32, 32), (255, 255, 255, 0))
+    canvas.paste(first, (1, 2), first)
+    canvas.paste(second, pos, second)
+    comp = NumpyCompositor((32, 32))
+    comp.paste(first, (1, 2))
+    comp.paste(second, pos)
+    assert comp.to_image().tobytes() == canvas.tobytes()
+
+def test_clear_reuses_buffer():
+    comp = NumpyCompositor((8, 8))
+    buffer = comp.canvas
+    comp.paste(Image.new("RGBA", (8, 8), (1, 2, 3, 255)), (0, 0))
+    frame = comp.to_image()
+    comp.clear()
+    assert comp.canvas is buffer
+    assert frame.getpixel((0, 0)) == (1, 2, 3, 255)
+    assert comp.to_image().getpixel((0, 0)) == (255, 255, 255, 0)
+
+def test_render_backends_produce_identical_gifs(tmp_path):
+    rng = np.random.default_rng(1)
+    char_path = tmp_path / "char.png"
+    random_sprite(rng, (40, 40)).save(char_path)
+    parts_dir = tmp_path / "parts"
+    parts_dir.mkdir()
+    random_sprite(rng, (10, 10)).save(parts_dir / "head.png")
+    random_sprite(rng, (12, 8)).save(tmp_path / "closed.png")
+    plan = {
+        "duration_ms": 1000,
+        "fps": 12,
+        "actions": [
+            {"type": "swap_image", "part": "head", "start_frame": 1, "end_frame": 3, "variant": "closed"},
+            {"type": "translate", "part": "root", "start_frame": 2, "end_frame": 6, "start_offset": [0, 0], "end_offset": [-30, -25], "easing": "ease_out"},
+            {"type": "scale", "part": "root", "start_frame": 6, "end_frame": 10, "start_scale": [1.0, 1.0], "end_scale": [1.3, 0.7]},
+        ],
+        "variants": {"closed": str(tmp_path / "closed.png")},
+    }
+    outputs = {}
+    for backend in ("pil", "numpy"):
+        out_gif = tmp_path / f"{backend}.gif"
+        assert animator.render_animation_from_plan(plan, char_path, parts_dir=parts_dir, out_gif=out_gif, backend=backend) == str(out_gif)
+        outputs[backend] = out_gif.read_bytes()
+    assert outputs["pil"] == outputs["numpy"]
+
+def test_render_unknown_backend(tmp_path):
+    char_path = tmp_path / "char.png"
+    Image.new("RGBA", (10, 10), (255, 0, 0, 255)).save(char_path)
+    assert animator.render_animation_from_plan({}, char_path, out_gif=tmp_path / "out.gif", backend="opengl") is None
@@ -0,0 +1,161 @@
+import os
+import sys
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches.encoders import (APNGWriter, GifWriter, WebPWriter, changed_box, encoder_for, make_writer,
+                                         opaque_where_changed)
+from spellbound_sketches.playback import FrameDecoder
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+needs_cv2 = pytest.mark.skipif(cv2 is None, reason="OpenCV not installed")
+
+def solid(colour, size=(8, 8)):
+    return Image.new("RGBA", size, colour)
+
+def read_gif(path):
+    with Image.open(path) as im:
+        return [(frame.convert("RGBA").copy(), frame.info["duration"]) for frame in ImageSequence.Iterator(im)]
+
+def test_gif_writer_merges_identical_frames(tmp_path):
+    out = tmp_path / "out.gif"
+    with GifWriter(out) as writer:
+        for colour in [(255, 0, 0, 255)] * 3 + [(0, 0, 255, 255)] * 2:
+            writer.write(solid(colour), 50)
+    assert (writer.frames_in, writer.frames_out, writer.collapsed) == (5, 2, 3)
+    frames = read_gif(out)
+    assert [d for _, d in frames] == [150, 100]
+    assert frames[1][0].getpixel((3, 3)) == (0, 0, 255, 255)
+
+def test_gif_writer_deltas_store_changed_box(tmp_path):
+    first = solid((255, 0, 0, 255), (32, 32))
+    second = first.copy()
+    second.paste((0, 255, 0, 255), (10, 12, 14, 15))
+    out = tmp_path / "out.gif"
+    with GifWriter(out, deltas=True) as writer:
+        writer.write(first, 100)
+        writer.write(second, 100)
+        writer.write(first, 100)  # The last frame clears everything for the next loop
+    with Image.open(out) as im:
+        im.seek(1)
+        assert im.tile[0][1] == (10, 12, 14, 15)
+        assert im.convert("RGBA").getpixel((11, 13)) == (0, 255, 0, 255)
+        assert im.convert("RGBA").getpixel((0, 0)) == (255, 0, 0, 255)
+
+def test_gif_writer_removes_file_on_error(tmp_path):
+    out = tmp_path / "out.gif"
+    with pytest.raises(ValueError):
+        with GifWriter(out) as writer:
+            writer.write(solid((255, 0, 0, 255)), 50)
+            writer.write(solid((255, 0, 0, 255), (4, 4)), 50)
+    assert not out.exists()
+
+def test_opaque_where_changed():
+    opaque = Image.new("RGBA", (4, 4), (255, 0, 0, 255))
+    clear = Image.new("RGBA", (4, 4), (0, 0, 0, 0))
+    assert opaque_where_changed(clear, opaque)
+    assert not opaque_where_changed(opaque, clear)
+
+def test_changed_box():
+    a = solid((0, 0, 0, 255))
+    b = a.copy()
+    assert changed_box(a, b) is None
+    b.putpixel((2, 5), (1, 1, 1, 255))
+    assert changed_box(a, b) == (2, 5, 3, 6)
+
+def moving_frames():
+    frames = []
+    for x in (0, 4, 8, 8):
+        img = Image.new("RGBA", (24, 16), (0, 0, 0, 0))
+        img.paste((255, 0, 0, 128), (x, 4, x + 8, 12))  # Half transparent: GIF could not keep this
+        frames.append(img)
+    return frames
+
+def test_apng_writer_keeps_alpha_and_merges_frames(tmp_path):
+    out = tmp_path / "out.png"
+    with APNGWriter(out) as writer:
+        for frame in moving_frames():
+            writer.write(frame, 50)
+    assert (writer.frames_out, writer.collapsed) == (3, 1)
+    with Image.open(out) as im:
+        assert im.format == "PNG" and im.n_frames == 3
+        durations = []
+        for i, expected in enumerate(moving_frames()[:3]):
+            im.seek(i)
+            durations.append(im.info["duration"])
+            assert im.convert("RGBA").tobytes() == expected.tobytes()
+    assert durations == [50, 50, 100]
+
+def test_apng_writer_splits_long_held_frames(tmp_path):
+    out = tmp_path / "still.png"
+    still, moved = moving_frames()[:2]
+    with APNGWriter(out) as writer:
+        for _ in range(700):  # 70 s of the same picture: longer than one APNG delay can say
+            writer.write(still, 100)
+        writer.write(moved, 100)
+    with Image.open(out) as im:
+        assert im.n_frames == 3
+        durations = []
+        for i in range(im.n_frames):
+            im.seek(i)
+            durations.append(im.info["duration"])
+            assert im.convert("RGBA").tobytes() == (still if i < 2 else moved).tobytes()
+    assert durations == [65535, 70000 - 65535, 100]
+
+def test_webp_writer_keeps_alpha(tmp_path):
+    out = tmp_path / "out.webp"
+    with WebPWriter(out, lossless=True) as writer:
+        for frame in moving_frames():
+            writer.write(frame, 50)
+    with Image.open(out) as im:
+        assert im.n_frames == 3
+        im.seek(1)
+        assert im.convert("RGBA").getpixel((6, 8)) == (255, 0, 0, 128)
+
+@needs_cv2
+def test_mp4_writer_plays_back_through_the_decoder(tmp_path):
+    out = tmp_path / "out.mp4"
+    with make_writer(out) as writer:
+        for frame in moving_frames():
+            writer.write(frame, 50)
+    with FrameDecoder(out, loop=False) as decoder:
+        frames = []
+        while (frame := decoder.get(timeout=5)) is not None:
+            frames.append(frame)
+    assert len(frames) == 4  # The merged 100 ms frame is shown twice at 20 fps
+    assert frames[0].duration_ms == 50 and frames[0].image.size == (24, 16)
+    r, g, b, a = frames[0].image.getpixel((4, 8))
+    assert r > 200 and g < 160 and a == 255  # Red on white, no alpha in video
+
+@needs_cv2
+@pytest.mark.parametrize("fps,duration_ms", [(12, 1200), (10, 1000)])
+def test_mp4_render_keeps_plan_timing(tmp_path, fps, duration_ms):
+    from spellbound_sketches.animator import render_animation_from_plan
+    # Idle first (those frames merge into one long frame), then moving
+    plan = {"duration_ms": duration_ms, "fps": fps, "variants": {}, "actions": [
+        {"type": "translate", "part": "root", "start_frame": 5, "end_frame": 9, "start_offset": [0, 0], "end_offset": [8, 0]}]}
+    char = tmp_path / "char.png"
+    solid((255, 0, 0, 255), (16, 16)).save(char)
+    out = render_animation_from_plan(plan, char, out_gif=tmp_path / "out.mp4")
+    video = cv2.VideoCapture(out)
+    try:
+        count, rate = video.get(cv2.CAP_PROP_FRAME_COUNT), video.get(cv2.CAP_PROP_FPS)
+    finally:
+        video.release()
+    assert rate == pytest.approx(fps, rel=0.01)
+    assert count == fps * duration_ms // 1000
+    assert count / rate * 1000 == pytest.approx(duration_ms, abs=1000 / fps)
+
+def test_encoder_for():
+    assert encoder_for("a.GIF") == "gif"
+    assert encoder_for("a.apng") == encoder_for("a.png") == "apng"
+    assert encoder_for("a.out", encoder="webp") == "webp"
+    assert encoder_for("a.out", default="gif") == "gif"
+    with pytest.raises(ValueError):
+        encoder_for("a.out")
+    with pytest.raises(ValueError):
+        encoder_for("a.gif", encoder="bmp")
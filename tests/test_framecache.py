@@ -0,0 +1,86 @@
+import sys
+import os
+from PIL import Image, ImageChops
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import animator
+from spellbound_sketches.framecache import FrameCache
+
+
+def make_plan(end_offset=(0, -6), fps=10, duration_ms=1000):
+    return {"duration_ms": duration_ms, "fps": fps, "variants": {}, "actions": [
+        {"type": "translate", "part": "root", "start_frame": 2, "end_frame": 5,
+         "start_offset": [0, 0], "end_offset": list(end_offset)},
+        {"type": "scale", "part": "root", "start_frame": 6, "end_frame": 8,
+         "start_scale": [1.0, 1.0], "end_scale": [1.2, 0.8]},
+    ]}
+
+
+def make_char(tmp_path, color=(255, 0, 0, 255)):
+    path = tmp_path / "char.png"
+    image = Image.new("RGBA", (32, 32), (0, 0, 0, 0))
+    image.paste(Image.new("RGBA", (16, 16), color), (8, 8))
+    image.save(path)
+    return path
+
+
+def frames_of(plan, char, **kwargs):
+    return list(animator.iter_animation_frames(plan, char, **kwargs))
+
+
+def test_cached_frames_match_fresh_ones(tmp_path):
+    char = make_char(tmp_path)
+    cache = FrameCache()
+    cached = frames_of(make_plan(), char, frame_cache=cache)
+    fresh = frames_of(make_plan(), char)
+    assert all(ImageChops.difference(a, b).getbbox() is None for a, b in zip(cached, fresh))
+    assert len(cached) == len(fresh) == 10
+    assert cache.misses < 10 and cache.hits > 0  # Idle frames share one entry
+
+
+def test_edit_only_composes_changed_frames(tmp_path):
+    char = make_char(tmp_path)
+    cache = FrameCache()
+    frames_of(make_plan(), char, frame_cache=cache)
+    misses = cache.misses
+    frames_of(make_plan(), char, frame_cache=cache)
+    assert cache.misses == misses  # Nothing changed, nothing drawn
+    frames_of(make_plan(end_offset=(0, -9)), char, frame_cache=cache)
+    # Frames 3-5 moved further; frame 4 now sits at (0, -6), which frame 5 already drew
+    assert cache.misses - misses == 2
+    frames_of(make_plan(duration_ms=1500), char, frame_cache=cache)
+    assert cache.misses - misses == 2  # The extra frames are idle, already cached
+
+
+def test_source_changes_are_not_reused(tmp_path):
+    cache = FrameCache()
+    red = frames_of(make_plan(), make_char(tmp_path), frame_cache=cache)
+    blue = frames_of(make_plan(), make_char(tmp_path, (0, 0, 255, 255)), frame_cache=cache)
+    assert red[0].getpixel((16, 16)) == (255, 0, 0, 255)
+    assert blue[0].getpixel((16, 16)) == (0, 0, 255, 255)
+    half = frames_of(make_plan(), tmp_path / "char.png", frame_cache=cache, resolution=0.5)
+    assert half[0].size == (16, 16)
+
+
+def test_memory_budget_is_kept():
+    frame_bytes = 16 * 16 * 4
+    cache = FrameCache(max_bytes=3 * frame_bytes)
+    for i in range(5):
+        cache.put(str(i), Image.new("RGBA", (16, 16), (i, 0, 0, 255)))
+    assert len(cache) == 3 and cache.memory_bytes() == 3 * frame_bytes
+    assert cache.get("0") is None and cache.get("4") is not None
+
+
+def test_disk_store_survives_and_is_bounded(tmp_path):
+    char = make_char(tmp_path)
+    disk = tmp_path / "frames"
+    first = FrameCache(disk_dir=disk)
+    frames_of(make_plan(), char, frame_cache=first)
+    second = FrameCache(disk_dir=disk)
+    frames = frames_of(make_plan(), char, frame_cache=second)
+    assert second.misses == 0 and second.disk_hits == first.misses
+    assert ImageChops.difference(frames[4], frames_of(make_plan(), char)[4]).getbbox() is None
+
+    small = FrameCache(disk_dir=tmp_path / "small", max_disk_bytes=1)
+    small.put("a", Image.new("RGBA", (8, 8), (1, 2, 3, 255)))
+    small.put("b", Image.new("RGBA", (8, 8), (4, 5, 6, 255)))
+    assert small.disk_size_bytes() == 0  # Everything is over a 1 byte budget
@@ -0,0 +1,67 @@
+import os
+import sys
+import numpy as np
+from PIL import Image
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import memprofile, tracing
+from spellbound_sketches.animator import render_animation_from_plan
+
+MB = memprofile.MB
+
+
+def test_stage_peaks_and_allocation_sites():
+    with memprofile.profile() as prof:
+        with tracing.span("outer"):
+            with tracing.span("big"):
+                block = np.ones(20 * MB, dtype=np.uint8)
+                del block
+            with tracing.span("small"):
+                block = np.ones(MB, dtype=np.uint8)
+                del block
+    assert tracing.get_tracer() is None  # Turned off again
+    stages = prof.stages
+    assert 20 * MB <= stages["big"].peak_bytes < 22 * MB
+    assert MB <= stages["small"].peak_bytes < 3 * MB
+    assert stages["outer"].peak_bytes >= 20 * MB  # Sees the peak of what ran inside it
+    assert all(size < MB for _, size in stages["outer"].top)  # Nothing big is still allocated at the end
+    assert prof.budget_violations({"big": 10, "small": 10}) == ["big: 20.0 MB > 10.0 MB"]
+    assert "big" in prof.format_report()
+
+
+def test_top_sites_point_at_the_allocating_line():
+    kept = []
+    with memprofile.profile() as prof:
+        with tracing.span("leaky"):
+            kept.append(np.ones(5 * MB, dtype=np.uint8))
+    site, size = prof.stages["leaky"].top[0]
+    assert site.startswith(__file__) and size >= 5 * MB
+
+
+def test_reused_tracer_is_left_without_hooks():
+    tracer = tracing.enable()
+    try:
+        with memprofile.profile() as prof:
+            with tracing.span("inside"):
+                pass
+        assert tracing.get_tracer() is tracer  # Not turned off: it was on before
+        assert tracer._hooks == []
+        assert "inside" in prof.stages
+    finally:
+        tracing.disable()
+
+
+def test_rendering_100_frames_at_1024_stays_in_budget(tmp_path):
+    char = Image.new("RGBA", (1024, 1024), (0, 0, 0, 0))
+    char.paste((200, 40, 40, 255), (256, 256, 768, 768))
+    char.save(tmp_path / "c.png")
+    plan = {"duration_ms": 4000, "fps": 25, "variants": {}, "actions": [
+        {"type": "translate", "part": "root", "start_frame": 0, "end_frame": 100,
+         "start_offset": [0, 0], "end_offset": [0, -40]}]}
+    with memprofile.profile() as prof:
+        assert render_animation_from_plan(plan, tmp_path / "c.png", out_gif=tmp_path / "o.gif")
+    render = prof.stages["render"]
+    assert prof.stages["render.compose"].count == 100
+    # Frames are streamed to the GIF; keeping all 100 would need ~400 MB
+    assert prof.budget_violations({"render": 64}) == []
+    if render.rss_peak_bytes is not None:
+        assert prof.budget_violations({"render": 128}, rss=True) == []
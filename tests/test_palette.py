@@ -0,0 +1,51 @@
+import os
+import sys
+import numpy as np
+from PIL import Image, ImageSequence
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import animator
+from spellbound_sketches.palette import Palette, build_palette, load_or_build_palette
+
+def test_palette_quantize_maps_colours_and_transparency():
+    palette = Palette(np.array([[255, 0, 0], [0, 0, 255]], dtype=np.uint8))
+    img = Image.new("RGBA", (3, 1))
+    img.putdata([(250, 5, 5, 255), (10, 0, 240, 255), (0, 0, 0, 0)])
+    out = palette.quantize(img)
+    assert out.mode == "P"
+    assert np.asarray(out).ravel().tolist() == [0, 1, palette.transparent_index]
+    assert out.info["transparency"] == palette.transparent_index
+
+def test_build_palette_from_images():
+    img = Image.new("RGBA", (10, 10), (0, 0, 0, 0))
+    img.paste((255, 0, 0, 255), (0, 0, 5, 10))
+    img.paste((0, 255, 0, 255), (5, 0, 10, 5))
+    palette = build_palette([img], colors=16)
+    assert {tuple(c) for c in palette.colors} == {(255, 0, 0), (0, 255, 0)}
+
+def test_load_or_build_palette_uses_disk_cache(tmp_path, monkeypatch):
+    char_path = tmp_path / "char.png"
+    Image.new("RGBA", (8, 8), (10, 20, 30, 255)).save(char_path)
+    cache_dir = tmp_path / "cache"
+    first = load_or_build_palette([char_path], cache_dir=cache_dir)
+    assert len(list(cache_dir.iterdir())) == 1
+    monkeypatch.setattr("spellbound_sketches.palette.build_palette", lambda *a, **kw: 1 / 0)
+    second = load_or_build_palette([char_path], cache_dir=cache_dir)
+    assert np.array_equal(first.colors, second.colors)
+    assert np.array_equal(first.lut, second.lut)
+
+def test_render_with_shared_palette(tmp_path):
+    char_path = tmp_path / "char.png"
+    img = Image.new("RGBA", (20, 20), (0, 0, 0, 0))
+    img.paste((200, 30, 30, 255), (5, 5, 15, 15))
+    img.save(char_path)
+    plan = {"duration_ms": 500, "fps": 10, "actions": [
+        {"type": "translate", "part": "root", "start_frame": 0, "end_frame": 4, "start_offset": [0, 0], "end_offset": [4, 0]},
+    ]}
+    out_gif = tmp_path / "out.gif"
+    result = animator.render_animation_from_plan(plan, char_path, out_gif=out_gif, shared_palette=True, palette_cache_dir=tmp_path / "cache")
+    assert result == str(out_gif)
+    with Image.open(out_gif) as im:
+        frames = [frame.convert("RGBA") for frame in ImageSequence.Iterator(im)]
+    assert len(frames) == 5
+    assert frames[4].getpixel((10, 10)) == (200, 30, 30, 255)
+    assert frames[4].getpixel((6, 10))[3] == 0
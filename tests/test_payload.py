@@ -0,0 +1,65 @@
+import sys
+import os
+import base64
+import io
+import numpy as np
+import pytest
+from PIL import Image
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import payload
+
+
+def make_scan(path, size=(2000, 1500)):
+    rng = np.random.default_rng(0)
+    arr = rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+    Image.fromarray(arr).save(path)
+
+
+def test_payload_is_shrunk_and_decodable(tmp_path):
+    make_scan(tmp_path / "scan.png")
+    result = payload.prepare_image_payload(tmp_path / "scan.png", max_edge=400, cache_dir=tmp_path / "c")
+    assert result.size == (400, 300)
+    assert result.mime_type == "image/webp" and not result.cached
+    assert result.payload_bytes == len(result.data) and result.encode_seconds > 0
+    raw = base64.b64decode(result.data)
+    assert len(raw) == result.encoded_bytes
+    with Image.open(io.BytesIO(raw)) as im:
+        assert im.format == "WEBP" and im.size == (400, 300)
+
+
+def test_payload_is_cached_by_content_and_settings(tmp_path):
+    make_scan(tmp_path / "scan.png", size=(300, 200))
+    first = payload.prepare_image_payload(tmp_path / "scan.png", fmt="jpeg", cache_dir=tmp_path / "c")
+    second = payload.prepare_image_payload(tmp_path / "scan.png", fmt="jpeg", cache_dir=tmp_path / "c")
+    assert second.cached and second.data == first.data and second.size == first.size == (300, 200)
+    other = payload.prepare_image_payload(tmp_path / "scan.png", fmt="png", cache_dir=tmp_path / "c")
+    assert not other.cached and other.mime_type == "image/png"
+
+
+def test_jpeg_puts_transparent_drawings_on_white(tmp_path):
+    Image.new("RGBA", (10, 10), (0, 0, 0, 0)).save(tmp_path / "char.png")
+    result = payload.prepare_image_payload(tmp_path / "char.png", fmt="jpg", use_cache=False)
+    with Image.open(io.BytesIO(base64.b64decode(result.data))) as im:
+        assert im.mode == "RGB" and min(im.getpixel((5, 5))) > 240
+
+
+def test_unknown_format_raises(tmp_path):
+    make_scan(tmp_path / "scan.png", size=(10, 10))
+    with pytest.raises(ValueError):
+        payload.prepare_image_payload(tmp_path / "scan.png", fmt="bmp")
+
+
+def test_phone_photo_orientation_is_applied(tmp_path):
+    # Landscape pixels tagged "rotate 90° clockwise to view" (orientation 6)
+    img = Image.new("RGB", (2000, 1000), (255, 255, 255))
+    img.paste((255, 0, 0), (0, 0, 200, 1000))  # Red stripe on the left edge of the stored pixels
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    img.save(tmp_path / "phone.jpg", exif=exif)
+    result = payload.prepare_image_payload(tmp_path / "phone.jpg", max_edge=768, fmt="png", cache_dir=tmp_path / "c")
+    assert result.size == (384, 768)
+    with Image.open(io.BytesIO(base64.b64decode(result.data))) as im:
+        assert im.size == (384, 768)
+        assert im.getexif().get(0x0112) in (None, 1)
+        r, g, b = im.convert("RGB").getpixel((192, 10))
+        assert r > 200 and g < 80  # The stripe is now along the top
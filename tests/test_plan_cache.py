@@ -0,0 +1,93 @@
+import sys
+import os
+import threading
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import adapter
+from spellbound_sketches.plan_cache import PlanCache, normalize_onboarding
+
+
+def api_plan(text="From the API"):
+    return {"duration_ms": 100, "fps": 1, "actions": [], "sound_text": text, "variants": {}}
+
+
+def make_drawing(tmp_path, data=b"drawing"):
+    path = tmp_path / "drawing.png"
+    path.write_bytes(data)
+    return path
+
+
+def test_near_identical_onboarding_shares_a_plan(tmp_path, monkeypatch):
+    calls = []
+    def fake_api(image_path, prompt):
+        calls.append(prompt)
+        return api_plan()
+    monkeypatch.setattr(adapter, "call_multimodal_api", fake_api)
+    cache = PlanCache()
+    drawing = make_drawing(tmp_path)
+    first = adapter.multimodal_plan_for_animation(drawing, {"colors": "Bright ", "tone": "silly"}, cache=cache)
+    first["sound_text"] = "edited by the caller"
+    second = adapter.multimodal_plan_for_animation(drawing, {"tone": "silly", "colors": "bright"}, cache=cache)
+    assert len(calls) == 1
+    assert second["sound_text"] == "From the API"  # The cached copy was not changed
+    assert normalize_onboarding({" Colors": "  Bright  Pastel"}) == {"colors": "bright pastel"}
+
+
+def test_fallback_plans_are_not_cached(tmp_path):
+    cache = PlanCache()
+    drawing = make_drawing(tmp_path)
+    adapter.multimodal_plan_for_animation(drawing, {}, cache=cache)
+    assert cache.get(PlanCache.key(drawing, {}, adapter.PROMPT_VERSION)) is None
+    # A missing drawing just skips the cache
+    assert "actions" in adapter.multimodal_plan_for_animation(tmp_path / "missing.png", {}, cache=cache)
+
+
+def test_ttl_and_disk_store(tmp_path):
+    now = [1000.0]
+    clock = lambda: now[0]
+    drawing = make_drawing(tmp_path)
+    key = PlanCache.key(drawing, {"colors": "red"}, 1)
+    PlanCache(disk_dir=tmp_path / "plans", ttl_seconds=60, clock=clock).put(key, api_plan())
+    fresh = PlanCache(disk_dir=tmp_path / "plans", ttl_seconds=60, clock=clock)
+    assert fresh.get(key)["sound_text"] == "From the API"  # Read back from disk
+    now[0] += 61
+    assert fresh.get(key) is None
+    assert PlanCache.key(drawing, {"colors": "red"}, 2) != key  # New prompt version, new key
+
+
+def test_identical_requests_in_flight_are_coalesced(tmp_path):
+    cache = PlanCache()
+    calls = []
+    release = threading.Event()
+    def create():
+        calls.append(1)
+        release.wait(5)
+        return api_plan(), True
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_create("k", create))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    while cache.coalesced < 3:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(calls) == 1
+    assert len(results) == 4 and all(r == api_plan() for r in results)
+    assert len({id(r) for r in results}) == 4  # Everyone gets their own copy
+
+
+def test_plan_stored_after_a_miss_is_not_requested_again():
+    cache = PlanCache()
+    real_get = cache.get
+    def racing_get(key):
+        found = real_get(key)
+        # Another caller finishes (stores the plan, leaves in-flight) right after our miss
+        cache.put(key, api_plan("stored meanwhile"))
+        return found
+    cache.get = racing_get
+    calls = []
+    plan = cache.get_or_create("k", lambda: (calls.append(1), (api_plan(), True))[1])
+    assert calls == []
+    assert plan["sound_text"] == "stored meanwhile"
+    assert cache.stats() == {"hits": 1, "misses": 0, "coalesced": 0}
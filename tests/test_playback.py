@@ -0,0 +1,99 @@
+import sys
+import os
+import pytest
+from PIL import Image
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import playback
+
+
+def make_gif(path, n=5, size=(40, 30)):
+    frames = [Image.new("RGB", size, (40 * i, 0, 0)) for i in range(n)]
+    durations = [50 + 10 * i for i in range(n)]
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=durations, loop=0)
+    return durations
+
+
+def take(decoder, count):
+    return [decoder.get(timeout=5) for _ in range(count)]
+
+
+def test_decoder_keeps_per_frame_durations_and_loops(tmp_path):
+    durations = make_gif(tmp_path / "a.gif")
+    with playback.FrameDecoder(tmp_path / "a.gif") as decoder:
+        frames = take(decoder, 7)
+    assert [f.index for f in frames] == [0, 1, 2, 3, 4, 0, 1]
+    assert [f.duration_ms for f in frames[:5]] == durations
+    assert frames[0].image.mode == "RGBA"
+
+
+def test_decoder_streams_through_a_small_buffer(tmp_path):
+    make_gif(tmp_path / "a.gif", n=6)
+    with playback.FrameDecoder(tmp_path / "a.gif", buffer_frames=2) as decoder:
+        frames = take(decoder, 8)
+        assert decoder.buffered() <= 2
+    assert [f.index for f in frames] == [0, 1, 2, 3, 4, 5, 0, 1]
+    assert frames[1].image.getpixel((0, 0))[0] == frames[7].image.getpixel((0, 0))[0]
+
+
+def test_decoder_downscales_once_to_fit(tmp_path):
+    make_gif(tmp_path / "a.gif", size=(400, 200))
+    with playback.FrameDecoder(tmp_path / "a.gif", max_size=(100, 100)) as decoder:
+        assert decoder.size == (100, 50)
+        assert decoder.get(timeout=5).image.size == (100, 50)
+    assert playback.fit_size((10, 10), (100, 100)) == (10, 10)  # Never made bigger
+
+
+def test_decoder_without_loop_finishes(tmp_path):
+    make_gif(tmp_path / "a.gif", n=3)
+    with playback.FrameDecoder(tmp_path / "a.gif", loop=False, buffer_frames=1) as decoder:
+        assert len(take(decoder, 3)) == 3
+        assert decoder.get(timeout=5) is None
+        assert decoder.finished
+
+
+def test_decoder_missing_file_raises(tmp_path):
+    with pytest.raises(OSError):
+        playback.FrameDecoder(tmp_path / "missing.gif")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_scheduler_targets_absolute_times():
+    clock = FakeClock()
+    sched = playback.PlaybackScheduler(clock=clock)
+    sched.start()
+    assert sched.offer(100) == 100
+    clock.now += 0.130  # The callback ran 30 ms late...
+    assert sched.offer(100) == 70  # ...so the next wait is shorter and no drift builds up
+    assert sched.shown == 2 and sched.max_lateness_ms == pytest.approx(30)
+
+
+def test_scheduler_drops_frames_that_are_too_late():
+    clock = FakeClock()
+    sched = playback.PlaybackScheduler(clock=clock)
+    sched.start()
+    sched.offer(100)
+    clock.now += 0.350  # Stalled for 350 ms: frames due at 100 and 200 ms are over
+    assert sched.offer(100) is None
+    assert sched.offer(100) is None
+    assert sched.offer(100) == 50  # Due at 300 ms, shown 50 ms late
+    stats = sched.stats()
+    assert stats["shown"] == 2 and stats["dropped"] == 2
+    assert stats["max_lateness_ms"] == pytest.approx(50)
+    assert stats["mean_lateness_ms"] == pytest.approx(25)
+
+
+def test_scheduler_never_drops_the_first_frame():
+    clock = FakeClock()
+    sched = playback.PlaybackScheduler(clock=clock)
+    sched.start()
+    clock.now += 1.0
+    assert sched.offer(100) == 0
+    sched.start()
+    assert sched.stats()["shown"] == 0
@@ -33,3 +33,30 @@ def test_export_parts(tmp_path):
     for key in ["head", "body", "left_wing", "right_wing"]:
         assert key in result
         assert os.path.exists(result[key])
+
+def test_remove_background_tiled_is_byte_identical(tmp_path):
+    import numpy as np
+    rng = np.random.default_rng(0)
+    arr = rng.integers(200, 256, size=(97, 61, 3), dtype=np.uint8)
+    input_path = tmp_path / "input.png"
+    Image.fromarray(arr, "RGB").save(input_path)
+    whole = preprocess.remove_background(str(input_path), str(tmp_path / "whole.png"))
+    # A tiny budget forces many strips of a single row or a few rows
+    tiled = preprocess.remove_background(str(input_path), str(tmp_path / "tiled.png"), max_memory_mb=0.002)
+    assert preprocess._strip_rows(61, 0.002) < 97
+    with open(whole, "rb") as a, open(tiled, "rb") as b:
+        assert a.read() == b.read()
+
+def test_remove_background_tiled_drops_metadata_like_whole(tmp_path):
+    from PIL import ImageCms
+    icc = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+    img = Image.new("RGB", (40, 30), (255, 255, 255))
+    img.paste((10, 20, 30), (10, 10, 30, 20))
+    input_path = tmp_path / "photo.jpg"
+    img.save(input_path, icc_profile=icc, dpi=(300, 300))
+    whole = preprocess.remove_background(str(input_path), str(tmp_path / "whole.png"))
+    tiled = preprocess.remove_background(str(input_path), str(tmp_path / "tiled.png"), max_memory_mb=0.001)
+    with open(whole, "rb") as a, open(tiled, "rb") as b:
+        assert a.read() == b.read()
+    with Image.open(tiled) as out:
+        assert "icc_profile" not in out.info and "dpi" not in out.info
@@ -0,0 +1,114 @@
+import sys
+import os
+import asyncio
+import time
+import pytest
+from PIL import Image
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import adapter, providers
+from spellbound_sketches.mock_server import MockPlanServer
+
+PLAN = {"duration_ms": 100, "fps": 1, "actions": [], "sound_text": "From the mock!", "variants": {}}
+
+
+@pytest.fixture
+def drawing(tmp_path, monkeypatch):
+    monkeypatch.setenv("SPELLBOUND_CACHE_DIR", str(tmp_path / "cache"))
+    path = tmp_path / "drawing.png"
+    Image.new("RGBA", (64, 48), (200, 30, 30, 255)).save(path)
+    return path
+
+
+@pytest.fixture
+def server():
+    with MockPlanServer(plan=PLAN) as srv:
+        yield srv
+
+
+def test_requests_reuse_one_connection(server, drawing):
+    provider = providers.HTTPPlanProvider(server.url)
+    for _ in range(5):
+        assert provider.plan_sync(drawing, "hop") == PLAN
+    provider.close()
+    assert server.connections == 1 and provider.pool.opened == 1
+    assert server.requests[0]["prompt"] == "hop"
+    assert server.requests[0]["image_name"] == "drawing.png"
+    assert server.requests[0]["image_type"] == "image/webp"
+
+
+def test_unreadable_image_is_a_provider_error(server, tmp_path):
+    bad = tmp_path / "bad.png"
+    bad.write_bytes(b"not really a png")
+    provider = providers.HTTPPlanProvider(server.url)
+    with pytest.raises(providers.ProviderError):
+        provider.plan_sync(bad, "hop")
+    assert server.requests == []
+
+
+def test_server_errors_are_retried(server, drawing):
+    server.fail_next = [503, 500]
+    provider = providers.HTTPPlanProvider(server.url, retries=2, backoff_base=0.01)
+    assert provider.plan_sync(drawing, "hop") == PLAN
+    assert len(server.requests) == 3
+
+
+def test_bad_requests_are_not_retried(server, drawing):
+    server.fail_next = [400]
+    provider = providers.HTTPPlanProvider(server.url, retries=2, backoff_base=0.01)
+    with pytest.raises(providers.ProviderError):
+        provider.plan_sync(drawing, "hop")
+    assert len(server.requests) == 1
+    assert provider.breaker.state == "closed"
+
+
+def test_hung_server_times_out(drawing):
+    with MockPlanServer(plan=PLAN, delay=1.0) as slow:
+        provider = providers.HTTPPlanProvider(slow.url, timeout=0.1, retries=0)
+        started = time.monotonic()
+        with pytest.raises(providers.ProviderError):
+            provider.plan_sync(drawing, "hop")
+        assert time.monotonic() - started < 0.8
+
+
+def test_circuit_breaker_opens_and_recovers(server, drawing):
+    now = [0.0]
+    breaker = providers.CircuitBreaker(failure_threshold=2, reset_seconds=10, clock=lambda: now[0])
+    provider = providers.HTTPPlanProvider(server.url, retries=0, breaker=breaker)
+    server.fail_next = [500, 500, 500]
+    for _ in range(2):
+        with pytest.raises(providers.ProviderError):
+            provider.plan_sync(drawing, "hop")
+    with pytest.raises(providers.CircuitOpenError):
+        provider.plan_sync(drawing, "hop")
+    assert len(server.requests) == 2 and breaker.state == "open"
+    now[0] += 10
+    server.fail_next = []
+    assert provider.plan_sync(drawing, "hop") == PLAN  # The trial call works, so it closes again
+    assert breaker.state == "closed"
+
+
+def test_concurrency_is_bounded(drawing):
+    with MockPlanServer(plan=PLAN, delay=0.05) as srv:
+        provider = providers.HTTPPlanProvider(srv.url, max_concurrency=2)
+
+        async def many():
+            return await asyncio.gather(*(provider.plan(drawing, f"hop {i}") for i in range(6)))
+
+        assert asyncio.run(many()) == [PLAN] * 6
+        assert srv.max_active == 2
+        assert provider.pool.opened <= 2
+
+
+def test_adapter_uses_configured_provider(server, drawing, monkeypatch):
+    monkeypatch.setenv("SPELLBOUND_API_URL", server.url)
+    assert adapter.multimodal_plan_for_animation(str(drawing), {"colors": "red"}) == PLAN
+    assert "'colors': 'red'" in server.requests[-1]["prompt"]
+    server.fail_next = [404]
+    assert adapter.multimodal_plan_for_animation(str(drawing), {}) == adapter.canned_plan_for_animation()
+
+    async def many():
+        return await asyncio.gather(*(adapter.multimodal_plan_for_animation_async(str(drawing), {}) for _ in range(3)))
+
+    assert asyncio.run(many()) == [PLAN] * 3
+    monkeypatch.delenv("SPELLBOUND_API_URL")
+    assert providers.get_provider() is None
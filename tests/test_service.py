@@ -0,0 +1,135 @@
+import base64
+import http.client
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from PIL import Image
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import service
+
+PLAN = {"duration_ms": 200, "fps": 5, "actions": [], "variants": {}}
+
+
+def drawing_bytes():
+    img = Image.new("RGBA", (20, 20), (255, 255, 255, 255))
+    img.paste((0, 0, 0, 255), (5, 5, 15, 15))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def running(tmp_path):
+    started = []
+
+    def start(render_service):
+        server = service.make_server(render_service, port=0)
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        started.append((server, render_service))
+        return http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+
+    yield start
+    for server, render_service in started:
+        server.shutdown()
+        server.server_close()
+        render_service.close()
+
+
+def call(conn, method, path, body=None):
+    conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                 headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    data = response.read()
+    return response.status, data
+
+
+def test_job_runs_on_warm_workers_and_serves_the_gif(tmp_path, running):
+    render_service = service.RenderService(workers=1, jobs_dir=tmp_path / "jobs")
+    render_service.warm_up()
+    conn = running(render_service)
+    status, data = call(conn, "POST", "/jobs", {"drawing": base64.b64encode(drawing_bytes()).decode(), "plan": PLAN})
+    assert status == 202
+    job = json.loads(data)
+    deadline = time.time() + 30
+    while job["status"] in ("queued", "running") and time.time() < deadline:
+        time.sleep(0.05)
+        job = json.loads(call(conn, "GET", job["status_url"])[1])
+    assert job["status"] == "done", job
+    status, gif = call(conn, "GET", job["gif_url"])
+    assert status == 200 and gif[:6] in (b"GIF87a", b"GIF89a")
+    assert json.loads(call(conn, "GET", "/health")[1])["done"] == 1
+
+
+def wait_for_job(conn, job):
+    deadline = time.time() + 30
+    while job["status"] in ("queued", "running") and time.time() < deadline:
+        time.sleep(0.05)
+        job = json.loads(call(conn, "GET", job["status_url"])[1])
+    return job
+
+
+@pytest.mark.skipif(not hasattr(os, "kill") or sys.platform == "win32", reason="needs POSIX signals")
+def test_dead_worker_pool_is_replaced(tmp_path, running):
+    import signal
+    from concurrent.futures import BrokenExecutor
+    render_service = service.RenderService(workers=1, jobs_dir=tmp_path / "jobs")
+    conn = running(render_service)
+    pid = render_service.executor.submit(service._ping).result(timeout=30)
+    os.kill(pid, signal.SIGKILL)  # Like the OOM killer
+    probe = render_service.executor.submit(service._ping)
+    assert isinstance(probe.exception(timeout=30), BrokenExecutor)
+    status, data = call(conn, "POST", "/jobs", {"drawing": base64.b64encode(drawing_bytes()).decode(), "plan": PLAN})
+    assert status == 202
+    assert wait_for_job(conn, json.loads(data))["status"] == "done"
+    assert json.loads(call(conn, "GET", "/health")[1])["restarts"] == 1
+
+
+def test_full_queue_answers_429(tmp_path, running, monkeypatch):
+    release = threading.Event()
+
+    def slow_item(item, resume):
+        release.wait(10)
+        return {"id": item["id"], "output": item["output"], "status": "ok", "error": None, "seconds": 0.0}
+
+    monkeypatch.setattr(service, "process_item", slow_item)
+    render_service = service.RenderService(max_queue=2, jobs_dir=tmp_path / "jobs", executor=ThreadPoolExecutor(1))
+    conn = running(render_service)
+    body = {"drawing_path": str(tmp_path / "d.png"), "plan": PLAN}
+    assert call(conn, "POST", "/jobs", body)[0] == 202
+    status, data = call(conn, "POST", "/jobs", body)
+    assert status == 202 and json.loads(data)["status"] == "queued"
+    assert call(conn, "POST", "/jobs", body)[0] == 429
+    release.set()
+    render_service.executor.shutdown(wait=True)
+    assert call(conn, "POST", "/jobs", {"plan": PLAN})[0] == 400
+    status, data = call(conn, "POST", "/jobs", body)  # The workers are gone
+    assert status == 503 and "error" in json.loads(data)
+    assert call(conn, "GET", "/jobs/nope")[0] == 404
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs unix sockets")
+def test_unix_socket(tmp_path):
+    render_service = service.RenderService(jobs_dir=tmp_path / "jobs", executor=ThreadPoolExecutor(1))
+    path = tmp_path / "render.sock"
+    server = service.make_server(render_service, socket_path=path)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(path))
+            sock.sendall(b"GET /health HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+            reply = b""
+            while chunk := sock.recv(4096):
+                reply += chunk
+        assert reply.startswith(b"HTTP/1.1 200")
+        assert json.loads(reply.split(b"\r\n\r\n", 1)[1])["ok"] is True
+    finally:
+        server.shutdown()
+        server.server_close()
+        render_service.close()
+        render_service.executor.shutdown()
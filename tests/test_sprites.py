@@ -0,0 +1,83 @@
+import pytest
+import sys
+import os
+from PIL import Image
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import animator
+from spellbound_sketches.sprites import SpriteCache, build_mip_pyramid
+
+def test_sprite_cache_unscaled_returns_same_image():
+    img = Image.new("RGBA", (20, 20), (255, 0, 0, 255))
+    cache = SpriteCache()
+    assert cache.get(img, (20, 20)) is img
+    assert len(cache) == 0
+
+def test_sprite_cache_reuses_and_matches_direct_resize():
+    img = Image.linear_gradient("L").convert("RGBA").resize((64, 64))
+    cache = SpriteCache()
+    first = cache.get(img, (32, 40))
+    second = cache.get(img, (32, 40))
+    assert first is second
+    assert cache.misses == 1 and cache.hits == 1
+    assert first.tobytes() == img.resize((32, 40), resample=Image.Resampling.BICUBIC).tobytes()
+
+def test_sprite_cache_evicts_least_recently_used():
+    img = Image.new("RGBA", (20, 20), (0, 0, 255, 255))
+    cache = SpriteCache(max_entries=2)
+    a = cache.get(img, (10, 10))
+    cache.get(img, (11, 11))
+    cache.get(img, (10, 10))  # touch a so (11, 11) is the oldest
+    cache.get(img, (12, 12))
+    assert len(cache) == 2
+    assert cache.get(img, (10, 10)) is a
+
+def test_mip_pyramid_levels_and_mipmapped_resize():
+    img = Image.new("RGBA", (128, 64), (0, 255, 0, 255))
+    levels = build_mip_pyramid(img, min_size=16)
+    assert [level.size for level in levels] == [(128, 64), (64, 32), (32, 16)]
+    cache = SpriteCache(mipmaps=True)
+    assert cache.get(img, (30, 15)).size == (30, 15)
+
+def test_render_animation_shares_sprite_cache(tmp_path):
+    plan = {
+        "duration_ms": 1000,
+        "fps": 6,
+        "actions": [
+            {"type": "scale", "part": "root", "start_frame": 0, "end_frame": 5, "start_scale": [0.5, 0.5], "end_scale": [0.5, 0.5]},
+        ],
+        "variants": {}
+    }
+    char_path = tmp_path / "char.png"
+    Image.new("RGBA", (40, 40), (255, 0, 0, 255)).save(char_path)
+    cache = SpriteCache()
+    result = animator.render_animation_from_plan(plan, str(char_path), out_gif=str(tmp_path / "out.gif"), sprite_cache=cache)
+    assert result == str(tmp_path / "out.gif")
+    assert cache.misses == 1
+    assert cache.hits == 5
+
+def test_renders_sharing_a_cache_reuse_resizes(tmp_path):
+    plan = {"duration_ms": 500, "fps": 4, "variants": {}, "actions": [
+        {"type": "scale", "part": "root", "start_frame": 0, "end_frame": 1, "start_scale": [0.5, 0.5], "end_scale": [0.5, 0.5]}]}
+    char_path = tmp_path / "char.png"
+    Image.new("RGBA", (40, 40), (255, 0, 0, 255)).save(char_path)
+    cache = SpriteCache()
+    animator.render_animation_from_plan(plan, char_path, out_gif=tmp_path / "a.gif", sprite_cache=cache)
+    misses = cache.misses
+    animator.render_animation_from_plan(plan, char_path, out_gif=tmp_path / "b.gif", sprite_cache=cache)
+    assert cache.misses == misses and misses > 0  # The second render only hits
+
+    Image.new("RGBA", (40, 40), (0, 0, 255, 255)).save(char_path)
+    os.utime(char_path, ns=(1, 1))  # A changed file is decoded again
+    animator.render_animation_from_plan(plan, char_path, out_gif=tmp_path / "c.gif", sprite_cache=cache)
+    assert cache.misses > misses
+
+def test_sprite_cache_bounds_sources_and_pyramids(tmp_path):
+    cache = SpriteCache(max_entries=2, mipmaps=True, max_sources=2)
+    images = []
+    for i in range(4):
+        path = tmp_path / f"{i}.png"
+        Image.new("RGBA", (64, 64), (i, 0, 0, 255)).save(path)
+        images.append(cache.load(path, lambda p: Image.open(p).convert("RGBA")))
+        cache.get(images[-1], (20, 20))
+    assert len(cache._sources) == 2 and len(cache._pyramids) == 2 and len(cache) == 2
+    assert cache.load(tmp_path / "3.png", lambda p: None) is images[3]
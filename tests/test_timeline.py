@@ -0,0 +1,77 @@
+import os
+import random
+import sys
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import adapter, timeline
+from spellbound_sketches.animator import ease_out, lerp
+
+def reference_states(plan, variants):
+    # The original frame-by-frame loop from the animator
+    duration_ms, fps = plan.get("duration_ms", 1000), plan.get("fps", 12)
+    total_frames = max(1, int(duration_ms / 1000 * fps))
+    states = []
+    for f in range(total_frames):
+        offset, scale, head_variant = [0, 0], [1.0, 1.0], None
+        for act in plan.get("actions", []):
+            sf, ef = act.get("start_frame", 0), act.get("end_frame", total_frames)
+            if f < sf or f > ef:
+                continue
+            t_norm = (f - sf) / max(1, (ef - sf))
+            t = ease_out(t_norm) if act.get("easing") == "ease_out" else t_norm
+            if act["type"] == "translate" and act.get("part") == "root":
+                so, eo = act.get("start_offset", [0, 0]), act.get("end_offset", [0, 0])
+                offset[0] += int(lerp(so[0], eo[0], t))
+                offset[1] += int(lerp(so[1], eo[1], t))
+            if act["type"] == "scale" and act.get("part") == "root":
+                ss, es = act.get("start_scale", [1.0, 1.0]), act.get("end_scale", [1.0, 1.0])
+                scale[0] *= lerp(ss[0], es[0], t)
+                scale[1] *= lerp(ss[1], es[1], t)
+            if act["type"] == "swap_image" and act.get("variant") and act["variant"] in variants:
+                head_variant = act["variant"]
+        states.append(timeline.FrameState(tuple(offset), tuple(scale), head_variant))
+    return states
+
+def random_plan(rng, n_actions):
+    actions = []
+    for _ in range(n_actions):
+        sf = rng.randint(-3, 30)
+        act = {"part": rng.choice(["root", "root", "head"]), "start_frame": sf, "end_frame": sf + rng.randint(-1, 10)}
+        kind = rng.choice(["translate", "scale", "swap_image"])
+        act["type"] = kind
+        if rng.random() < 0.5:
+            act["easing"] = rng.choice(["ease_out", "linear"])
+        if kind == "translate":
+            act["start_offset"] = [rng.randint(-20, 20), rng.uniform(-20, 20)]
+            act["end_offset"] = [rng.randint(-20, 20), rng.uniform(-20, 20)]
+        elif kind == "scale":
+            act["start_scale"] = [rng.uniform(0.5, 1.5), rng.uniform(0.5, 1.5)]
+            act["end_scale"] = [rng.uniform(0.5, 1.5), rng.uniform(0.5, 1.5)]
+        else:
+            act["variant"] = rng.choice(["eyes_closed", "smile", "missing"])
+        actions.append(act)
+    return {"duration_ms": rng.randint(100, 3000), "fps": rng.choice([6, 12, 24, 30]), "actions": actions}
+
+def test_compile_plan_matches_frame_loop():
+    rng = random.Random(42)
+    variants = {"eyes_closed", "smile"}
+    plans = [adapter.canned_plan_for_animation(), {}] + [random_plan(rng, rng.randint(0, 40)) for _ in range(50)]
+    for plan in plans:
+        assert list(timeline.compile_plan(plan, variants=variants)) == reference_states(plan, variants)
+
+def test_compile_plan_easings():
+    plan = {"duration_ms": 1000, "fps": 5, "actions": [
+        {"type": "translate", "part": "root", "start_frame": 0, "end_frame": 4, "start_offset": [0, 0], "end_offset": [100, 0], "easing": "ease_in"},
+    ]}
+    assert list(timeline.compile_plan(plan).offset_x) == [0, 6, 25, 56, 100]
+
+@pytest.mark.parametrize("plan", [
+    {"fps": 0},
+    {"actions": [{"part": "root"}]},
+    {"actions": "hop"},
+    {"actions": [{"type": "translate", "start_offset": [1]}]},
+    {"duration_ms": "long"},
+])
+def test_compile_plan_rejects_bad_plans(plan):
+    with pytest.raises(ValueError):
+        timeline.compile_plan(plan)
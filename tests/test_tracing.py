@@ -0,0 +1,98 @@
+import json
+import os
+import sys
+import threading
+import pytest
+from PIL import Image
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import tracing
+from spellbound_sketches.animator import render_animation_from_plan
+from spellbound_sketches.playback import FrameDecoder
+from spellbound_sketches.preprocess import export_parts, remove_background
+
+PLAN = {"duration_ms": 400, "fps": 10, "actions": [], "variants": {}}
+
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.enable()
+    yield tracer
+    tracing.disable()
+
+
+def test_disabled_spans_do_nothing():
+    assert tracing.get_tracer() is None
+    with tracing.span("anything", a=1) as sp:
+        sp.set(b=2)
+    assert tracing.span("other") is sp  # One shared no-op object
+    tracing.record_error(ValueError("ignored"))
+
+
+def test_nesting_attributes_errors_and_hooks(tracer):
+    seen = []
+    tracer.add_hook(on_start=lambda s: seen.append(("start", s.name)), on_end=lambda s: seen.append(("end", s.name)))
+    with tracing.span("outer", size=3) as outer:
+        with tracing.span("inner"):
+            tracing.set_attributes(hit=True)
+        with pytest.raises(KeyError):
+            with tracing.span("broken"):
+                raise KeyError("x")
+    inner, broken, done_outer = tracer.spans
+    assert done_outer is outer and inner.parent_id == outer.id and broken.parent_id == outer.id
+    assert inner.attributes == {"hit": True} and outer.attributes == {"size": 3}
+    assert broken.error.startswith("KeyError")
+    assert seen[:2] == [("start", "outer"), ("start", "inner")] and seen[-1] == ("end", "outer")
+    assert tracer.summary()["broken"]["errors"] == 1
+
+
+def test_removed_hooks_are_not_called(tracer):
+    seen = []
+    on_end = seen.append
+    tracer.add_hook(on_end=on_end)
+    with tracing.span("first"):
+        pass
+    tracer.remove_hook(on_end=on_end)
+    with tracing.span("second"):
+        pass
+    assert [s.name for s in seen] == ["first"]
+    with pytest.raises(ValueError):
+        tracer.remove_hook(on_end=on_end)
+
+
+def test_pipeline_stages_are_traced(tracer, tmp_path):
+    img = Image.new("RGBA", (40, 40), (255, 255, 255, 255))
+    img.paste((0, 0, 0, 255), (10, 10, 30, 30))
+    img.save(tmp_path / "d.png")
+    char = remove_background(tmp_path / "d.png", out_path=tmp_path / "c.png")
+    export_parts(char, parts_dir=tmp_path / "parts", atlas=True)
+    assert remove_background(tmp_path / "missing.png", out_path=tmp_path / "x.png") is None
+    gif = render_animation_from_plan(PLAN, char, parts_dir=tmp_path / "parts", out_gif=tmp_path / "o.gif")
+    with FrameDecoder(gif, loop=False) as decoder:
+        while decoder.get() is not None:
+            pass
+    summary = tracer.summary()
+    assert summary["preprocess.remove_background"]["count"] == 2
+    assert summary["preprocess.remove_background"]["errors"] == 1  # Caught inside, still recorded
+    assert summary["render.compose"]["count"] == 4
+    assert summary["render.encode"]["count"] >= 1
+    assert summary["player.decode"]["count"] >= 1
+    render = next(s for s in tracer.spans if s.name == "render")
+    compose = next(s for s in tracer.spans if s.name == "render.compose")
+    assert compose.parent_id == render.id and render.attributes["frames"] == 4
+
+
+def test_exports(tracer, tmp_path):
+    def work():
+        with tracing.span("threaded", n=1):
+            pass
+    with tracing.span("main"):
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+    tracer.export(tmp_path / "t.jsonl")
+    lines = [json.loads(line) for line in (tmp_path / "t.jsonl").read_text().splitlines()]
+    assert [line["name"] for line in lines] == ["threaded", "main"]
+    tracer.export(tmp_path / "t.json")
+    events = json.loads((tmp_path / "t.json").read_text())["traceEvents"]
+    assert {e["ph"] for e in events} == {"X"} and events[0]["args"] == {"n": 1}
+    assert events[0]["tid"] != events[1]["tid"]
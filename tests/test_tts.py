@@ -0,0 +1,113 @@
+import sys
+import os
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from spellbound_sketches import tts
+
+
+class StubDriver:
+    """Stands in for a pyttsx3 engine."""
+
+    def __init__(self, block=False):
+        self.spoken = []
+        self.saved = []
+        self.properties = {}
+        self.block = block
+        self.stopped = threading.Event()
+        self.speaking = threading.Event()  # Set once a line is being spoken
+        self._pending = None
+
+    def setProperty(self, name, value):
+        self.properties[name] = value
+
+    def say(self, text):
+        self._pending = ("say", text)
+
+    def save_to_file(self, text, path):
+        self._pending = ("save", text, path)
+
+    def runAndWait(self):
+        kind = self._pending[0]
+        if kind == "say":
+            self.speaking.set()
+            if self.block:
+                self.stopped.wait(5)
+            self.spoken.append(self._pending[1])
+        else:
+            with open(self._pending[2], "wb") as fh:
+                fh.write(b"RIFF fake wav")
+            self.saved.append(self._pending[1])
+
+    def stop(self):
+        self.stopped.set()
+
+
+class FakePlayback:
+    def __init__(self, played, path):
+        played.append(path)
+
+    def wait(self):
+        pass
+
+    def terminate(self):
+        pass
+
+
+def test_one_engine_speaks_every_line():
+    made = []
+    def factory():
+        made.append(StubDriver())
+        return made[-1]
+    service = tts.TTSService(driver_factory=factory, rate=150)
+    lines = [service.say(t) for t in ("Hi!", "Wheee!", "Bye!")]
+    assert all(u.wait(5) for u in lines)
+    service.close()
+    assert len(made) == 1
+    assert made[0].spoken == ["Hi!", "Wheee!", "Bye!"]
+    assert made[0].properties == {"rate": 150}
+
+
+def test_presynthesized_lines_are_cached(tmp_path):
+    driver = StubDriver()
+    played = []
+    service = tts.TTSService(driver_factory=lambda: driver, presynthesize=True, cache_dir=tmp_path,
+                             wav_player=lambda path: FakePlayback(played, path))
+    first = service.say("Hello friend")
+    first.wait(5)
+    second = service.say("Hello friend")
+    second.wait(5)
+    service.close()
+    assert driver.saved == ["Hello friend"]  # Synthesized only once
+    assert not first.cached and second.cached
+    assert played == [service.cache_path("Hello friend")] * 2
+    assert service.cache_path("Hello friend") != tts.TTSService(rate=200, cache_dir=tmp_path).cache_path("Hello friend")
+
+
+def test_cancel_stops_current_and_pending_lines():
+    driver = StubDriver(block=True)
+    service = tts.TTSService(driver_factory=lambda: driver)
+    talking = service.say("A very long story")
+    waiting = service.say("The end")
+    assert driver.speaking.wait(5)  # The first line is being spoken
+    service.cancel()
+    assert talking.wait(5) and waiting.wait(5)
+    assert talking.cancelled and waiting.cancelled
+    assert driver.spoken == ["A very long story"]  # The stub finishes once stopped
+    service.close()
+
+
+def test_failing_engine_is_reported_and_retried():
+    calls = []
+    def factory():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("no audio device")
+        return StubDriver()
+    service = tts.TTSService(driver_factory=factory)
+    failed = service.say("one")
+    failed.wait(5)
+    ok = service.say("two")
+    ok.wait(5)
+    service.close()
+    assert isinstance(failed.error, RuntimeError)
+    assert ok.error is None and len(calls) == 2